@@ -7,7 +7,7 @@ import bcrypt
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 
-from config.database import users_collection
+from repositories import users as users_repo
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
@@ -59,7 +59,7 @@ def get_token(request: Request, token: Optional[str] = Depends(oauth2_scheme)):
     return None
 
 
-def get_user_from_token(token: str):
+async def get_user_from_token(token: str):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -67,7 +67,7 @@ def get_user_from_token(token: str):
             return None
     except JWTError:
         return None
-    user = users_collection.find_one({"username": username})
+    user = await users_repo.find_by_username(username)
     if user:
         user["_id"] = str(user["_id"])
         # Check if user is admin
@@ -76,14 +76,14 @@ def get_user_from_token(token: str):
     return user
 
 
-def get_current_active_user(token: str = Depends(get_token)):
+async def get_current_active_user(token: str = Depends(get_token)):
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = get_user_from_token(token)
+    user = await get_user_from_token(token)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
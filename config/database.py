@@ -1,5 +1,8 @@
 import os
-from pymongo import MongoClient
+from typing import Optional
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,26 +10,79 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "realtime_chat")
 
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
-messages_collection = db["messages"]
-users_collection = db["users"]
-rooms_collection = db["rooms"]
-
-# Drop deprecated email index if it exists
-try:
-    users_collection.drop_index("email_1")
-except Exception:
-    pass
-
-# Create index for efficient queries
-messages_collection.create_index([("room_id", 1), ("timestamp", -1)])
-users_collection.create_index([("username", 1)], unique=True)
-rooms_collection.create_index([("room_id", 1)], unique=True)
-rooms_collection.create_index([("invite_code", 1)], unique=True)
-
-# Files collection for upload metadata
-files_collection = db["files"]
-files_collection.create_index([("file_id", 1)], unique=True)
-files_collection.create_index([("room_id", 1)])
+# Connection pool: every request and WebSocket shares these sockets, so size the pool
+# for peak concurrent queries rather than for the thread pool.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
 
+# AsyncMongoClient is bound to the event loop it first runs on: the server's loop, since
+# it is created on first use inside the app and closed by close_db() at shutdown.
+_client: Optional[AsyncMongoClient] = None
+
+
+def get_client() -> AsyncMongoClient:
+    global _client
+    if _client is None:
+        _client = AsyncMongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        )
+    return _client
+
+
+def get_db() -> AsyncDatabase:
+    return get_client()[DB_NAME]
+
+
+def messages_collection() -> AsyncCollection:
+    return get_db()["messages"]
+
+
+def users_collection() -> AsyncCollection:
+    return get_db()["users"]
+
+
+def rooms_collection() -> AsyncCollection:
+    return get_db()["rooms"]
+
+
+def files_collection() -> AsyncCollection:
+    """Files collection for upload metadata"""
+    return get_db()["files"]
+
+
+async def ensure_indexes():
+    """Create indexes for efficient queries (run once at startup)"""
+    # Drop deprecated email index if it exists
+    try:
+        await users_collection().drop_index("email_1")
+    except Exception:
+        pass
+    # History pages use (room_id, timestamp, _id). It is built before the (room_id, timestamp)
+    # index it supersedes is dropped, so history queries are never left without an index.
+    await messages_collection().create_index([("room_id", 1), ("timestamp", -1), ("_id", -1)])
+    try:
+        await messages_collection().drop_index("room_id_1_timestamp_-1")
+    except Exception:
+        pass
+
+    await users_collection().create_index([("username", 1)], unique=True)
+    await rooms_collection().create_index([("room_id", 1)], unique=True)
+    await rooms_collection().create_index([("invite_code", 1)], unique=True)
+    await files_collection().create_index([("file_id", 1)], unique=True)
+    await files_collection().create_index([("room_id", 1)])
+
+
+async def close_db():
+    """Close the client at shutdown; a later get_client() opens a new one"""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
@@ -63,39 +63,79 @@ const Chat = () => {
     const token = localStorage.getItem('token');
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
     const host = window.location.host;
-    const wsUrl = `${protocol}//${host}/api/ws/${currentRoom.room_id}?token=${token}`;
+    const wsUrl = `${protocol}//${host}/api/ws/${currentRoom.room_id}?token=${token}&features=batch`;
 
     if (socketRef.current) {
       socketRef.current.close();
     }
 
-    const socket = new WebSocket(wsUrl);
-    socketRef.current = socket;
+    // Highest message sequence seen; on reconnect the server only sends what came after it
+    let lastSeq = null;
+    let reconnectTimer = null;
+    let closed = false;
 
-    socket.onopen = () => {
-      console.log("Connected to room", currentRoom.name);
+    const trackSeq = (msgs) => {
+      msgs.forEach((m) => {
+        if (m.seq != null && (lastSeq == null || m.seq > lastSeq)) lastSeq = m.seq;
+      });
     };
 
-    socket.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      if (data.type === 'history') {
-        setMessages(data.messages);
-      } else if (data.type === 'chat') {
-        setMessages((prev) => [...prev, data]);
-      } else if (data.type === 'typing') {
-        setTyping((prev) => ({
-          ...prev,
-          [data.user]: data.status,
-        }));
-      }
+    // A message can arrive both live and in the resync sent on reconnect; keep the first copy
+    const unseen = (msgs) => msgs.filter((m) => m.seq == null || lastSeq == null || m.seq > lastSeq);
+
+    const connect = () => {
+      const socket = new WebSocket(lastSeq == null ? wsUrl : `${wsUrl}&last_seq=${lastSeq}`);
+      socketRef.current = socket;
+
+      socket.onopen = () => {
+        console.log("Connected to room", currentRoom.name);
+      };
+
+      const handleEvent = (data) => {
+        if (data.type === 'batch') {
+          data.events.forEach(handleEvent);
+        } else if (data.type === 'history' || data.type === 'history_page') {
+          trackSeq(data.messages);
+          setMessages(data.messages);
+        } else if (data.type === 'resync') {
+          if (data.gap) {
+            // Missed too much while away: reload the latest page instead
+            socket.send(JSON.stringify({ type: 'fetch_history' }));
+          } else {
+            const missed = unseen(data.messages);
+            trackSeq(missed);
+            setMessages((prev) => [...prev, ...missed]);
+          }
+        } else if (data.type === 'chat') {
+          if (unseen([data]).length) {
+            trackSeq([data]);
+            setMessages((prev) => [...prev, data]);
+          }
+        } else if (data.type === 'typing') {
+          // The server sends the full list of who is typing in the room
+          setTyping(Object.fromEntries((data.users || []).map((u) => [u, true])));
+        }
+      };
+
+      socket.onmessage = (event) => {
+        handleEvent(JSON.parse(event.data));
+      };
+
+      socket.onclose = (e) => {
+        console.log('WebSocket disconnected', e.code);
+        // 1008: not allowed in this room; anything else is worth another try
+        if (!closed && e.code !== 1008) {
+          reconnectTimer = setTimeout(connect, 1000);
+        }
+      };
     };
 
-    socket.onclose = (e) => {
-      console.log('WebSocket disconnected', e.code);
-    };
+    connect();
 
     return () => {
-      socket.close();
+      closed = true;
+      clearTimeout(reconnectTimer);
+      socketRef.current.close();
     };
   }, [currentRoom]);
 
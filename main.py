@@ -8,18 +8,22 @@ from anyio import to_thread
 
 from routes import auth, chat, rooms, admin, files
 from pathlib import Path
-from routes.chat import manager
+from routes.chat import manager, typing_tracker, presence, message_writer, pipeline, bot_pool
 from auth.core import get_password_hash
-from config.database import users_collection
+from utils.chatbot import ai_bot
+from config.database import ensure_indexes, close_db
+from repositories import users as users_repo
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # System Tuning: Increase thread pool for blocking tasks (Bcrypt/Mongo)
+    # System Tuning: Increase thread pool for blocking tasks (Bcrypt). MongoDB is async
+    # and bounded by its own connection pool (MONGO_MAX_POOL_SIZE).
     limiter = to_thread.current_default_thread_limiter()
     limiter.total_tokens = 100
     
     # Startup: Initialize Redis
     print("🚀 Starting up...")
+    await ensure_indexes()
     
     # Create uploads directory
     uploads_dir = Path(os.getenv("UPLOAD_DIR", "./uploads"))
@@ -27,31 +31,34 @@ async def lifespan(app: FastAPI):
     print(f"📁 Uploads directory: {uploads_dir.absolute()}")
     
     await manager.initialize_redis()
+    await presence.start()
+    await ai_bot.start(manager)
 
     # Create Super User if configured
     admin_user = os.getenv("ADMIN_USERNAME")
     admin_pass = os.getenv("ADMIN_PASSWORD")
     if admin_user and admin_pass:
-        await to_thread.run_sync(
-            lambda: users_collection.update_one(
-                {"username": admin_user},
-                {
-                    "$setOnInsert": {
-                        "username": admin_user,
-                        "hashed_password": get_password_hash(admin_pass),
-                        "is_active": False,
-                        "created_at": datetime.now()
-                    }
-                },
-                upsert=True
-            )
+        hashed_password = await to_thread.run_sync(get_password_hash, admin_pass)
+        await users_repo.ensure(
+            admin_user,
+            {
+                "hashed_password": hashed_password,
+                "created_at": datetime.now()
+            },
         )
         print(f"👤 Admin user '{admin_user}' ensured.")
 
     yield
     # Shutdown: Cleanup Redis
     print("🛑 Shutting down...")
+    await bot_pool.stop()
+    await ai_bot.close()
+    await pipeline.stop()
+    await typing_tracker.stop()
+    await presence.stop()
+    await message_writer.stop()
     await manager.shutdown()
+    await close_db()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -0,0 +1,17 @@
+from typing import Dict, List, Optional
+
+from config.database import files_collection
+
+
+async def insert(metadata: dict) -> None:
+    await files_collection().insert_one(metadata)
+
+
+async def find_by_file_id(file_id: str) -> Optional[dict]:
+    return await files_collection().find_one({"file_id": file_id})
+
+
+async def find_by_file_ids(file_ids: List[str]) -> Dict[str, dict]:
+    """Batch-fetch file metadata, keyed by file_id"""
+    records = await files_collection().find({"file_id": {"$in": file_ids}}).to_list(None)
+    return {record["file_id"]: record for record in records}
@@ -0,0 +1,58 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from config.database import messages_collection
+
+# Everything a client is sent; room_id and any other stored fields stay in Mongo
+HISTORY_FIELDS = {"_id": 1, "user": 1, "msg": 1, "timestamp": 1, "file_id": 1, "seq": 1}
+
+
+async def insert(message: dict) -> None:
+    await messages_collection().insert_one(message)
+
+
+async def insert_many(messages: List[dict]) -> None:
+    """Unordered bulk insert: one failed document doesn't stop the rest"""
+    await messages_collection().insert_many(messages, ordered=False)
+
+
+async def recent(room_id: str, limit: int = 50) -> List[dict]:
+    """Last `limit` messages of a room, oldest first"""
+    return await page_before(room_id, None, limit)
+
+
+async def page_before(room_id: str, before: Optional[Tuple[datetime, ObjectId]], limit: int) -> List[dict]:
+    """
+    The `limit` messages just older than the (timestamp, _id) position `before`
+    (or the latest ones), oldest first. Seeks on the (room_id, timestamp, _id) index
+    instead of skipping, so any page costs the same; _id breaks timestamp ties.
+    """
+    query = {"room_id": room_id}
+    if before:
+        timestamp, message_id = before
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": message_id}},
+        ]
+    cursor = messages_collection().find(query, HISTORY_FIELDS).sort([("timestamp", -1), ("_id", -1)]).limit(limit)
+    messages = await cursor.to_list(limit)
+    messages.reverse()
+    return messages
+
+
+async def max_seq(room_id: str) -> int:
+    """Highest sequence number among the room's latest messages (0 if none have one)"""
+    cursor = messages_collection().find({"room_id": room_id}, {"seq": 1}).sort([("timestamp", -1), ("_id", -1)]).limit(50)
+    return max((m.get("seq") or 0 for m in await cursor.to_list(50)), default=0)
+
+
+async def count_by_user(usernames: List[str]) -> Dict[str, int]:
+    """Message totals for many users in one aggregation"""
+    pipeline = [
+        {"$match": {"user": {"$in": usernames}}},
+        {"$group": {"_id": "$user", "count": {"$sum": 1}}},
+    ]
+    cursor = await messages_collection().aggregate(pipeline)
+    return {row["_id"]: row["count"] async for row in cursor}
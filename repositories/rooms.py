@@ -0,0 +1,27 @@
+from typing import List, Optional
+
+from config.database import rooms_collection
+
+
+async def find_by_room_id(room_id: str) -> Optional[dict]:
+    return await rooms_collection().find_one({"room_id": room_id})
+
+
+async def find_by_invite_code(invite_code: str) -> Optional[dict]:
+    return await rooms_collection().find_one({"invite_code": invite_code})
+
+
+async def list_for_member(user_id: str) -> List[dict]:
+    return await rooms_collection().find({"members": user_id}).to_list(None)
+
+
+async def create(room: dict) -> None:
+    await rooms_collection().insert_one(room)
+
+
+async def add_member(room_id: str, user_id: str) -> None:
+    await rooms_collection().update_one({"room_id": room_id}, {"$addToSet": {"members": user_id}})
+
+
+async def set_invite_code(room_id: str, invite_code: str) -> None:
+    await rooms_collection().update_one({"room_id": room_id}, {"$set": {"invite_code": invite_code}})
@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+
+from config.database import users_collection
+
+
+async def find_by_username(username: str) -> Optional[dict]:
+    return await users_collection().find_one({"username": username})
+
+
+async def create(user: dict) -> None:
+    """Insert a new user; raises DuplicateKeyError if the username is taken"""
+    await users_collection().insert_one(user)
+
+
+async def ensure(username: str, fields: dict) -> None:
+    """Create the user with these fields unless it already exists"""
+    await users_collection().update_one(
+        {"username": username},
+        {"$setOnInsert": {"username": username, **fields}},
+        upsert=True,
+    )
+
+
+async def delete_by_username(username: str) -> bool:
+    result = await users_collection().delete_one({"username": username})
+    return result.deleted_count == 1
+
+
+async def list_all() -> List[dict]:
+    return await users_collection().find({}, {"hashed_password": 0}).to_list(None)
+
+
+async def update_last_active(last_active: Dict[str, datetime]) -> None:
+    """Record last_active for many users in one unordered bulk write"""
+    # $max keeps an instance with an older timestamp from moving last_active backwards
+    ops = [UpdateOne({"username": user}, {"$max": {"last_active": ts}}) for user, ts in last_active.items()]
+    if ops:
+        await users_collection().bulk_write(ops, ordered=False)
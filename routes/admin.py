@@ -1,35 +1,54 @@
 from fastapi import APIRouter, Depends, HTTPException
-from config.database import users_collection, messages_collection
+from repositories import messages as messages_repo, users as users_repo
 from auth.core import get_current_active_user
+from routes.chat import bot_pool, manager, message_writer, pipeline, presence
+from utils.chatbot import ai_bot
 from typing import List
 from datetime import datetime
 import os
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
-@router.get("/users")
-async def get_all_users_stats(current_user: dict = Depends(get_current_active_user)):
+async def require_admin(current_user: dict = Depends(get_current_active_user)) -> dict:
     # Check if current_user is the super user
     admin_username = os.getenv("ADMIN_USERNAME")
     if not admin_username or current_user.get("username") != admin_username:
         raise HTTPException(status_code=403, detail="Not authorized")
-    
-    users_cursor = users_collection.find({})
+    return current_user
+
+
+@router.get("/users")
+async def get_all_users_stats(current_user: dict = Depends(require_admin)):
+    users = await users_repo.list_all()
+    online_users = await presence.online_users()
+    message_counts = await messages_repo.count_by_user([user.get("username") for user in users])
     users_stats = []
     
-    for user in users_cursor:
+    for user in users:
         username = user.get("username")
-        message_count = messages_collection.count_documents({"user": username})
+        message_count = message_counts.get(username, 0)
         
-        last_active = user.get("last_active")
+        last_active = presence.last_active(username) or user.get("last_active")
         if isinstance(last_active, datetime):
             last_active = last_active.isoformat()
             
         users_stats.append({
             "username": username,
-            "is_active": user.get("is_active", False),
+            "is_active": username in online_users,
             "last_active": last_active,
             "total_messages": message_count
         })
         
     return users_stats
+
+
+@router.get("/metrics")
+async def get_metrics(current_user: dict = Depends(require_admin)):
+    """Live counters for this instance: message pipeline stages, bot pool, Gemini client, batched writes, connections"""
+    return {
+        "pipeline": pipeline.snapshot(),
+        "bot": bot_pool.snapshot(),
+        "gemini": ai_bot.snapshot(),
+        "message_writer": {**message_writer.stats, "pending": message_writer.pending()},
+        "connections": manager.stats,
+    }
@@ -2,22 +2,24 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
 
 from models.user import User
 from auth.core import get_password_hash, verify_password, create_access_token, get_current_active_user
-from config.database import users_collection
+from repositories import users as users_repo
 
 router = APIRouter()
 
 
 @router.post("/signup")
-def signup(user: User):
-    hashed_password = get_password_hash(user.password)
+async def signup(user: User):
+    # bcrypt is CPU-bound, keep it off the event loop
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
     user_dict = user.model_dump()
     user_dict.pop("password")  # Remove plain password
     user_dict["hashed_password"] = hashed_password
     try:
-        users_collection.insert_one(user_dict)
+        await users_repo.create(user_dict)
     except DuplicateKeyError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -27,11 +29,11 @@ def signup(user: User):
 
 
 @router.post("/signin")
-def signin(form_data: OAuth2PasswordRequestForm = Depends()):
+async def signin(form_data: OAuth2PasswordRequestForm = Depends()):
     # Try to find user by username
-    user = users_collection.find_one({"username": form_data.username})
+    user = await users_repo.find_by_username(form_data.username)
 
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -60,7 +62,6 @@ async def me(current_user: dict = Depends(get_current_active_user)):
 
 @router.delete("/delete_account")
 async def delete_account(current_user: dict = Depends(get_current_active_user)):
-    result = users_collection.delete_one({"username": current_user["username"]})
-    if result.deleted_count == 1:
+    if await users_repo.delete_by_username(current_user["username"]):
         return {"message": "Account deleted successfully"}
     raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to delete account")
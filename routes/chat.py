@@ -1,69 +1,344 @@
+import asyncio
 import json
+import os
 from datetime import datetime, UTC
+from typing import List, Optional, Tuple
 
+from bson import ObjectId
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException, Depends
-from starlette.concurrency import run_in_threadpool
+from fastapi.responses import Response
 
 from auth.core import get_user_from_token, get_current_active_user
-from config.database import messages_collection, rooms_collection, users_collection, files_collection
+from repositories import files as files_repo, messages as messages_repo, rooms as rooms_repo, users as users_repo
 from utils.ConnectionManager import ConnectionManager
+from utils.bot_pool import BotWorkerPool
 from utils.chatbot import ai_bot
+from utils.dedupe import SendDeduplicator, valid_client_msg_id
+from utils.history_cache import (
+    HISTORY_SIZE, HistoryCache, decode_cursor, encode_cursor, format_timestamp, history_entry,
+)
+from utils.message_writer import BatchedMessageWriter
+from utils.pipeline import Pipeline, Stage
+from utils.presence import PresenceService
+from utils.sequence import RoomSequencer
+from utils.typing_indicator import TypingTracker
 
 router = APIRouter()
 manager = ConnectionManager()
+typing_tracker = TypingTracker(manager)
+presence = PresenceService(manager, users_repo)
+message_writer = BatchedMessageWriter(messages_repo.insert_many)
+sequencer = RoomSequencer(manager, messages_repo.max_seq)
+deduplicator = SendDeduplicator(manager)
 
+# The bot has no keystrokes to refresh its typing TTL, so it must outlast a slow Gemini call
+BOT_TYPING_TTL_SECONDS = 35
+# What the asker is told when the bot pool refuses or drops their request
+BOT_DROPPED_MESSAGES = {
+    "busy": "The bot is busy, try again in a moment",
+    "room": "The bot is already answering this room, try again in a moment",
+    "user": "Wait for the bot to answer your last question",
+    "expired": "The bot is busy, try again in a moment",
+}
 
-def save_message(room_id: str, user: str, msg: str, file_id: str = None):
-    """Save message to database"""
+# Longest the pipeline waits for a message's batch to be stored before reporting it failed
+PIPELINE_SAVE_TIMEOUT_SECONDS = float(os.getenv("PIPELINE_SAVE_TIMEOUT_SECONDS", "30"))
+
+# Optional protocol features a client can opt into with ?features=a,b on the WebSocket URL
+SUPPORTED_FEATURES = {"batch"}
+
+# Largest history page a client may ask for
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "200"))
+# A client reconnecting with ?last_seq= gets only the messages it missed, up to this many;
+# beyond that it is told to refetch history
+RESYNC_MAX_GAP = int(os.getenv("RESYNC_MAX_GAP", "25"))
+
+
+def file_info_for(record: dict) -> dict:
+    return {
+        "original_name": record["original_name"],
+        "content_type": record["content_type"],
+        "size": record["size"],
+        "url": f"/api/files/{record['file_id']}"
+    }
+
+
+async def load_history(room_id: str, limit: int, before: Optional[str] = None):
+    """Messages from Mongo (the latest, or those before a cursor) as (message_id, history entry), with file info attached"""
+    messages = await messages_repo.page_before(room_id, decode_cursor(before) if before else None, limit)
+    # Batch fetch all file info for efficiency and reliability
+    file_ids = [msg["file_id"] for msg in messages if msg.get("file_id")]
+    file_map = await files_repo.find_by_file_ids(file_ids) if file_ids else {}
+    return [
+        (str(msg["_id"]), history_entry(msg, file_info_for(file_map[msg["file_id"]]) if msg.get("file_id") in file_map else None))
+        for msg in messages
+    ]
+
+
+history_cache = HistoryCache(manager, load_history)
+
+
+async def save_message(
+        room_id: str, user: str, msg: str, file_id: str = None, file_info: dict = None, seq: Optional[int] = None,
+        message_id: Optional[ObjectId] = None, timestamp: Optional[datetime] = None,
+) -> asyncio.Future:
+    """
+    Queue message for the next batched write and add it to the room's cached history
+    (once stored, under ack_before_broadcast). The returned future resolves once it is stored.
+    """
     message_data = {
+        "_id": message_id or ObjectId(),
         "room_id": room_id, 
         "user": user, 
         "msg": msg, 
-        "timestamp": datetime.now(UTC)
+        "timestamp": timestamp or datetime.now(UTC)
     }
     if file_id:
         message_data["file_id"] = file_id
-    messages_collection.insert_one(message_data)
+    if seq is not None:
+        message_data["seq"] = seq
+    saved = await message_writer.submit(message_data)
+    message_id, entry = str(message_data["_id"]), history_entry(message_data, file_info)
+
+    def on_saved(future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            # The cached history may be showing a message Mongo doesn't have
+            history_cache.invalidate(room_id)
+        elif message_writer.durability == "ack_before_broadcast":
+            history_cache.append(room_id, message_id, entry)
+
+    if message_writer.durability != "ack_before_broadcast":
+        history_cache.append(room_id, message_id, entry)
+    saved.add_done_callback(on_saved)
+    return saved
+
+
+async def history_page(room_id: str, before: Optional[str], limit: int) -> Tuple[List[str], Optional[str]]:
+    """
+    One page of history: JSON-encoded entries (oldest first) and the cursor for the page
+    before it, or None once a page comes back short. Raises ValueError for a bad cursor.
+    """
+    if before is None and limit <= HISTORY_SIZE:
+        rows = (await history_cache.latest(room_id))[-limit:]
+    else:
+        rows = [
+            (message_id, entry["timestamp"], json.dumps(entry), entry.get("seq"))
+            for message_id, entry in await load_history(room_id, limit, before)
+        ]
+    next_cursor = encode_cursor(rows[0][1], rows[0][0]) if len(rows) == limit else None
+    return [text for _, _, text, _ in rows], next_cursor
+
+
+async def wait_saved(saved: asyncio.Future) -> bool:
+    try:
+        # Shielded: a sender going away must not cancel the write for everyone else
+        await asyncio.wait_for(asyncio.shield(saved), PIPELINE_SAVE_TIMEOUT_SECONDS)
+        return True
+    except asyncio.TimeoutError:
+        print(f"⚠️  Message not stored after {PIPELINE_SAVE_TIMEOUT_SECONDS}s, reporting it failed")
+        return False
+    except Exception:
+        return False
+
+
+class ChatMessage:
+    """A chat message on its way through the pipeline; bot replies have no websocket"""
+    __slots__ = ("room_id", "user", "msg", "websocket", "file_id", "client_msg_id",
+                 "message_id", "timestamp", "file_info", "seq", "saved", "duplicate_of")
+
+    def __init__(self, room_id: str, user: str, msg: str, websocket: Optional[WebSocket] = None,
+                 file_id: str = None, client_msg_id=None):
+        self.room_id = room_id
+        self.user = user
+        self.msg = msg
+        self.websocket = websocket
+        self.file_id = file_id
+        self.client_msg_id = client_msg_id
+        self.message_id = ObjectId()
+        self.timestamp = datetime.now(UTC)
+        self.file_info: Optional[dict] = None
+        self.seq: Optional[int] = None
+        self.saved: Optional[asyncio.Future] = None
+        # Message id of the first copy, when this is a resend
+        self.duplicate_of: Optional[str] = None
+
+    def frame(self) -> dict:
+        # id and timestamp let other instances add the message to their cached history
+        data = {
+            "type": "chat", "user": self.user, "msg": self.msg,
+            "id": str(self.message_id), "timestamp": format_timestamp(self.timestamp),
+        }
+        if self.file_info:
+            data["file_id"] = self.file_id
+            data["file_info"] = self.file_info
+        if self.seq is not None:
+            data["seq"] = self.seq
+        return data
+
+
+async def notify(message: ChatMessage, obj: dict):
+    """Send to the message's sender, if it came from a socket that is still open"""
+    if message.websocket is None:
+        return
+    # Through the socket's writer, so it stays in order with the room's broadcasts
+    await manager.send_personal_message(json.dumps(obj), message.websocket)
+
+
+async def message_failed(message: ChatMessage):
+    if message.client_msg_id is not None and message.duplicate_of is None:
+        # Let the client's retry through (a resend's claim belongs to its first copy)
+        await deduplicator.release(message.user, message.client_msg_id)
+    await notify(message, {"type": "error", "msg": "Message could not be saved"})
+
+
+async def stage_failed(message: ChatMessage, error: Exception):
+    await message_failed(message)
+
+
+async def enrich(message: ChatMessage) -> Optional[ChatMessage]:
+    """Validate and enrich: drop resends, attach file info and the room sequence number"""
+    if message.client_msg_id is not None:
+        if not valid_client_msg_id(message.client_msg_id):
+            await notify(message, {"type": "error", "msg": "Invalid client_msg_id"})
+            return None
+        stored_id = await deduplicator.claim(message.user, message.client_msg_id, str(message.message_id))
+        if stored_id is not None:
+            # A resend of a message we already have: don't store or broadcast it again, and ack
+            # it in side_effects once the first copy is stored (it may still be in flight)
+            message.duplicate_of = stored_id
+            message.saved = deduplicator.pending(message.user, message.client_msg_id)
+            return message
+    typing_tracker.set_typing(message.room_id, message.user, False)
+
+    if message.file_id:
+        file_record = await files_repo.find_by_file_id(message.file_id)
+        if file_record:
+            message.file_info = file_info_for(file_record)
+    message.seq = await sequencer.next(message.room_id)
+    return message
+
+
+async def persist(message: ChatMessage) -> ChatMessage:
+    """Queue for the batched write; only waits when the writer is applying backpressure"""
+    if message.duplicate_of is not None:
+        return message
+    message.saved = await save_message(
+        message.room_id, message.user, message.msg, message.file_id, message.file_info, message.seq,
+        message.message_id, message.timestamp,
+    )
+    if message.client_msg_id is not None:
+        deduplicator.track(message.user, message.client_msg_id, message.saved)
+    return message
+
+
+async def fan_out(message: ChatMessage) -> Optional[ChatMessage]:
+    if message.duplicate_of is not None:
+        return message
+    if message_writer.durability == "ack_before_broadcast" and not await wait_saved(message.saved):
+        await message_failed(message)
+        return None
+    await manager.broadcast_json(message.frame(), message.room_id)
+    return message
+
+
+async def side_effects(message: ChatMessage) -> Optional[ChatMessage]:
+    """Confirm the write to the sender, then hand bot triggers to the bot pool"""
+    if message.websocket is None:
+        return None
+    if message.duplicate_of is not None:
+        return await ack_duplicate(message)
+    if message_writer.durability == "ack_after_batch" and not await wait_saved(message.saved):
+        await message_failed(message)
+        return None
+    if message.client_msg_id is not None:
+        await notify(message, {"type": "ack", "client_msg_id": message.client_msg_id, "id": str(message.message_id)})
+    if ai_bot.should_respond(message.msg):
+        print(f"Bot triggered by message: '{message.msg}'")
+        await bot_pool.submit(message.room_id, message.user, message)
+    return None
+
+
+async def ack_duplicate(message: ChatMessage) -> None:
+    # The first copy may still be in flight; ack only once it is stored. If it fails, its own
+    # failure releases the claim, so the client's next retry is stored
+    if message.saved is not None and message_writer.durability != "fire_and_forget":
+        if not await wait_saved(message.saved):
+            await message_failed(message)
+            return None
+    await notify(message, {"type": "ack", "client_msg_id": message.client_msg_id, "id": message.duplicate_of})
+    return None
+
+
+async def bot_reply(message: ChatMessage) -> None:
+    """Runs on a bot pool worker: typing indicator, Gemini call, then the reply"""
+    typing_tracker.set_typing(message.room_id, "AI_Bot", True, ttl=BOT_TYPING_TTL_SECONDS)
+    try:
+        bot_response = await ai_bot.get_response(message.msg, message.user, message.room_id)
+        print(f"Bot response received: {bot_response}")
+    finally:
+        # Also when the call fails or is cancelled because the room emptied
+        typing_tracker.set_typing(message.room_id, "AI_Bot", False)
+
+    if bot_response:
+        print(f"Broadcasting bot response to room {message.room_id}")
+        # The reply is stored and broadcast like any other message
+        await pipeline.submit(message.room_id, ChatMessage(message.room_id, "AI_Bot", bot_response))
+    else:
+        print("Bot response was None or empty, not broadcasting")
+
+
+async def bot_dropped(message: ChatMessage, reason: str):
+    await notify(message, {"type": "error", "msg": BOT_DROPPED_MESSAGES[reason]})
+
+
+bot_pool = BotWorkerPool(bot_reply, on_dropped=bot_dropped)
+
+# ingest -> validate/enrich -> persist -> fan-out -> side effects, then the bot pool. Messages
+# of one room stay in order through every stage; a slow room only holds up its own messages.
+pipeline = Pipeline(
+    Stage("enrich", enrich, on_error=stage_failed),
+    Stage("persist", persist, on_error=stage_failed),
+    Stage("fan_out", fan_out, on_error=stage_failed),
+    Stage("side_effects", side_effects, on_error=stage_failed),
+)
 
 
 @router.get("/history/{room_id}")
-def get_chat_history(room_id: str, current_user: dict = Depends(get_current_active_user)):
-    """Retrieve last 50 messages from a room"""
+async def get_chat_history(
+        room_id: str,
+        before: Optional[str] = None,
+        limit: int = Query(HISTORY_SIZE, ge=1, le=HISTORY_PAGE_MAX),
+        current_user: dict = Depends(get_current_active_user),
+):
+    """Retrieve a page of messages from a room, newest page first; pass `next` back as `before` to scroll back"""
     # Check membership
-    room = rooms_collection.find_one({"room_id": room_id})
+    room = await rooms_repo.find_by_room_id(room_id)
     if room and current_user["_id"] not in room.get("members", []):
          raise HTTPException(status_code=403, detail="Not a member of this room")
 
-    messages = list(
-        messages_collection.find({"room_id": room_id})
-        .sort("timestamp", -1)
-        .limit(50)
+    try:
+        entries, next_cursor = await history_page(room_id, before, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+    # Entries are pre-serialized; splice them instead of re-encoding
+    return Response(
+        content='{"messages": [' + ", ".join(entries) + '], "next": ' + json.dumps(next_cursor) + "}",
+        media_type="application/json",
     )
-    return [
-        {
-            "user": msg["user"],
-            "msg": msg["msg"],
-            "timestamp": msg["timestamp"].isoformat(),
-            "file_id": msg.get("file_id"),
-        }
-        for msg in reversed(messages)
-    ]
 
 
 @router.websocket("/ws/{room_id}")
 async def websocket_endpoint(
-        websocket: WebSocket, room_id: str, token: str = Query(...)
+        websocket: WebSocket, room_id: str, token: str = Query(...), features: str = Query(""),
+        last_seq: Optional[int] = Query(None),
 ):
-    user = await run_in_threadpool(get_user_from_token, token)
+    user = await get_user_from_token(token)
     if not user:
         await websocket.close(code=1008)
         return
 
     # Check membership
-    def check_membership():
-        return rooms_collection.find_one({"room_id": room_id})
-    
-    room = await run_in_threadpool(check_membership)
+    room = await rooms_repo.find_by_room_id(room_id)
     
     if room:
          if str(user["_id"]) not in room.get("members", []):
@@ -77,157 +352,103 @@ async def websocket_endpoint(
 
     username = user["username"]
     
-    # Mark user as active
-    await run_in_threadpool(
-        lambda: users_collection.update_one(
-            {"username": username}, 
-            {"$set": {"is_active": True}}
-        )
-    )
+    # Mark user as active (ref-counted across tabs, rooms and instances)
+    await presence.connect(username)
+    joined = False
+    # Whatever ends the socket, from here on the user is marked inactive and leaves the room
+    try:
+        accepted_features = sorted(SUPPORTED_FEATURES.intersection(features.split(",")))
+        await manager.connect(websocket, room_id, batching="batch" in accepted_features)
 
-    await manager.connect(websocket, room_id)
-    
-    # Manually fetch history to send on connect
-    def fetch_history():
-        msgs = list(
-            messages_collection.find({"room_id": room_id})
-            .sort("timestamp", -1)
-            .limit(50)
+        # History (with file info) comes from the room's shared buffer; concurrent joins share one query.
+        # A reconnecting client only needs what it missed since last_seq.
+        missed = await history_cache.since(room_id, last_seq, RESYNC_MAX_GAP) if last_seq is not None else None
+        if missed is not None:
+            await manager.send_personal_message(
+                '{"type": "resync", "messages": [' + ", ".join(missed) + '], "features": ' + json.dumps(accepted_features) + "}",
+                websocket,
+            )
+        elif last_seq is not None:
+            await manager.send_personal_message(
+                json.dumps({"type": "resync", "gap": True, "features": accepted_features}), websocket
+            )
+        else:
+            history = await history_cache.get(room_id)
+            await manager.send_personal_message(
+                '{"type": "history", "messages": [' + ", ".join(history) + '], "features": ' + json.dumps(accepted_features) + "}",
+                websocket,
+            )
+        await manager.broadcast_json(
+            {"type": "chat", "user": "system", "msg": f"{username} joined"}, room_id
         )
-        return [
-            {
-                "user": msg["user"],
-                "msg": msg["msg"],
-                "timestamp": msg["timestamp"].isoformat(),
-                "file_id": msg.get("file_id"),  # Include file_id!
-            }
-            for msg in reversed(msgs)
-        ]
+        joined = True
 
-    history = await run_in_threadpool(fetch_history)
-    
-    # Batch fetch all file info for efficiency and reliability
-    file_ids = [msg["file_id"] for msg in history if msg.get("file_id")]
-    
-    if file_ids:
-        def fetch_file_records():
-            return list(files_collection.find({"file_id": {"$in": file_ids}}))
-        
-        file_records = await run_in_threadpool(fetch_file_records)
-        file_map = {f["file_id"]: f for f in file_records}
-        
-        # Enrich messages with file info
-        for msg in history:
-            fid = msg.get("file_id")
-            if fid and fid in file_map:
-                f = file_map[fid]
-                msg["file_info"] = {
-                    "original_name": f["original_name"],
-                    "content_type": f["content_type"],
-                    "size": f["size"],
-                    "url": f"/api/files/{f['file_id']}"
-                }
-    
-    await websocket.send_json({"type": "history", "messages": history})
-    await manager.broadcast_json(
-        {"type": "chat", "user": "system", "msg": f"{username} joined"}, room_id
-    )
-    try:
         while True:
             text = await websocket.receive_text()
             try:
                 data = json.loads(text)
-                if data.get("type") == "chat":
-                    message_text = data.get("msg", "")
-                    file_id = data.get("file_id")
-                    
-                    await run_in_threadpool(save_message, room_id, username, message_text, file_id)
-                    
-                    broadcast_data = {
-                        "type": "chat", 
-                        "user": username, 
-                        "msg": message_text
-                    }
-                    
-                    # Include file info if present
-                    if file_id:
-                        file_info = await run_in_threadpool(
-                            lambda: files_collection.find_one({"file_id": file_id})
-                        )
-                        if file_info:
-                            broadcast_data["file_id"] = file_id
-                            broadcast_data["file_info"] = {
-                                "original_name": file_info["original_name"],
-                                "content_type": file_info["content_type"],
-                                "size": file_info["size"],
-                                "url": f"/api/files/{file_info['file_id']}"
-                            }
-                    
-                    await manager.broadcast_json(broadcast_data, room_id)
-
-                    # Check if AI bot should respond
-                    if ai_bot.should_respond(message_text):
-                        print(f"Bot triggered by message: '{message_text}'")
-                        # Send typing indicator for bot
-                        await manager.broadcast_json(
-                            {"type": "typing", "user": "AI_Bot", "status": True},
-                            room_id,
-                        )
-
-                        # Get AI response
-                        bot_response = await ai_bot.get_response(message_text, username)
-                        print(f"Bot response received: {bot_response}")
-
-                        # Stop typing indicator
-                        await manager.broadcast_json(
-                            {"type": "typing", "user": "AI_Bot", "status": False},
-                            room_id,
-                        )
-
-                        if bot_response:
-                            print(f"Broadcasting bot response to room {room_id}")
-                            # Save and broadcast bot response
-                            await run_in_threadpool(save_message, room_id, "AI_Bot", bot_response)
-                            await manager.broadcast_json(
-                                {"type": "chat", "user": "AI_Bot", "msg": bot_response},
-                                room_id,
-                            )
-                        else:
-                            print("Bot response was None or empty, not broadcasting")
-
-                elif data.get("type") == "typing":
-                    await manager.broadcast_json(
-                        {
-                            "type": "typing",
-                            "user": username,
-                            "status": data.get("status"),
-                        },
-                        room_id,
-                    )
             except json.JSONDecodeError:
-                pass
+                continue
+            if not isinstance(data, dict):
+                continue
+
+            if data.get("type") == "chat":
+                # Everything else happens in the pipeline; this loop is free for the next frame
+                message = ChatMessage(
+                    room_id, username, data.get("msg", ""), websocket,
+                    file_id=data.get("file_id"), client_msg_id=data.get("client_msg_id"),
+                )
+                if not await pipeline.submit(room_id, message):
+                    # Shutting down
+                    await message_failed(message)
+
+            elif data.get("type") == "fetch_history":
+                try:
+                    limit = min(max(int(data.get("limit") or HISTORY_SIZE), 1), HISTORY_PAGE_MAX)
+                    entries, next_cursor = await history_page(room_id, data.get("before"), limit)
+                except (TypeError, ValueError):
+                    await manager.send_personal_message(
+                        json.dumps({"type": "error", "msg": "Invalid history request"}), websocket
+                    )
+                    continue
+                await manager.send_personal_message(
+                    '{"type": "history_page", "messages": [' + ", ".join(entries) + '], "next": '
+                    + json.dumps(next_cursor) + "}",
+                    websocket,
+                )
+
+            elif data.get("type") == "typing":
+                # Coalesced by the tracker; only start/stop transitions leave this instance
+                typing_tracker.set_typing(room_id, username, bool(data.get("status")))
     except WebSocketDisconnect:
-        # Mark user as inactive
-        await run_in_threadpool(
-            lambda: users_collection.update_one(
-                {"username": username}, 
-                {"$set": {"is_active": False, "last_active": datetime.now(UTC)}}
-            )
-        )
-        await manager.disconnect(websocket, room_id)
+        pass
+    finally:
+        typing_tracker.set_typing(room_id, username, False)
+        # Shielded: runs to the end even when the handler itself is being cancelled
+        await asyncio.shield(leave_room(websocket, room_id, username, joined))
+
+
+async def leave_room(websocket: WebSocket, room_id: str, username: str, announce: bool):
+    await manager.disconnect(websocket, room_id)
+    if not await manager.count(room_id):
+        # Nobody left here to read the bot's answers
+        cancelled = bot_pool.cancel_room(room_id)
+        if cancelled:
+            print(f"Cancelled {cancelled} bot request(s) for empty room {room_id}")
+    # Mark user as inactive once their last socket is gone
+    await presence.disconnect(username)
+    if announce:
         await manager.broadcast_json(
             {"type": "chat", "user": "system", "msg": f"{username} left"}, room_id
         )
 
 
 @router.get("/rooms")
-def get_rooms(current_user: dict = Depends(get_current_active_user)):
+async def get_rooms(current_user: dict = Depends(get_current_active_user)):
     try:
         user_id = current_user["_id"]
-        cursor = rooms_collection.find({"members": user_id})
-        
         rooms_data = []
-        for doc in cursor:
+        for doc in await rooms_repo.list_for_member(user_id):
             room_info = {
                 "room_id": doc["room_id"],
                 "name": doc["name"],
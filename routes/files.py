@@ -4,10 +4,9 @@ import aiofiles
 from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from fastapi.responses import FileResponse as FastAPIFileResponse
-from starlette.concurrency import run_in_threadpool
 
 from auth.core import get_current_active_user
-from config.database import files_collection, rooms_collection
+from repositories import files as files_repo, rooms as rooms_repo
 from models.file import FileMetadata, FileResponse
 from datetime import datetime, UTC
 
@@ -69,10 +68,7 @@ async def upload_file(
     """Upload a file to a chat room"""
     
     # Validate user is member of room
-    def check_membership():
-        return rooms_collection.find_one({"room_id": room_id})
-    
-    room = await run_in_threadpool(check_membership)
+    room = await rooms_repo.find_by_room_id(room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
@@ -115,9 +111,7 @@ async def upload_file(
     )
     
     # Save metadata to database
-    await run_in_threadpool(
-        lambda: files_collection.insert_one(file_metadata.model_dump())
-    )
+    await files_repo.insert(file_metadata.model_dump())
     
     return FileResponse(
         file_id=file_metadata.file_id,
@@ -136,18 +130,12 @@ async def download_file(
     """Download or view a file"""
     
     # Get file metadata
-    def get_file():
-        return files_collection.find_one({"file_id": file_id})
-    
-    file_meta = await run_in_threadpool(get_file)
+    file_meta = await files_repo.find_by_file_id(file_id)
     if not file_meta:
         raise HTTPException(status_code=404, detail="File not found")
     
     # Check user has access to the room
-    def check_room():
-        return rooms_collection.find_one({"room_id": file_meta["room_id"]})
-    
-    room = await run_in_threadpool(check_room)
+    room = await rooms_repo.find_by_room_id(file_meta["room_id"])
     if room and current_user["_id"] not in room.get("members", []):
         raise HTTPException(status_code=403, detail="Not authorized to access this file")
     
@@ -175,18 +163,12 @@ async def get_file_info(
 ):
     """Get file metadata"""
     
-    def get_file():
-        return files_collection.find_one({"file_id": file_id})
-    
-    file_meta = await run_in_threadpool(get_file)
+    file_meta = await files_repo.find_by_file_id(file_id)
     if not file_meta:
         raise HTTPException(status_code=404, detail="File not found")
     
     # Check user has access to the room
-    def check_room():
-        return rooms_collection.find_one({"room_id": file_meta["room_id"]})
-    
-    room = await run_in_threadpool(check_room)
+    room = await rooms_repo.find_by_room_id(file_meta["room_id"])
     if room and current_user["_id"] not in room.get("members", []):
         raise HTTPException(status_code=403, detail="Not authorized")
     
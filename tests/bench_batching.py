@@ -0,0 +1,82 @@
+"""
+Micro-batching benchmark: a steady message rate into one busy room.
+
+Reports WebSocket frames/sec handed to sockets, Redis publishes, and CPU time per
+delivered message for each WS_BATCH_MODE. Redis is the in-process stand-in, so its
+CPU is included in the per-message figure for every mode. The sockets are in-memory,
+so the per-frame cost a real server pays (ASGI dispatch, framing, syscalls) is not
+counted; frames/sec is the figure that carries over.
+
+    python -m tests.bench_batching [--members 500] [--rate 1000] [--seconds 3]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from tests.fake_redis import FakeRedisServer
+from utils.ConnectionManager import ConnectionManager
+
+
+class BenchWebSocket:
+    frames = 0
+    events = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        BenchWebSocket.frames += 1
+        BenchWebSocket.events += message.count('"type": "chat"')
+
+    async def close(self):
+        pass
+
+
+async def run(mode: str, members: int, rate: int, seconds: float, server: FakeRedisServer):
+    BenchWebSocket.frames = BenchWebSocket.events = 0
+    publishes_before = server.commands["PUBLISH"]
+    manager = ConnectionManager(batch_mode=mode)
+    await manager.initialize_redis()
+    for _ in range(members):
+        await manager.connect(BenchWebSocket(), "bench", batching=True)
+    await asyncio.sleep(0.1)
+
+    tick = 0.01
+    per_tick = max(1, int(rate * tick))
+    total = int(rate * seconds)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    sent = 0
+    while sent < total:
+        for _ in range(per_tick):
+            await manager.broadcast_json({"type": "chat", "user": "bench", "msg": f"message {sent}"}, "bench")
+            sent += 1
+        await asyncio.sleep(tick)
+    while BenchWebSocket.events < total * members:
+        await asyncio.sleep(0.01)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    await manager.shutdown()
+    print(
+        f"{mode:>6}: {BenchWebSocket.frames / wall:>10,.0f} frames/s   "
+        f"{server.commands['PUBLISH'] - publishes_before:>6} publishes   "
+        f"{cpu / BenchWebSocket.events * 1_000_000:6.2f}us CPU per delivered message"
+    )
+
+
+async def main(members: int, rate: int, seconds: float):
+    server = await FakeRedisServer().start()
+    os.environ["REDIS_URL"] = server.url
+    print(f"{rate} msgs/s for {seconds:.0f}s into a {members}-member room")
+    for mode in ("off", "auto", "always"):
+        await run(mode, members, rate, seconds, server)
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--rate", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.members, args.rate, args.seconds))
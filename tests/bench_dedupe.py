@@ -0,0 +1,80 @@
+"""
+Dedupe overhead on the chat hot path: the cost of SendDeduplicator.claim per message.
+
+"memory" runs without Redis (single instance); "redis" also claims every id in Redis,
+which adds one round trip. For scale, the same table shows work every chat message
+already does: encoding its broadcast frame, and assigning its sequence number (also one
+Redis round trip). Redis is the in-process stand-in, so round trips are loopback.
+
+    python -m tests.bench_dedupe [--messages 100000] [--users 1000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bson import ObjectId
+
+from tests.fake_redis import FakeRedisServer
+from utils.ConnectionManager import ConnectionManager
+from utils.dedupe import SendDeduplicator
+from utils.sequence import RoomSequencer
+
+
+def report(label: str, count: int, elapsed: float):
+    print(f"{label:>34}: {elapsed / count * 1e6:8.2f} µs/message")
+
+
+async def claims(dedupe: SendDeduplicator, messages: int, users: int, prefix: str):
+    started = time.perf_counter()
+    for i in range(messages):
+        await dedupe.claim(f"user{i % users}", f"{prefix}-{i}", str(ObjectId()))
+    return time.perf_counter() - started
+
+
+async def main(messages: int, users: int):
+    frame = {"type": "chat", "user": "user1", "msg": "hello there, how is everyone doing today?", "seq": 123456}
+    started = time.perf_counter()
+    for i in range(messages):
+        json.dumps(frame)
+        str(ObjectId())
+    report("encode frame + new ObjectId", messages, time.perf_counter() - started)
+
+    memory = SendDeduplicator(ConnectionManager())
+    report("memory: new client_msg_id", messages, await claims(memory, messages, users, "new"))
+    # Every message sent again: answered from the in-memory window
+    report("memory: resend", messages, await claims(memory, messages, users, "new"))
+
+    server = await FakeRedisServer().start()
+    os.environ["REDIS_URL"] = server.url
+    manager = ConnectionManager()
+    await manager.initialize_redis()
+    redis_messages = max(messages // 10, 1)
+
+    async def stored_max(room_id: str) -> int:
+        return 0
+
+    sequencer = RoomSequencer(manager, stored_max)
+    started = time.perf_counter()
+    for i in range(redis_messages):
+        await sequencer.next(f"bench-{i % 20}")
+    report("redis: seq number (every message)", redis_messages, time.perf_counter() - started)
+
+    mirrored = SendDeduplicator(manager)
+    report("redis: new client_msg_id", redis_messages, await claims(mirrored, redis_messages, users, "new"))
+    report("redis: resend, same instance", redis_messages, await claims(mirrored, redis_messages, users, "new"))
+    other = SendDeduplicator(manager)
+    report("redis: resend, other instance", redis_messages, await claims(other, redis_messages, users, "new"))
+    assert other.stats["redis_duplicates"] == redis_messages
+
+    await manager.shutdown()
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.users))
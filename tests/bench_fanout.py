@@ -0,0 +1,112 @@
+"""
+Fan-out latency benchmark: one room, many members, a few stalled clients.
+
+Compares the old gather-over-send_text broadcast with per-connection writers.
+Latency is measured from the broadcast call until the last *fast* member has the frame.
+
+    python -m tests.bench_fanout [--members 5000] [--slow-ratio 0.01] [--messages 200]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from utils.ConnectionManager import ConnectionManager
+
+
+class BenchWebSocket:
+    def __init__(self, delay: float, tracker: "DeliveryTracker"):
+        self.delay = delay
+        self.tracker = tracker
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            self.tracker.delivered(message)
+
+    async def close(self):
+        pass
+
+
+class DeliveryTracker:
+    def __init__(self, fast_members: int):
+        self.fast_members = fast_members
+        self.counts = {}
+        self.done = {}
+
+    def expect(self, message: str) -> asyncio.Event:
+        self.counts[message] = 0
+        self.done[message] = asyncio.Event()
+        return self.done[message]
+
+    def delivered(self, message: str):
+        self.counts[message] += 1
+        if self.counts[message] == self.fast_members:
+            self.done[message].set()
+
+
+async def legacy_broadcast(conns, message: str):
+    """The pre-writer _broadcast_local: one gather over direct sends"""
+    async def safe_send(ws):
+        try:
+            await ws.send_text(message)
+        except Exception:
+            pass
+    await asyncio.gather(*(safe_send(c) for c in conns), return_exceptions=True)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(mode: str, members: int, slow_ratio: float, messages: int, slow_delay: float, interval: float):
+    slow_count = int(members * slow_ratio)
+    tracker = DeliveryTracker(members - slow_count)
+    sockets = [BenchWebSocket(slow_delay if i < slow_count else 0, tracker) for i in range(members)]
+
+    manager = ConnectionManager()
+    for ws in sockets:
+        await manager.connect(ws, "bench")
+
+    latencies = []
+    for i in range(messages):
+        message = f'{{"type": "chat", "user": "bench", "msg": "{i}"}}'
+        done = tracker.expect(message)
+        start = time.perf_counter()
+        if mode == "legacy":
+            await legacy_broadcast(sockets, message)
+        else:
+            await manager.broadcast(message, "bench")
+        await done.wait()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+    await manager.shutdown()
+    print(
+        f"{mode:>7}: p50={statistics.median(latencies):8.2f}ms  "
+        f"p99={percentile(latencies, 99):8.2f}ms  max={max(latencies):8.2f}ms  "
+        f"evicted={manager.stats['evicted_connections']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=5000)
+    parser.add_argument("--slow-ratio", type=float, default=0.01)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--slow-delay", type=float, default=0.25, help="seconds a slow client takes per frame")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between broadcasts")
+    args = parser.parse_args()
+
+    print(f"room of {args.members} members, {int(args.members * args.slow_ratio)} slow ({args.slow_delay * 1000:.0f}ms/frame)")
+    for mode in ("legacy", "writer"):
+        asyncio.run(run(mode, args.members, args.slow_ratio, args.messages, args.slow_delay, args.interval))
+
+
+if __name__ == "__main__":
+    main()
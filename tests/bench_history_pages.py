@@ -0,0 +1,116 @@
+"""
+History pagination cost by depth: a page of messages `depth` messages back from the
+newest, fetched with skip/limit (what an offset API does) and with a (timestamp, _id)
+cursor via messages_repo.page_before. Skip walks every index key it skips, so its
+latency grows with depth; the cursor seeks straight to its position and stays flat.
+
+Needs a real MongoDB (the room is seeded once and reused on later runs). --fake runs it
+against the in-process stand-in, which scans every document for any query, so both
+columns grow there; use it only to check the benchmark itself.
+
+    python -m tests.bench_history_pages [--messages 10000000] [--page 50] [--mongo-uri mongodb://localhost:27017] [--fake]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+ROOM = "bench-room"
+DB = "bench_history_pages"
+
+
+async def seed(collection, messages: int):
+    if await collection.count_documents({"room_id": ROOM}) == messages:
+        return
+    await collection.drop()
+    await collection.create_index([("room_id", 1), ("timestamp", -1), ("_id", -1)])
+    start = datetime(2024, 1, 1)
+    started = time.perf_counter()
+    for offset in range(0, messages, 10_000):
+        # Two messages per millisecond, so pages have to break timestamp ties on _id
+        await collection.insert_many([
+            {"_id": ObjectId(), "room_id": ROOM, "user": f"user{i % 100}", "msg": f"message {i}",
+             "timestamp": start + timedelta(milliseconds=i // 2)}
+            for i in range(offset, min(offset + 10_000, messages))
+        ], ordered=False)
+    print(f"seeded {messages:,} messages in {time.perf_counter() - started:.0f}s")
+
+
+async def timed(fn, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+async def keys_examined(collection, query: dict, skip: int, page: int):
+    try:
+        plan = await collection.find(query).sort([("timestamp", -1), ("_id", -1)]).skip(skip).limit(page).explain()
+        return plan["executionStats"]["totalKeysExamined"]
+    except Exception:
+        return None
+
+
+async def main(messages: int, page: int, repeats: int):
+    from config.database import messages_collection
+    from repositories import messages as messages_repo
+
+    collection = messages_collection()
+    await seed(collection, messages)
+    newest_first = [("timestamp", -1), ("_id", -1)]
+    depths = sorted({d for d in (0, 1_000, 10_000, 100_000, 1_000_000, messages // 2, messages - page) if 0 <= d <= messages - page})
+
+    print(f"{'depth':>12} {'skip ms':>10} {'cursor ms':>10} {'skip keys':>12} {'cursor keys':>12}")
+    for depth in depths:
+        async def by_skip():
+            return await collection.find({"room_id": ROOM}, messages_repo.HISTORY_FIELDS).sort(newest_first).skip(depth).limit(page).to_list(page)
+
+        # The cursor a client would hold after paging down to this depth
+        position = None
+        if depth:
+            [last] = await collection.find({"room_id": ROOM}).sort(newest_first).skip(depth - 1).limit(1).to_list(1)
+            position = (last["timestamp"], last["_id"])
+
+        async def by_cursor():
+            return await messages_repo.page_before(ROOM, position, page)
+
+        assert [m["_id"] for m in await by_cursor()] == [m["_id"] for m in reversed(await by_skip())]
+        cursor_query = {"room_id": ROOM}
+        if position:
+            cursor_query["$or"] = [{"timestamp": {"$lt": position[0]}}, {"timestamp": position[0], "_id": {"$lt": position[1]}}]
+        skip_keys = await keys_examined(collection, {"room_id": ROOM}, depth, page)
+        cursor_keys = await keys_examined(collection, cursor_query, 0, page)
+        print(
+            f"{depth:>12,} {await timed(by_skip, repeats):>10.2f} {await timed(by_cursor, repeats):>10.2f} "
+            f"{skip_keys if skip_keys is not None else '-':>12} {cursor_keys if cursor_keys is not None else '-':>12}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--fake", action="store_true")
+    args = parser.parse_args()
+
+    server = None
+    if args.fake:
+        from tests.fake_mongo import FakeMongoServer
+        server = FakeMongoServer().start()
+        args.mongo_uri = server.url
+    # config.database reads these on import
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["DB_NAME"] = DB
+    try:
+        asyncio.run(main(args.messages, args.page, args.repeats))
+    finally:
+        if server:
+            server.stop()
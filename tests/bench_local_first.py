@@ -0,0 +1,90 @@
+"""
+Same-instance delivery latency: broadcast() call -> frame handed to a local socket.
+
+"redis_roundtrip" replays the old path (publish, then wait for this instance's own
+listener to deliver it back); "local_first" is the current path. Uses the in-process
+Redis stand-in by default, or a real server with --redis-url.
+
+    python -m tests.bench_local_first [--messages 2000] [--redis-url redis://localhost:6379]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from tests.fake_redis import FakeRedisServer
+from utils.ConnectionManager import ConnectionManager
+
+
+class BenchWebSocket:
+    def __init__(self):
+        self.received = asyncio.Event()
+        self.received_at = 0.0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        self.received_at = time.perf_counter()
+        self.received.set()
+
+    async def close(self):
+        pass
+
+
+class RoundTripConnectionManager(ConnectionManager):
+    """The pre-envelope broadcast: publish untagged and let the listener deliver it back"""
+
+    async def broadcast(self, message: str, room_id: str) -> None:
+        try:
+            await self._redis_client.publish(self._channel(room_id), message)
+        except Exception:
+            self._broadcast_local(message, room_id)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(kind: str, messages: int):
+    manager = RoundTripConnectionManager() if kind == "redis_roundtrip" else ConnectionManager()
+    await manager.initialize_redis()
+    ws = BenchWebSocket()
+    await manager.connect(ws, "bench")
+    await asyncio.sleep(0.1)
+
+    latencies = []
+    for i in range(messages):
+        ws.received.clear()
+        start = time.perf_counter()
+        await manager.broadcast(f'{{"type": "chat", "msg": "{i}"}}', "bench")
+        await ws.received.wait()
+        latencies.append((ws.received_at - start) * 1_000_000)
+
+    await manager.shutdown()
+    print(
+        f"{kind:>15}: p50={statistics.median(latencies):9.1f}us  "
+        f"p99={percentile(latencies, 99):9.1f}us  max={max(latencies):9.1f}us"
+    )
+
+
+async def main(messages: int, redis_url: str):
+    server = None
+    if not redis_url:
+        server = await FakeRedisServer().start()
+        redis_url = server.url
+    os.environ["REDIS_URL"] = redis_url
+    for kind in ("redis_roundtrip", "local_first"):
+        await run(kind, messages)
+    if server:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.redis_url))
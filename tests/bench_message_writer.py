@@ -0,0 +1,106 @@
+"""
+Message persistence throughput: chat messages offered at a fixed rate, stored in MongoDB.
+
+"insert_one" replays the old path (every sender awaits its own insert before the next
+message); the other rows run BatchedMessageWriter in each durability mode. Reports the
+sustained insert rate, the number of round trips (batches) and how long a sender was
+held per message. Uses the in-process MongoDB stand-in by default, or a real server
+with --mongo-uri, where the gap between per-message and batched writes is far larger.
+
+    python -m tests.bench_message_writer [--rate 10000] [--seconds 3] [--senders 1000] [--mongo-uri mongodb://localhost:27017]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from pymongo import AsyncMongoClient
+
+from tests.fake_mongo import FakeMongoServer
+from utils.message_writer import BatchedMessageWriter
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def offer(rate: int, seconds: float, senders: int, send):
+    """Spread `rate` msgs/sec over `senders` tasks; each sender awaits `send` before its next message"""
+    total = int(rate * seconds)
+    per_sender = total // senders
+    interval = senders / rate
+    held = []
+
+    async def sender(n: int):
+        next_at = time.perf_counter()
+        for i in range(per_sender):
+            start = time.perf_counter()
+            await send({"room_id": f"bench-{n % 20}", "user": f"user{n}", "msg": f"message {i}", "timestamp": start})
+            held.append(time.perf_counter() - start)
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    await asyncio.gather(*(sender(n) for n in range(senders)))
+    return per_sender * senders, held
+
+
+async def run(kind: str, rate: int, seconds: float, senders: int, collection):
+    await collection.delete_many({})
+    started = time.perf_counter()
+    if kind == "insert_one":
+        round_trips = 0
+
+        async def send(doc):
+            nonlocal round_trips
+            round_trips += 1
+            await collection.insert_one(doc)
+
+        sent, held = await offer(rate, seconds, senders, send)
+    else:
+        writer = BatchedMessageWriter(lambda docs: collection.insert_many(docs, ordered=False), durability=kind)
+
+        async def send(doc):
+            saved = await writer.submit(doc)
+            if kind != "fire_and_forget":
+                await saved
+
+        sent, held = await offer(rate, seconds, senders, send)
+        await writer.stop()
+        round_trips = writer.stats["batches"]
+
+    elapsed = time.perf_counter() - started
+    stored = await collection.count_documents({})
+    assert stored == sent, f"{kind}: stored {stored} of {sent}"
+    print(
+        f"{kind:>20}: {stored / elapsed:>8,.0f} inserts/s   {round_trips:>6} round trips   "
+        f"sender held p50={statistics.median(held) * 1000:6.2f}ms p99={percentile(held, 99) * 1000:7.2f}ms"
+    )
+
+
+async def main(rate: int, seconds: float, senders: int, mongo_uri: str):
+    server = None
+    if not mongo_uri:
+        server = FakeMongoServer().start()
+        mongo_uri = server.url
+    client = AsyncMongoClient(mongo_uri)
+    collection = client["bench_message_writer"]["messages"]
+    print(f"{rate} msgs/s for {seconds:.0f}s from {senders} senders")
+    for kind in ("insert_one", "fire_and_forget", "ack_after_batch", "ack_before_broadcast"):
+        await run(kind, rate, seconds, senders, collection)
+    await collection.drop()
+    await client.close()
+    if server:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=10000)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--senders", type=int, default=1000)
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.rate, args.seconds, args.senders, args.mongo_uri))
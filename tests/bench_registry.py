@@ -0,0 +1,117 @@
+"""
+Connection registry churn benchmark.
+
+Fills the manager with N sockets spread over a few rooms, then measures how many
+disconnect+reconnect cycles per second it sustains. "legacy" replays the old
+list-per-room registry behind a global lock; "indexed" is the current registry.
+Like timeit, the cyclic GC is paused while timing so heap size doesn't skew the numbers.
+
+    python -m tests.bench_registry [--sockets 50000] [--rooms 20] [--cycles 5000]
+"""
+import argparse
+import asyncio
+import gc
+import random
+import time
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+from utils.ConnectionManager import ConnectionManager
+from utils.outbound import ConnectionWriter
+
+
+class BenchWebSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        pass
+
+    async def close(self):
+        pass
+
+
+class LegacyConnectionManager(ConnectionManager):
+    """The pre-index registry: Dict[str, List[WebSocket]] guarded by one asyncio.Lock"""
+
+    def __init__(self):
+        super().__init__()
+        self._legacy_rooms: Dict[str, List[WebSocket]] = {}
+        self._legacy_lock = asyncio.Lock()
+
+    async def connect(self, websocket: WebSocket, room_id: str) -> None:
+        await websocket.accept()
+        async with self._legacy_lock:
+            if room_id not in self._legacy_rooms:
+                self._legacy_rooms[room_id] = []
+            self._legacy_rooms[room_id].append(websocket)
+            if websocket not in self._writers:
+                self._writers[websocket] = ConnectionWriter(websocket, self._evict)
+
+    async def disconnect(self, websocket: WebSocket, room_id: Optional[str] = None) -> None:
+        emptied_rooms = []
+        async with self._legacy_lock:
+            if room_id is not None:
+                conns = self._legacy_rooms.get(room_id)
+                if conns and websocket in conns:
+                    conns.remove(websocket)
+                    if not conns:
+                        self._legacy_rooms.pop(room_id, None)
+                        emptied_rooms.append(room_id)
+            else:
+                for rid, conns in list(self._legacy_rooms.items()):
+                    if websocket in conns:
+                        conns.remove(websocket)
+                        if not conns:
+                            emptied_rooms.append(rid)
+                for rid in emptied_rooms:
+                    self._legacy_rooms.pop(rid, None)
+            writer = None
+            if not any(websocket in conns for conns in self._legacy_rooms.values()):
+                writer = self._writers.pop(websocket, None)
+        if writer is not None:
+            writer.close()
+
+
+async def run(kind: str, sockets: int, rooms: int, cycles: int):
+    manager = LegacyConnectionManager() if kind == "legacy" else ConnectionManager()
+    members = [(BenchWebSocket(), f"room{i % rooms}") for i in range(sockets)]
+
+    gc.disable()
+    start = time.perf_counter()
+    for ws, room_id in members:
+        await manager.connect(ws, room_id)
+    fill_time = time.perf_counter() - start
+
+    rng = random.Random(42)
+    start = time.perf_counter()
+    for i in range(cycles):
+        ws, room_id = members[rng.randrange(sockets)]
+        # Alternate between a targeted disconnect and the room-less one used on send failures
+        await manager.disconnect(ws, room_id if i % 2 else None)
+        await manager.connect(ws, room_id)
+    churn_time = time.perf_counter() - start
+    gc.enable()
+
+    await manager.shutdown()
+    print(
+        f"{kind:>8} @ {sockets:>6} sockets: fill {sockets / fill_time:>10,.0f} connects/s   "
+        f"churn {cycles / churn_time:>10,.0f} cycles/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=50000)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=5000)
+    args = parser.parse_args()
+
+    for sockets in (args.sockets // 10, args.sockets):
+        for kind in ("legacy", "indexed"):
+            asyncio.run(run(kind, sockets, args.rooms, args.cycles))
+
+
+if __name__ == "__main__":
+    main()
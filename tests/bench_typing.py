@@ -0,0 +1,86 @@
+"""
+Typing-indicator benchmark: a room full of people typing at once.
+
+Every typist sends {"type": "typing", "status": true} on each keystroke during a burst,
+then stops. "per_keystroke" replays the old path (one broadcast per frame); "tracker"
+goes through TypingTracker. Reports Redis publishes and frames one member receives.
+Batching is off for both runs so only the typing path differs.
+
+    python -m tests.bench_typing [--typists 200] [--seconds 6]
+"""
+import argparse
+import asyncio
+import os
+import random
+
+from tests.fake_redis import FakeRedisServer
+from utils.ConnectionManager import ConnectionManager
+from utils.typing_indicator import TypingTracker
+
+
+class BenchWebSocket:
+    def __init__(self):
+        self.frames = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        self.frames += 1
+
+    async def close(self):
+        pass
+
+
+async def typist(name: str, seconds: float, send):
+    rng = random.Random(name)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    while loop.time() < deadline:
+        # A burst of keystrokes, then a pause
+        for _ in range(rng.randint(5, 20)):
+            await send(name, True)
+            await asyncio.sleep(rng.uniform(0.08, 0.25))
+        await send(name, False)
+        await asyncio.sleep(rng.uniform(0.5, 1.5))
+
+
+async def run(kind: str, typists: int, seconds: float, server: FakeRedisServer):
+    publishes_before = server.commands["PUBLISH"]
+    manager = ConnectionManager(batch_mode="off")
+    await manager.initialize_redis()
+    tracker = TypingTracker(manager)
+    observer = BenchWebSocket()
+    await manager.connect(observer, "bench")
+
+    async def send(user: str, status: bool):
+        if kind == "tracker":
+            tracker.set_typing("bench", user, status)
+        else:
+            await manager.broadcast_json({"type": "typing", "user": user, "status": status}, "bench")
+
+    await asyncio.gather(*(typist(f"user{i}", seconds, send) for i in range(typists)))
+    await asyncio.sleep(0.5)
+    await tracker.stop()
+    await manager.shutdown()
+    print(
+        f"{kind:>13}: {server.commands['PUBLISH'] - publishes_before:>7} Redis publishes   "
+        f"{observer.frames:>7} frames to one member"
+    )
+
+
+async def main(typists: int, seconds: float):
+    server = await FakeRedisServer().start()
+    os.environ["REDIS_URL"] = server.url
+    print(f"{typists} typists for {seconds:.0f}s")
+    for kind in ("per_keystroke", "tracker"):
+        await run(kind, typists, seconds, server)
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--typists", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=6)
+    args = parser.parse_args()
+    asyncio.run(main(args.typists, args.seconds))
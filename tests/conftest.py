@@ -1,6 +1,35 @@
+import asyncio
+import os
+import threading
+
 import pytest
-from httpx import AsyncClient, ASGITransport
-from main import app
+from fastapi.testclient import TestClient
+from pymongo import MongoClient
+
+from tests.fake_mongo import FakeMongoServer
+from tests.fake_redis import FakeRedisServer
+
+# Tests run against the in-memory MongoDB stand-in unless TEST_MONGO_URI points at a real mongod.
+# This must happen before the app (and config.database) is imported.
+if os.getenv("TEST_MONGO_URI"):
+    os.environ["MONGO_URI"] = os.environ["TEST_MONGO_URI"]
+else:
+    mongo_server = FakeMongoServer().start()
+    os.environ["MONGO_URI"] = mongo_server.url
+
+# Likewise Redis, unless TEST_REDIS_URL is set; the stand-in gets a loop of its own so it
+# serves the app whichever loop that runs on.
+if os.getenv("TEST_REDIS_URL"):
+    os.environ["REDIS_URL"] = os.environ["TEST_REDIS_URL"]
+else:
+    redis_loop = asyncio.new_event_loop()
+    threading.Thread(target=redis_loop.run_forever, daemon=True).start()
+    redis_server = asyncio.run_coroutine_threadsafe(FakeRedisServer().start(), redis_loop).result()
+    os.environ["REDIS_URL"] = redis_server.url
+
+from main import app  # noqa: E402
+from config.database import DB_NAME  # noqa: E402
+from utils.ConnectionManager import ConnectionManager  # noqa: E402
 
 
 @pytest.fixture
@@ -8,8 +37,59 @@ def anyio_backend():
     return "asyncio"
 
 
+@pytest.fixture(scope="session")
+def client():
+    """The app with its lifespan running: one event loop for every request and websocket"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
 @pytest.fixture
-async def client():
-    transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url="http://test") as ac:
-        yield ac
+def run(client):
+    """Run a coroutine function on the app's event loop, where its Mongo client lives"""
+    return client.portal.call
+
+
+@pytest.fixture(scope="session")
+def db():
+    """Synchronous handle on the test database for fixtures and assertions"""
+    mongo = MongoClient(os.environ["MONGO_URI"])
+    yield mongo[DB_NAME]
+    mongo.close()
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+
+
+async def wait_for(predicate, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+async def redis_server(monkeypatch):
+    server = await FakeRedisServer().start()
+    monkeypatch.setenv("REDIS_URL", server.url)
+    yield server
+    await server.stop()
+
+
+async def make_manager(mode: str, batch_mode: str = "off") -> ConnectionManager:
+    manager = ConnectionManager(pubsub_mode=mode, batch_mode=batch_mode)
+    await manager.initialize_redis()
+    return manager
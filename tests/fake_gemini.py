@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGeminiServer:
+    """
+    Minimal stand-in for the Gemini generateContent endpoint on a local HTTP socket, served
+    from a background thread so any event loop can use it. Each request waits `delay`
+    seconds and answers with `reply` (formatted with the prompt), or with an error when
+    `status` is not 200. It records the prompts it got, the client connections they came
+    on, and the most requests it had in flight at once.
+    """
+
+    def __init__(self, reply: str = "echo: {prompt}", delay: float = 0.0):
+        self.reply = reply
+        self.delay = delay
+        self.status = 200
+        self.prompts = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1beta/models/fake:generateContent"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so tests can see whether the client reuses its connections
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                fake._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        ThreadingHTTPServer.daemon_threads = True
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        body = json.loads(request.rfile.read(int(request.headers["Content-Length"])))
+        prompt = body["contents"][0]["parts"][0]["text"]
+        with self._lock:
+            self.prompts.append(prompt)
+            self.connections.add(request.client_address)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if self.status == 200:
+                data = json.dumps({
+                    "candidates": [{"content": {"parts": [{"text": self.reply.format(prompt=prompt)}]}}]
+                }).encode()
+            else:
+                data = json.dumps({"error": {"code": self.status, "message": "fake error"}}).encode()
+            request.send_response(self.status)
+            request.send_header("Content-Type", "application/json")
+            request.send_header("Content-Length", str(len(data)))
+            request.end_headers()
+            request.wfile.write(data)
+        except OSError:
+            pass  # the client gave up (e.g. its request was cancelled)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -0,0 +1,695 @@
+import re
+import socketserver
+import struct
+import threading
+from datetime import datetime, UTC
+
+import bson
+from bson import ObjectId
+from bson.int64 import Int64
+
+OP_REPLY = 1
+OP_QUERY = 2004
+OP_MSG = 2013
+
+_MISSING = object()
+
+
+class FakeMongoServer:
+    """
+    Minimal in-process MongoDB stand-in speaking the wire protocol (OP_MSG / OP_QUERY)
+    on a local TCP socket, served from a background thread so any event loop can use it.
+    Implements the CRUD, aggregate and index subset the app uses, including unique
+    indexes, so tests exercise the real pymongo clients. Commands are counted for assertions.
+    """
+
+    def __init__(self):
+        self.databases = {}  # db -> collection -> [doc, ...]
+        self.indexes = {}  # (db, collection) -> {name: {"key": [...], "unique": bool}}
+        self._ids = {}  # (db, collection) -> encoded _id values, for the implicit unique _id index
+        self.commands = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._connection_ids = 0
+
+    @property
+    def url(self) -> str:
+        return f"mongodb://127.0.0.1:{self._server.server_address[1]}/?directConnection=true"
+
+    def start(self):
+        outer = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                outer._serve(self.request)
+
+        socketserver.ThreadingTCPServer.daemon_threads = True
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def collection(self, db: str, name: str) -> list:
+        return self.databases.setdefault(db, {}).setdefault(name, [])
+
+    # --- wire protocol ---------------------------------------------------
+
+    @staticmethod
+    def _recv_exactly(sock, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def _serve(self, sock):
+        with self._lock:
+            self._connection_ids += 1
+            connection_id = self._connection_ids
+        try:
+            while True:
+                length, request_id, _, opcode = struct.unpack("<iiii", self._recv_exactly(sock, 16))
+                body = self._recv_exactly(sock, length - 16)
+                if opcode == OP_MSG:
+                    command = self._parse_msg(body)
+                    reply = self._run(command, connection_id)
+                    payload = struct.pack("<I", 0) + b"\x00" + bson.encode(reply)
+                    sock.sendall(struct.pack("<iiii", 16 + len(payload), 0, request_id, OP_MSG) + payload)
+                elif opcode == OP_QUERY:
+                    command = self._parse_query(body)
+                    reply = bson.encode(self._run(command, connection_id))
+                    payload = struct.pack("<iqii", 0, 0, 0, 1) + reply
+                    sock.sendall(struct.pack("<iiii", 16 + len(payload), 0, request_id, OP_REPLY) + payload)
+                else:
+                    break
+        except (ConnectionError, OSError):
+            pass
+
+    @staticmethod
+    def _parse_msg(body: bytes) -> dict:
+        flags = struct.unpack("<I", body[:4])[0]
+        end = len(body) - (4 if flags & 1 else 0)
+        pos, command = 4, {}
+        while pos < end:
+            kind = body[pos]
+            pos += 1
+            size = struct.unpack("<i", body[pos:pos + 4])[0]
+            if kind == 0:
+                command.update(bson.decode(body[pos:pos + size]))
+            else:
+                section_end = pos + size
+                name_end = body.index(b"\x00", pos + 4)
+                name = body[pos + 4:name_end].decode()
+                command[name] = list(bson.decode_all(body[name_end + 1:section_end]))
+            pos += size
+        return command
+
+    @staticmethod
+    def _parse_query(body: bytes) -> dict:
+        name_end = body.index(b"\x00", 4)
+        pos = name_end + 1 + 8
+        size = struct.unpack("<i", body[pos:pos + 4])[0]
+        command = bson.decode(body[pos:pos + size])
+        command.setdefault("$db", body[4:name_end].decode().split(".")[0])
+        return command
+
+    # --- commands --------------------------------------------------------
+
+    def _run(self, command: dict, connection_id: int) -> dict:
+        name = next(iter(command))
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        with self._lock:
+            self.commands[name] = self.commands.get(name, 0) + 1
+            if handler is None:
+                return {"ok": 1.0}
+            try:
+                reply = handler(command, command.get("$db", "test"), connection_id)
+            except _CommandError as e:
+                return {"ok": 0.0, "errmsg": str(e), "code": e.code}
+        reply.setdefault("ok", 1.0)
+        return reply
+
+    def _cmd_hello(self, command, db, connection_id):
+        return {
+            "helloOk": True,
+            "ismaster": True,
+            "isWritablePrimary": True,
+            "maxBsonObjectSize": 16 * 1024 * 1024,
+            "maxMessageSizeBytes": 48_000_000,
+            "maxWriteBatchSize": 100_000,
+            "localTime": datetime.now(UTC),
+            "logicalSessionTimeoutMinutes": 30,
+            "connectionId": connection_id,
+            "minWireVersion": 0,
+            "maxWireVersion": 21,
+            "readOnly": False,
+        }
+
+    _cmd_ismaster = _cmd_hello
+
+    def _cmd_buildinfo(self, command, db, connection_id):
+        return {"version": "7.0.0", "versionArray": [7, 0, 0, 0]}
+
+    def _cmd_find(self, command, db, connection_id):
+        docs = self._query(db, command["find"], command.get("filter") or {}, command.get("sort"))
+        docs = docs[command.get("skip", 0):]
+        if command.get("limit"):
+            docs = docs[:abs(command["limit"])]
+        if command.get("projection"):
+            docs = [_project(doc, command["projection"]) for doc in docs]
+        return _cursor(db, command["find"], docs)
+
+    def _cmd_getmore(self, command, db, connection_id):
+        return {"cursor": {"id": Int64(0), "ns": f"{db}.{command['collection']}", "nextBatch": []}}
+
+    def _cmd_killcursors(self, command, db, connection_id):
+        return {"cursorsKilled": command.get("cursors", [])}
+
+    def _cmd_count(self, command, db, connection_id):
+        return {"n": len(self._query(db, command["count"], command.get("query") or {}))}
+
+    def _cmd_distinct(self, command, db, connection_id):
+        values = []
+        for doc in self._query(db, command["distinct"], command.get("query") or {}):
+            for value in _values(doc, command["key"]):
+                for item in value if isinstance(value, list) else [value]:
+                    if item is not _MISSING and item not in values:
+                        values.append(item)
+        return {"values": values}
+
+    def _cmd_insert(self, command, db, connection_id):
+        coll, n, errors = command["insert"], 0, []
+        for index, doc in enumerate(command.get("documents", [])):
+            doc.setdefault("_id", ObjectId())
+            try:
+                self._check_unique(db, coll, doc)
+            except _CommandError as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e)})
+                if command.get("ordered", True):
+                    break
+                continue
+            self._store(db, coll, doc)
+            n += 1
+        return _write_result(n, errors)
+
+    def _cmd_update(self, command, db, connection_id):
+        coll, n, modified, upserted, errors = command["update"], 0, 0, [], []
+        for index, spec in enumerate(command.get("updates", [])):
+            try:
+                matched = self._query(db, coll, spec.get("q") or {}, raw=True)
+                if not spec.get("multi"):
+                    matched = matched[:1]
+                if matched:
+                    for doc in matched:
+                        modified += self._apply_update(db, coll, doc, spec["u"])
+                    n += len(matched)
+                elif spec.get("upsert"):
+                    doc = self._upsert(db, coll, spec.get("q") or {}, spec["u"])
+                    upserted.append({"index": index, "_id": doc["_id"]})
+                    n += 1
+            except _CommandError as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e)})
+                if command.get("ordered", True):
+                    break
+        reply = _write_result(n, errors)
+        reply["nModified"] = modified
+        if upserted:
+            reply["upserted"] = upserted
+        return reply
+
+    def _cmd_delete(self, command, db, connection_id):
+        coll, n = command["delete"], 0
+        for spec in command.get("deletes", []):
+            matched = self._query(db, coll, spec.get("q") or {}, raw=True)
+            if spec.get("limit"):
+                matched = matched[:1]
+            self._discard(db, coll, matched)
+            n += len(matched)
+        return {"n": n}
+
+    def _cmd_findandmodify(self, command, db, connection_id):
+        coll = command["findAndModify"]
+        matched = self._query(db, coll, command.get("query") or {}, command.get("sort"), raw=True)[:1]
+        doc = matched[0] if matched else None
+        last_error = {"n": 1 if doc else 0, "updatedExisting": bool(doc and "update" in command)}
+        before = _copy(doc) if doc else None
+        if doc and command.get("remove"):
+            self._discard(db, coll, [doc])
+            value = before
+        elif doc:
+            self._apply_update(db, coll, doc, command["update"])
+            value = doc if command.get("new") else before
+        elif command.get("upsert"):
+            doc = self._upsert(db, coll, command.get("query") or {}, command["update"])
+            last_error.update(n=1, upserted=doc["_id"])
+            value = doc if command.get("new") else None
+        else:
+            value = None
+        if value is not None and command.get("fields"):
+            value = _project(value, command["fields"])
+        return {"value": value, "lastErrorObject": last_error}
+
+    def _cmd_aggregate(self, command, db, connection_id):
+        docs = self._query(db, command["aggregate"], {})
+        for stage in command.get("pipeline", []):
+            (op, arg), = stage.items()
+            docs = _aggregate_stage(op, arg, docs)
+        return _cursor(db, command["aggregate"], docs)
+
+    def _cmd_createindexes(self, command, db, connection_id):
+        indexes = self.indexes.setdefault((db, command["createIndexes"]), {})
+        for spec in command.get("indexes", []):
+            indexes[spec["name"]] = {"key": list(spec["key"].items()), "unique": bool(spec.get("unique"))}
+        self.collection(db, command["createIndexes"])
+        return {}
+
+    def _cmd_dropindexes(self, command, db, connection_id):
+        indexes = self.indexes.get((db, command["dropIndexes"]), {})
+        if command.get("index") not in indexes:
+            raise _CommandError(f"index not found with name [{command.get('index')}]", 27)
+        del indexes[command["index"]]
+        return {}
+
+    def _cmd_listindexes(self, command, db, connection_id):
+        indexes = self.indexes.get((db, command["listIndexes"]), {})
+        docs = [{"v": 2, "key": {"_id": 1}, "name": "_id_"}]
+        docs += [{"v": 2, "key": dict(spec["key"]), "name": name, **({"unique": True} if spec["unique"] else {})}
+                 for name, spec in indexes.items()]
+        return _cursor(db, command["listIndexes"], docs)
+
+    def _cmd_drop(self, command, db, connection_id):
+        self.databases.get(db, {}).pop(command["drop"], None)
+        self.indexes.pop((db, command["drop"]), None)
+        self._ids.pop((db, command["drop"]), None)
+        return {}
+
+    # --- storage helpers ---------------------------------------------------
+
+    def _query(self, db, coll, query, sort=None, raw=False) -> list:
+        docs = [doc for doc in self.collection(db, coll) if _matches(doc, query)]
+        if sort:
+            docs = _sort(docs, sort)
+        return docs if raw else [_copy(doc) for doc in docs]
+
+    def _apply_update(self, db, coll, doc: dict, update: dict) -> int:
+        updated = _updated(doc, update, inserting=False)
+        if updated == doc:
+            return 0
+        self._check_unique(db, coll, updated, exclude=doc)
+        doc.clear()
+        doc.update(updated)
+        return 1
+
+    def _upsert(self, db, coll, query: dict, update: dict) -> dict:
+        seed = {}
+        for key, value in query.items():
+            if isinstance(value, dict) and "$eq" in value:
+                _set_path(seed, key, value["$eq"])
+            elif not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value)):
+                _set_path(seed, key, value)
+        doc = _updated(seed, update, inserting=True)
+        doc.setdefault("_id", seed.get("_id", ObjectId()))
+        self._check_unique(db, coll, doc)
+        self._store(db, coll, doc)
+        return doc
+
+    def _check_unique(self, db, coll, doc: dict, exclude: dict = None):
+        for name, spec in self.indexes.get((db, coll), {}).items():
+            if not spec["unique"]:
+                continue
+            key = [_first(doc, field) for field, _ in spec["key"]]
+            for other in self.collection(db, coll):
+                if other is exclude or other is doc:
+                    continue
+                if [_first(other, field) for field, _ in spec["key"]] == key:
+                    raise _CommandError(f"E11000 duplicate key error collection: {db}.{coll} index: {name}", 11000)
+        if exclude is None and _id_key(doc.get("_id")) in self._ids.get((db, coll), ()):
+            raise _CommandError(f"E11000 duplicate key error collection: {db}.{coll} index: _id_", 11000)
+
+    def _store(self, db, coll, doc: dict):
+        self.collection(db, coll).append(doc)
+        self._ids.setdefault((db, coll), set()).add(_id_key(doc["_id"]))
+
+    def _discard(self, db, coll, docs: list):
+        doomed = {id(doc) for doc in docs}
+        self.databases[db][coll] = [d for d in self.collection(db, coll) if id(d) not in doomed]
+        ids = self._ids.get((db, coll), set())
+        for doc in docs:
+            ids.discard(_id_key(doc.get("_id")))
+
+
+class _CommandError(Exception):
+    def __init__(self, message: str, code: int = 2):
+        super().__init__(message)
+        self.code = code
+
+
+def _cursor(db, coll, docs):
+    return {"cursor": {"id": Int64(0), "ns": f"{db}.{coll}", "firstBatch": docs}}
+
+
+def _write_result(n, errors):
+    reply = {"n": n}
+    if errors:
+        reply["writeErrors"] = errors
+    return reply
+
+
+def _copy(doc):
+    return bson.decode(bson.encode(doc))
+
+
+def _id_key(value) -> bytes:
+    return bson.encode({"_id": value})
+
+
+def _updated(doc: dict, update: dict, inserting: bool) -> dict:
+    """The result of applying an update document (operators or a replacement) to a copy of doc"""
+    if not any(key.startswith("$") for key in update):
+        result = {"_id": doc["_id"]} if "_id" in doc else {}
+        result.update(update)
+        return result
+    result = _copy(doc)
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        if op not in _UPDATE_OPS:
+            raise _CommandError(f"Unknown modifier: {op}", 9)
+        for path, value in fields.items():
+            _UPDATE_OPS[op](result, path, value)
+    return result
+
+
+# --- field paths ------------------------------------------------------------
+
+def _values(doc, path: str) -> list:
+    """Every value a dotted path reaches, walking into arrays like MongoDB does"""
+    current = [doc]
+    for part in path.split("."):
+        found = []
+        for value in current:
+            if isinstance(value, dict):
+                found.append(value.get(part, _MISSING))
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    found.append(value[int(part)])
+                else:
+                    found.extend(item.get(part, _MISSING) for item in value if isinstance(item, dict))
+            else:
+                found.append(_MISSING)
+        current = found
+    return current
+
+
+def _first(doc, path: str):
+    value = _first_or_missing(doc, path)
+    return None if value is _MISSING else value
+
+
+def _set_path(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _unset_path(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+# --- query matching ---------------------------------------------------------
+
+_TYPE_ORDER = [(type(None), 1), (bool, 8), ((int, float), 2), (str, 3), (dict, 4), (list, 5), (bytes, 6), (ObjectId, 7), (datetime, 9)]
+
+
+def _rank(value):
+    if value is _MISSING:
+        return 0
+    for types, rank in _TYPE_ORDER:
+        if isinstance(value, types):
+            return rank
+    return 10
+
+
+def _sort_key(value):
+    rank = _rank(value)
+    if rank in (0, 1):
+        return (rank, 0)
+    if rank in (4, 5):
+        return (rank, repr(value))
+    if rank == 9 and value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return (rank, value)
+
+
+def _compare(a, b, op) -> bool:
+    if a is _MISSING or _rank(a) != _rank(b):
+        return False
+    a, b = _sort_key(a)[1], _sort_key(b)[1]
+    return {"$gt": a > b, "$gte": a >= b, "$lt": a < b, "$lte": a <= b}[op]
+
+
+def _equals(value, target) -> bool:
+    if value is _MISSING:
+        return target is None
+    if isinstance(value, datetime) and isinstance(target, datetime):
+        return _sort_key(value) == _sort_key(target)
+    if value == target:
+        return True
+    return isinstance(value, list) and not isinstance(target, list) and any(_equals(v, target) for v in value)
+
+
+def _candidates(values):
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+
+def _match_condition(values: list, condition) -> bool:
+    if isinstance(condition, re.Pattern):
+        return any(isinstance(v, str) and condition.search(v) for v in _candidates(values))
+    if not (isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition)):
+        return any(_equals(v, condition) for v in values)
+    for op, arg in condition.items():
+        if op == "$eq":
+            ok = any(_equals(v, arg) for v in values)
+        elif op == "$ne":
+            ok = not any(_equals(v, arg) for v in values)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            ok = any(_compare(v, arg, op) for v in _candidates(values))
+        elif op == "$in":
+            ok = any(_equals(v, target) for v in values for target in arg)
+        elif op == "$nin":
+            ok = not any(_equals(v, target) for v in values for target in arg)
+        elif op == "$exists":
+            ok = any(v is not _MISSING for v in values) == bool(arg)
+        elif op == "$all":
+            ok = all(any(_equals(v, target) for v in values) for target in arg)
+        elif op == "$size":
+            ok = any(isinstance(v, list) and len(v) == arg for v in values)
+        elif op == "$not":
+            ok = not _match_condition(values, arg)
+        elif op == "$regex":
+            pattern = re.compile(arg, re.I if "i" in condition.get("$options", "") else 0)
+            ok = any(isinstance(v, str) and pattern.search(v) for v in _candidates(values))
+        elif op == "$options":
+            ok = True
+        elif op == "$elemMatch":
+            ok = any(isinstance(v, list) and any(
+                _matches(item, arg) if isinstance(item, dict) else _match_condition([item], arg) for item in v
+            ) for v in values)
+        else:
+            raise _CommandError(f"unknown operator: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            ok = all(_matches(doc, sub) for sub in condition)
+        elif key == "$or":
+            ok = any(_matches(doc, sub) for sub in condition)
+        elif key == "$nor":
+            ok = not any(_matches(doc, sub) for sub in condition)
+        elif key == "$comment":
+            ok = True
+        else:
+            ok = _match_condition(_values(doc, key), condition)
+        if not ok:
+            return False
+    return True
+
+
+def _sort(docs: list, sort: dict) -> list:
+    for field, direction in reversed(list(sort.items())):
+        docs = sorted(docs, key=lambda d: _sort_key(_first_or_missing(d, field)), reverse=direction < 0)
+    return docs
+
+
+def _first_or_missing(doc, path):
+    values = _values(doc, path)
+    return values[0] if values else _MISSING
+
+
+def _project(doc: dict, projection: dict) -> dict:
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {}
+        if projection.get("_id", 1):
+            result["_id"] = doc.get("_id")
+        for path in include:
+            value = _first_or_missing(doc, path)
+            if value is not _MISSING:
+                _set_path(result, path, value)
+        return result
+    result = _copy(doc)
+    for path, flag in projection.items():
+        if not flag:
+            _unset_path(result, path)
+    return result
+
+
+# --- updates ----------------------------------------------------------------
+
+def _update_push(doc, path, value):
+    current = _first(doc, path)
+    items = list(current or [])
+    if isinstance(value, dict) and "$each" in value:
+        items.extend(value["$each"])
+        if "$slice" in value:
+            items = items[value["$slice"]:] if value["$slice"] < 0 else items[:value["$slice"]]
+    else:
+        items.append(value)
+    _set_path(doc, path, items)
+
+
+def _update_add_to_set(doc, path, value):
+    items = list(_first(doc, path) or [])
+    for item in value["$each"] if isinstance(value, dict) and "$each" in value else [value]:
+        if item not in items:
+            items.append(item)
+    _set_path(doc, path, items)
+
+
+def _update_pull(doc, path, value):
+    items = _first(doc, path)
+    if isinstance(items, list):
+        if isinstance(value, dict):
+            keep = [i for i in items if not (_matches(i, value) if isinstance(i, dict) and not any(
+                k.startswith("$") for k in value) else _match_condition([i], value))]
+        else:
+            keep = [i for i in items if i != value]
+        _set_path(doc, path, keep)
+
+
+def _update_extreme(pick):
+    def apply(doc, path, value):
+        current = _first_or_missing(doc, path)
+        if current is _MISSING or pick(_sort_key(value), _sort_key(current)):
+            _set_path(doc, path, value)
+    return apply
+
+
+_UPDATE_OPS = {
+    "$set": _set_path,
+    "$setOnInsert": _set_path,
+    "$unset": lambda doc, path, value: _unset_path(doc, path),
+    "$inc": lambda doc, path, value: _set_path(doc, path, (_first(doc, path) or 0) + value),
+    "$push": _update_push,
+    "$addToSet": _update_add_to_set,
+    "$pull": _update_pull,
+    "$max": _update_extreme(lambda new, old: new > old),
+    "$min": _update_extreme(lambda new, old: new < old),
+    "$currentDate": lambda doc, path, value: _set_path(doc, path, datetime.now(UTC)),
+}
+
+
+# --- aggregation --------------------------------------------------------------
+
+def _expression(doc, expr):
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _first(doc, expr[1:])
+    if isinstance(expr, dict) and not any(k.startswith("$") for k in expr):
+        return {k: _expression(doc, v) for k, v in expr.items()}
+    return expr
+
+
+def _group(arg, docs):
+    groups = {}
+    for doc in docs:
+        key = _expression(doc, arg["_id"])
+        groups.setdefault(bson.encode({"k": key}), (key, []))[1].append(doc)
+    results = []
+    for key, members in groups.values():
+        result = {"_id": key}
+        for field, accumulator in arg.items():
+            if field == "_id":
+                continue
+            (op, expr), = accumulator.items()
+            values = [_expression(doc, expr) for doc in members]
+            present = [v for v in values if v is not None]
+            if op == "$sum":
+                result[field] = sum(v for v in values if isinstance(v, (int, float)))
+            elif op == "$avg":
+                result[field] = sum(present) / len(present) if present else None
+            elif op in ("$max", "$min"):
+                chosen = (max if op == "$max" else min)(present, key=_sort_key, default=None)
+                result[field] = chosen
+            elif op == "$first":
+                result[field] = values[0] if values else None
+            elif op == "$last":
+                result[field] = values[-1] if values else None
+            elif op == "$push":
+                result[field] = values
+            elif op == "$addToSet":
+                result[field] = [v for i, v in enumerate(values) if v not in values[:i]]
+            else:
+                raise _CommandError(f"unknown group operator: {op}")
+        results.append(result)
+    return results
+
+
+def _aggregate_stage(op, arg, docs):
+    if op == "$match":
+        return [doc for doc in docs if _matches(doc, arg)]
+    if op == "$sort":
+        return _sort(docs, arg)
+    if op == "$skip":
+        return docs[arg:]
+    if op == "$limit":
+        return docs[:arg]
+    if op == "$project":
+        if all(isinstance(v, (int, bool)) for v in arg.values()):
+            return [_project(doc, arg) for doc in docs]
+        return [{"_id": doc.get("_id"), **{k: _expression(doc, v) for k, v in arg.items() if k != "_id"}}
+                for doc in docs]
+    if op == "$group":
+        return _group(arg, docs)
+    if op == "$count":
+        return [{arg: len(docs)}] if docs else []
+    if op == "$unwind":
+        path = arg if isinstance(arg, str) else arg["path"]
+        out = []
+        for doc in docs:
+            for item in _first(doc, path[1:]) or []:
+                copy = _copy(doc)
+                _set_path(copy, path[1:], item)
+                out.append(copy)
+        return out
+    raise _CommandError(f"unsupported pipeline stage: {op}")
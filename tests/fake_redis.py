@@ -0,0 +1,266 @@
+import asyncio
+import fnmatch
+import time
+from collections import Counter, defaultdict
+
+
+class FakeRedisServer:
+    """
+    Minimal in-process Redis stand-in speaking RESP2 over a local TCP socket.
+    Implements pub/sub plus a small keyspace (strings, hashes, sets, sorted sets, TTLs) so
+    tests exercise the real redis-py client, and counts commands and deliveries.
+    """
+
+    def __init__(self):
+        self.channels = defaultdict(set)
+        self.patterns = defaultdict(set)
+        self.shard_channels = defaultdict(set)
+        self.commands = Counter()
+        self.deliveries = 0
+        self.data = {}
+        self.expires = {}
+        self._server = None
+        self.port = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def subscription_count(self) -> int:
+        """Number of live (client, channel-or-pattern) subscriptions"""
+        return sum(
+            len(subs)
+            for table in (self.channels, self.patterns, self.shard_channels)
+            for subs in table.values()
+        )
+
+    # --- RESP encoding -------------------------------------------------
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, str):
+            value = value.encode()
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"*%d\r\n" % len(value) + b"".join(FakeRedisServer._encode(v) for v in value)
+
+    @staticmethod
+    async def _read_command(reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:].strip())
+        args = []
+        for _ in range(count):
+            size = int((await reader.readline())[1:].strip())
+            data = await reader.readexactly(size + 2)
+            args.append(data[:-2].decode())
+        return args
+
+    # --- command handling ----------------------------------------------
+
+    async def _handle(self, reader, writer):
+        subs = {"subscribe": set(), "psubscribe": set(), "ssubscribe": set()}
+        tables = {"subscribe": self.channels, "psubscribe": self.patterns, "ssubscribe": self.shard_channels}
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                cmd = args[0].upper()
+                self.commands[cmd] += 1
+                kind = cmd.lower()
+
+                if kind in subs:
+                    for name in args[1:]:
+                        subs[kind].add(name)
+                        tables[kind][name].add(writer)
+                        writer.write(self._encode([kind, name, sum(len(s) for s in subs.values())]))
+                elif kind in ("unsubscribe", "punsubscribe", "sunsubscribe"):
+                    base = kind[2:] if kind == "unsubscribe" else kind[0] + kind[3:]
+                    names = args[1:] or list(subs[base])
+                    if not names:
+                        writer.write(self._encode([kind, None, 0]))
+                    for name in names:
+                        subs[base].discard(name)
+                        tables[base][name].discard(writer)
+                        if not tables[base][name]:
+                            tables[base].pop(name, None)
+                        writer.write(self._encode([kind, name, sum(len(s) for s in subs.values())]))
+                elif cmd == "PUBLISH":
+                    writer.write(self._encode(self._publish(args[1], args[2])))
+                elif cmd == "SPUBLISH":
+                    receivers = list(self.shard_channels.get(args[1], ()))
+                    for w in receivers:
+                        w.write(self._encode(["smessage", args[1], args[2]]))
+                    self.deliveries += len(receivers)
+                    writer.write(self._encode(len(receivers)))
+                elif cmd == "PING":
+                    writer.write(b"+PONG\r\n")
+                elif hasattr(self, f"_cmd_{kind}"):
+                    writer.write(self._encode(getattr(self, f"_cmd_{kind}")(*args[1:])))
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for kind, names in subs.items():
+                for name in names:
+                    tables[kind].get(name, set()).discard(writer)
+                    if name in tables[kind] and not tables[kind][name]:
+                        tables[kind].pop(name, None)
+            writer.close()
+
+    def _publish(self, channel: str, data: str) -> int:
+        receivers = 0
+        for w in list(self.channels.get(channel, ())):
+            w.write(self._encode(["message", channel, data]))
+            receivers += 1
+        for pattern, writers in list(self.patterns.items()):
+            if fnmatch.fnmatchcase(channel, pattern):
+                for w in writers:
+                    w.write(self._encode(["pmessage", pattern, channel, data]))
+                    receivers += 1
+        self.deliveries += receivers
+        return receivers
+
+    # --- keyspace --------------------------------------------------------
+
+    def expire_now(self, key: str):
+        """Test helper: make a key's TTL run out immediately"""
+        self.expires[key] = 0
+
+    def _get(self, key: str):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def _set_ttl(self, key: str, seconds: float):
+        if self._get(key) is None:
+            return 0
+        self.expires[key] = time.monotonic() + seconds
+        return 1
+
+    def _cmd_get(self, key):
+        value = self._get(key)
+        return value if isinstance(value, str) else None
+
+    def _cmd_mget(self, *keys):
+        return [self._cmd_get(key) for key in keys]
+
+    def _cmd_set(self, key, value, *options):
+        options = [o.upper() for o in options]
+        if "NX" in options and self._get(key) is not None:
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for flag, scale in (("EX", 1), ("PX", 0.001)):
+            if flag in options:
+                self._set_ttl(key, float(options[options.index(flag) + 1]) * scale)
+        return "OK"
+
+    def _cmd_incr(self, key):
+        return self._cmd_incrby(key, 1)
+
+    def _cmd_incrby(self, key, amount):
+        value = int(self._get(key) or 0) + int(amount)
+        self.data[key] = str(value)
+        return value
+
+    def _cmd_hincrby(self, key, field, amount):
+        current = self._get(key)
+        if current is None:
+            current = self.data[key] = {}
+        current[field] = str(int(current.get(field, 0)) + int(amount))
+        return int(current[field])
+
+    def _cmd_hget(self, key, field):
+        return (self._get(key) or {}).get(field)
+
+    def _cmd_hsetnx(self, key, field, value):
+        current = self._get(key)
+        if current is None:
+            current = self.data[key] = {}
+        if field in current:
+            return 0
+        current[field] = value
+        return 1
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._get(key) is not None:
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def _cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._get(key) is not None)
+
+    def _cmd_expire(self, key, seconds):
+        return self._set_ttl(key, float(seconds))
+
+    def _cmd_pexpire(self, key, millis):
+        return self._set_ttl(key, float(millis) / 1000)
+
+    def _cmd_sadd(self, key, *members):
+        current = self._get(key)
+        if current is None:
+            current = self.data[key] = set()
+        added = len(set(members) - current)
+        current.update(members)
+        return added
+
+    def _cmd_srem(self, key, *members):
+        current = self._get(key) or set()
+        removed = len(current & set(members))
+        current.difference_update(members)
+        if not current:
+            self._cmd_del(key)
+        return removed
+
+    def _cmd_smembers(self, key):
+        return sorted(self._get(key) or ())
+
+    def _cmd_zadd(self, key, *args):
+        current = self._get(key)
+        if current is None:
+            current = self.data[key] = {}
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            added += member not in current
+            current[member] = float(score)
+        return added
+
+    def _cmd_zrangebyscore(self, key, low, high):
+        current = self._get(key) or {}
+        low, high = float(low), float(high)
+        return [m for m, score in sorted(current.items(), key=lambda i: i[1]) if low <= score <= high]
+
+    def _cmd_zremrangebyscore(self, key, low, high):
+        current = self._get(key) or {}
+        doomed = self._cmd_zrangebyscore(key, low, high)
+        for member in doomed:
+            current.pop(member, None)
+        return len(doomed)
+
+    def _cmd_zrem(self, key, *members):
+        current = self._get(key) or {}
+        return sum(1 for m in members if current.pop(m, None) is not None)
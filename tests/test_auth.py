@@ -1,30 +1,20 @@
 import pytest
-from httpx import AsyncClient, ASGITransport
-from main import app
-from config.database import users_collection
-
-@pytest.fixture
-async def client():
-    transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url="http://test") as c:
-        yield c
 
 @pytest.fixture(autouse=True)
-async def cleanup_db():
+def cleanup_db(db):
     # Setup: Clean up test user before test
-    users_collection.delete_one({"username": "testdeleteuser"})
+    db.users.delete_one({"username": "testdeleteuser"})
     yield
     # Teardown: Clean up test user after test
-    users_collection.delete_one({"username": "testdeleteuser"})
+    db.users.delete_one({"username": "testdeleteuser"})
 
-@pytest.mark.anyio
-async def test_delete_account(client):
+def test_delete_account(client):
     # 1. Signup
     signup_data = {
         "username": "testdeleteuser",
         "password": "password123"
     }
-    response = await client.post("/api/signup", json=signup_data)
+    response = client.post("/api/signup", json=signup_data)
     assert response.status_code == 200
     
     # 2. Login to get token
@@ -32,21 +22,21 @@ async def test_delete_account(client):
         "username": "testdeleteuser",
         "password": "password123"
     }
-    response = await client.post("/api/signin", data=login_data)
+    response = client.post("/api/signin", data=login_data)
     assert response.status_code == 200
     token = response.json()["access_token"]
     headers = {"Authorization": f"Bearer {token}"}
     
     # 3. Verify user exists (call /me)
-    response = await client.get("/api/me", headers=headers)
+    response = client.get("/api/me", headers=headers)
     assert response.status_code == 200
     assert response.json()["username"] == "testdeleteuser"
     
     # 4. Delete Account
-    response = await client.delete("/api/delete_account", headers=headers)
+    response = client.delete("/api/delete_account", headers=headers)
     assert response.status_code == 200
     assert response.json()["message"] == "Account deleted successfully"
     
     # 5. Verify user is gone (login should fail)
-    response = await client.post("/api/signin", data=login_data)
+    response = client.post("/api/signin", data=login_data)
     assert response.status_code == 401
@@ -0,0 +1,141 @@
+import time
+
+import pytest
+
+from routes.chat import ai_bot, bot_pool, typing_tracker
+from tests.conftest import wait_for
+from tests.fake_gemini import FakeGeminiServer
+from utils.bot_pool import BotWorkerPool
+from utils.chatbot import AIBot
+
+
+@pytest.fixture
+def gemini():
+    server = FakeGeminiServer(delay=0.2).start()
+    yield server
+    server.stop()
+
+
+def bot_for(server: FakeGeminiServer) -> AIBot:
+    bot = AIBot()
+    bot.api_key, bot.api_url, bot.enabled = "test-key", server.url, True
+    return bot
+
+
+async def test_workers_are_capped_and_rooms_and_users_limited(gemini):
+    bot = bot_for(gemini)
+    replies, dropped = [], []
+
+    async def handler(item):
+        replies.append(await bot.get_response(f"/bot {item}", "alice"))
+
+    async def on_dropped(item, reason):
+        dropped.append((item, reason))
+
+    pool = BotWorkerPool(handler, on_dropped, workers=2, per_room=2, per_user=1)
+    for i in range(4):
+        assert await pool.submit(f"room{i}", f"user{i}", f"q{i}")
+    # A second question from user0 while the first is pending, a third job for room1
+    assert not await pool.submit("room9", "user0", "again")
+    assert await pool.submit("room1", "user8", "q8")
+    assert not await pool.submit("room1", "user9", "q9")
+    assert dropped == [("again", "user"), ("q9", "room")]
+
+    await wait_for(lambda: len(replies) == 5, timeout=5)
+    assert gemini.max_in_flight == 2
+    assert sorted(replies) == sorted(f"echo: alice asked: q{i}" for i in (0, 1, 2, 3, 8))
+    # Finished jobs no longer count against their user
+    assert await pool.submit("room0", "user0", "later")
+    await pool.stop()
+    await bot.close()
+
+
+async def test_jobs_left_waiting_too_long_are_dropped(gemini):
+    bot = bot_for(gemini)
+    dropped = []
+
+    async def handler(item):
+        await bot.get_response(f"/bot {item}", "alice")
+
+    async def on_dropped(item, reason):
+        dropped.append((item, reason))
+
+    pool = BotWorkerPool(handler, on_dropped, workers=1, per_room=5, per_user=5, max_queue_seconds=0.1)
+    await pool.submit("r", "alice", "first")
+    await pool.submit("r", "alice", "stale")
+    await wait_for(lambda: pool.stats["completed"] == 1 and dropped, timeout=5)
+    assert dropped == [("stale", "expired")]
+    assert gemini.prompts == ["alice asked: first"]
+    assert pool.snapshot()["rooms"] == 0
+    await pool.stop()
+    await bot.close()
+
+
+async def test_emptied_room_cancels_its_jobs(gemini):
+    bot = bot_for(gemini)
+    replies = []
+
+    async def handler(item):
+        replies.append(await bot.get_response(f"/bot {item}", "alice"))
+
+    pool = BotWorkerPool(handler, workers=1, per_room=5, per_user=5)
+    await pool.submit("gone", "alice", "running")
+    await pool.submit("gone", "bob", "queued")
+    await pool.submit("other", "carol", "kept")
+    await wait_for(lambda: gemini.in_flight == 1)
+
+    assert pool.cancel_room("gone") == 2
+    await wait_for(lambda: replies == ["echo: alice asked: kept"], timeout=5)
+    assert pool.stats["cancelled"] == 2 and pool.stats["completed"] == 1
+    assert "alice asked: queued" not in gemini.prompts
+    await pool.stop()
+    await bot.close()
+
+
+@pytest.fixture
+def app_bot(monkeypatch, db, gemini):
+    monkeypatch.setattr(ai_bot, "enabled", True)
+    monkeypatch.setattr(ai_bot, "api_key", "test-key")
+    monkeypatch.setattr(ai_bot, "api_url", gemini.url)
+    monkeypatch.setenv("ADMIN_USERNAME", "bot_pool_user")
+    # Longer than a typing broadcast interval, so the bot is seen typing
+    gemini.delay = 0.5
+    db.users.delete_many({"username": "bot_pool_user"})
+    yield gemini
+    db.users.delete_many({"username": "bot_pool_user"})
+    db.rooms.delete_many({"name": "Bot Pool Room"})
+
+
+def test_bot_answers_from_the_pool_and_stops_when_the_room_empties(client, app_bot):
+    client.post("/api/signup", json={"username": "bot_pool_user", "password": "password123"})
+    token = client.post("/api/signin", data={"username": "bot_pool_user", "password": "password123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    room_id = client.post("/api/rooms/create", json={"name": "Bot Pool Room"}, headers=headers).json()["room_id"]
+
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "chat", "msg": "/bot hello"})
+        websocket.send_json({"type": "chat", "msg": "/bot again"})
+        frames = []
+        while not any(f["type"] == "chat" and f["user"] == "AI_Bot" for f in frames):
+            frames.append(websocket.receive_json())
+    # The pool, not the receive loop, showed the bot typing and refused the second question
+    assert {"type": "typing", "users": ["AI_Bot"]} in frames
+    assert {"type": "error", "msg": "Wait for the bot to answer your last question"} in frames
+    assert frames[-1]["msg"] == "echo: bot_pool_user asked: hello"
+
+    completed = bot_pool.stats["completed"]
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "chat", "msg": "/bot anyone there?"})
+        deadline = time.time() + 5
+        while app_bot.in_flight == 0 and time.time() < deadline:
+            time.sleep(0.01)
+    deadline = time.time() + 5
+    while bot_pool.stats["cancelled"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+
+    metrics = client.get("/api/admin/metrics", headers=headers).json()["bot"]
+    assert metrics["cancelled"] >= 1 and metrics["completed"] == completed
+    assert metrics["running"] == 0 and metrics["queued"] == 0
+    assert typing_tracker.typing_users(room_id) == []
@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+import pytest
+
+from tests.conftest import make_manager
+from tests.fake_gemini import FakeGeminiServer
+from utils.chatbot import AIBot, ResponseCache
+from utils.circuit_breaker import CircuitBreaker
+from utils.token_bucket import TokenBucket
+
+
+@pytest.fixture
+def gemini():
+    server = FakeGeminiServer().start()
+    yield server
+    server.stop()
+
+
+def bot_for(server: FakeGeminiServer) -> AIBot:
+    bot = AIBot()
+    bot.api_key, bot.api_url, bot.enabled = "test-key", server.url, True
+    return bot
+
+
+@pytest.fixture
+async def bot(gemini):
+    bot = bot_for(gemini)
+    bot.breaker = CircuitBreaker(failures=3, reset_seconds=0.2, min_timeout=0.5, max_timeout=5)
+    bot.limiter = TokenBucket(rate=1000, burst=100)
+    await bot.start()
+    yield bot
+    await bot.close()
+
+
+async def test_requests_share_pooled_connections(bot, gemini):
+    for i in range(5):
+        assert await bot.get_response(f"/bot q{i}", "alice") == f"echo: alice asked: q{i}"
+    assert len(gemini.connections) == 1
+
+    await asyncio.gather(*(bot.get_response(f"/bot p{i}", "alice") for i in range(5)))
+    # Concurrent requests open more connections, up to the pool's limit, and keep them
+    connections = len(gemini.connections)
+    await asyncio.gather(*(bot.get_response(f"/bot r{i}", "alice") for i in range(5)))
+    assert len(gemini.connections) == connections
+
+
+async def test_breaker_opens_on_failures_and_closes_after_a_good_trial(bot, gemini):
+    gemini.status = 503
+    for _ in range(3):
+        assert "error" in await bot.get_response("/bot hi", "alice")
+    assert bot.snapshot()["breaker"]["state"] == "open"
+
+    # While open, Gemini is not called at all
+    calls = len(gemini.prompts)
+    assert "unavailable" in await bot.get_response("/bot hi", "alice")
+    assert len(gemini.prompts) == calls
+
+    await asyncio.sleep(0.25)
+    gemini.status = 200
+    assert await bot.get_response("/bot back?", "alice") == "echo: alice asked: back?"
+    breaker = bot.snapshot()["breaker"]
+    assert breaker["state"] == "closed" and breaker["opened"] == 1 and breaker["rejected"] == 1
+
+
+async def test_failed_trial_reopens_the_breaker(bot, gemini):
+    gemini.status = 500
+    for _ in range(3):
+        await bot.get_response("/bot hi", "alice")
+    await asyncio.sleep(0.25)
+    await bot.get_response("/bot still down?", "alice")
+    assert bot.breaker.state == "open" and bot.breaker.stats["opened"] == 2
+
+
+async def test_slow_response_times_out_and_counts_as_a_failure(bot, gemini):
+    bot.breaker = CircuitBreaker(failures=1, reset_seconds=5, min_timeout=0.1, max_timeout=0.1)
+    gemini.delay = 0.5
+    assert "too long" in await bot.get_response("/bot hi", "alice")
+    assert bot.breaker.state == "open"
+
+
+def test_timeout_follows_observed_latency():
+    breaker = CircuitBreaker(min_timeout=1, max_timeout=30, timeout_factor=2)
+    assert breaker.timeout() == 30
+    for _ in range(50):
+        breaker.record_success(2.0)
+    assert breaker.timeout() == 4.0
+    for _ in range(50):
+        breaker.record_success(0.1)
+    # p99 is still one of the slow calls; the floor applies once they age out
+    assert breaker.timeout() == 4.0
+    for _ in range(256):
+        breaker.record_success(0.1)
+    assert breaker.timeout() == 1
+
+
+async def test_token_bucket_allows_bursts_then_paces_or_refuses():
+    bucket = TokenBucket(rate=20, burst=3)
+    assert all([await bucket.acquire() for _ in range(3)])
+    assert not await bucket.acquire()
+
+    started = time.monotonic()
+    assert await bucket.acquire(max_wait=0.2)
+    assert time.monotonic() - started >= 0.04
+    # Empty again: the next token is 0.05s away
+    assert not await bucket.acquire(max_wait=0.01)
+    assert bucket.stats == {"acquired": 4, "waited": 1, "refused": 2}
+
+
+async def test_concurrent_identical_questions_share_one_call(bot, gemini):
+    gemini.delay = 0.1
+    answers = await asyncio.gather(
+        bot.get_response("/bot What's the date?", "alice"),
+        bot.get_response("@ai what's  the date", "bob"),
+        bot.get_response("/bot WHAT'S THE DATE!", "carol"),
+    )
+    assert len(set(answers)) == 1 and len(gemini.prompts) == 1
+    assert await bot.get_response("/bot what's the date", "dave") == answers[0]
+    assert len(gemini.prompts) == 1
+
+    cache = bot.snapshot()["cache"]
+    assert cache["coalesced"] == 2 and cache["hits"] == 1 and cache["upstream_calls"] == 1
+    assert cache["hit_ratio"] == 0.75 and cache["upstream_calls_saved"] == 3
+
+
+async def test_cache_is_room_scoped_and_bounded_by_size_and_age(bot, gemini):
+    bot.cache = ResponseCache(ttl=0.2, size=2, scope="room")
+    await bot.get_response("/bot hi there", "alice", "r1")
+    await bot.get_response("/bot hi there", "alice", "r2")
+    await bot.get_response("/bot hi there", "alice", "r1")
+    assert len(gemini.prompts) == 2
+
+    # r2's answer is the least recently used
+    await bot.get_response("/bot other", "alice", "r1")
+    assert bot.cache.stats["evictions"] == 1
+    await bot.get_response("/bot hi there", "alice", "r2")
+    assert len(gemini.prompts) == 4
+
+    await asyncio.sleep(0.25)
+    await bot.get_response("/bot hi there", "alice", "r2")
+    assert len(gemini.prompts) == 5
+
+
+async def test_errors_are_not_cached(bot, gemini):
+    gemini.status = 500
+    assert "error" in await bot.get_response("/bot hello?", "alice")
+    gemini.status = 200
+    assert await bot.get_response("/bot hello?", "alice") == "echo: alice asked: hello?"
+    assert len(gemini.prompts) == 2
+
+
+async def test_upstream_call_is_cancelled_only_with_its_last_caller(bot, gemini):
+    gemini.delay = 0.2
+    first = asyncio.create_task(bot.get_response("/bot slow", "alice"))
+    second = asyncio.create_task(bot.get_response("/bot slow", "bob"))
+    await asyncio.sleep(0.05)
+    first.cancel()
+    assert await second == "echo: alice asked: slow"
+
+    alone = asyncio.create_task(bot.get_response("/bot alone", "alice"))
+    await asyncio.sleep(0.05)
+    alone.cancel()
+    await asyncio.sleep(0.3)
+    assert bot.cache.snapshot()["entries"] == 1 and bot.cache.snapshot()["in_flight"] == 0
+
+
+async def test_answers_are_shared_across_instances_through_redis(gemini, redis_server):
+    manager = await make_manager("channel")
+    a, b = bot_for(gemini), bot_for(gemini)
+    try:
+        await a.start(manager)
+        await b.start(manager)
+        answer = await a.get_response("/bot tell me a joke", "alice")
+        assert await b.get_response("/bot Tell me a joke!", "bob") == answer
+        assert len(gemini.prompts) == 1
+        assert b.cache.stats["redis_hits"] == 1 and b.cache.stats["upstream_calls"] == 0
+    finally:
+        await a.close()
+        await b.close()
+        await manager.shutdown()
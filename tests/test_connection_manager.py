@@ -0,0 +1,248 @@
+import asyncio
+import json
+import pytest
+import redis.asyncio as redis
+
+from tests.conftest import FakeWebSocket, make_manager, wait_for
+from utils.ConnectionManager import ConnectionManager
+
+
+async def test_channel_mode_unsubscribes_when_last_socket_leaves(redis_server):
+    manager = await make_manager("channel")
+    a1, a2, b1 = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    try:
+        await manager.connect(a1, "a")
+        await manager.connect(a2, "a")
+        await manager.connect(b1, "b")
+        await wait_for(lambda: set(redis_server.channels) == {"chat_room_a", "chat_room_b"})
+        assert redis_server.commands["SUBSCRIBE"] == 2
+
+        await manager.disconnect(a1, "a")
+        assert "chat_room_a" in redis_server.channels
+
+        await manager.disconnect(a2)
+        await wait_for(lambda: set(redis_server.channels) == {"chat_room_b"})
+        assert redis_server.commands["UNSUBSCRIBE"] == 1
+
+        await manager.broadcast("hello b", "b")
+        await wait_for(lambda: b1.sent == ["hello b"])
+
+        # Traffic for a room this instance left never reaches it
+        await manager.broadcast("hello a", "a")
+        await asyncio.sleep(0.05)
+        assert manager.stats["wasted_deliveries"] == 0
+        assert a1.sent == [] and a2.sent == []
+    finally:
+        await manager.shutdown()
+
+
+async def test_channel_mode_resubscribes_after_room_empties(redis_server):
+    manager = await make_manager("channel")
+    ws = FakeWebSocket()
+    try:
+        for _ in range(3):
+            await manager.connect(ws, "a")
+            await manager.disconnect(ws, "a")
+        await wait_for(lambda: redis_server.subscription_count() == 0)
+
+        await manager.connect(ws, "a")
+        await manager.broadcast("back", "a")
+        await wait_for(lambda: ws.sent == ["back"])
+        assert manager.stats["subscribes"] == 4
+        assert manager.stats["unsubscribes"] == 3
+    finally:
+        await manager.shutdown()
+
+
+async def test_pattern_mode_uses_single_subscription(redis_server):
+    manager = await make_manager("pattern")
+    sockets = [FakeWebSocket() for _ in range(5)]
+    try:
+        for i, ws in enumerate(sockets):
+            await manager.connect(ws, f"room{i}")
+        await wait_for(lambda: redis_server.commands["PSUBSCRIBE"] == 1)
+        assert redis_server.commands["SUBSCRIBE"] == 0
+        assert redis_server.subscription_count() == 1
+
+        await manager.broadcast("hi", "room3")
+        await wait_for(lambda: sockets[3].sent == ["hi"])
+
+        # Another instance's room nobody here is in still arrives via the pattern
+        publisher = redis.from_url(redis_server.url, decode_responses=True)
+        await publisher.publish("chat_room_elsewhere", "nobody home")
+        await publisher.aclose()
+        await wait_for(lambda: manager.stats["wasted_deliveries"] == 1)
+    finally:
+        await manager.shutdown()
+
+
+async def test_sharded_mode_uses_ssubscribe_and_spublish(redis_server):
+    manager = await make_manager("sharded")
+    ws = FakeWebSocket()
+    try:
+        await manager.connect(ws, "a")
+        await wait_for(lambda: "chat_room_a" in redis_server.shard_channels)
+
+        await manager.broadcast("sharded hello", "a")
+        await wait_for(lambda: redis_server.commands["SPUBLISH"] == 1)
+        assert ws.sent == ["sharded hello"]
+        assert redis_server.commands["PUBLISH"] == 0
+
+        await manager.disconnect(ws, "a")
+        await wait_for(lambda: redis_server.subscription_count() == 0)
+        assert redis_server.commands["SUNSUBSCRIBE"] == 1
+    finally:
+        await manager.shutdown()
+
+
+async def test_local_first_delivery_across_instances(redis_server):
+    first, second = await make_manager("channel"), await make_manager("channel")
+    ws1, ws2 = FakeWebSocket(), FakeWebSocket()
+    try:
+        await first.connect(ws1, "a")
+        await second.connect(ws2, "a")
+        await wait_for(lambda: len(redis_server.channels["chat_room_a"]) == 2)
+
+        expected = [f"m{i}" for i in range(50)]
+        for message in expected:
+            await first.broadcast(message, "a")
+        # The sender's own sockets never wait for the Redis round trip
+        await wait_for(lambda: ws1.sent == expected)
+        await wait_for(lambda: ws2.sent == expected)
+        await wait_for(lambda: first.stats["own_messages_skipped"] == 50)
+        assert ws1.sent == expected
+    finally:
+        await first.shutdown()
+        await second.shutdown()
+
+
+async def test_untagged_redis_messages_are_delivered(redis_server):
+    manager = await make_manager("channel")
+    ws = FakeWebSocket()
+    publisher = redis.from_url(redis_server.url, decode_responses=True)
+    try:
+        await manager.connect(ws, "a")
+        await wait_for(lambda: "chat_room_a" in redis_server.channels)
+        await publisher.publish("chat_room_a", "from an older instance")
+        await wait_for(lambda: ws.sent == ["from an older instance"])
+    finally:
+        await publisher.aclose()
+        await manager.shutdown()
+
+
+async def test_batching_sends_one_frame_and_one_publish(redis_server):
+    first = await make_manager("channel", batch_mode="always")
+    second = await make_manager("channel", batch_mode="always")
+    modern, legacy, remote_modern, remote_legacy = (FakeWebSocket() for _ in range(4))
+    try:
+        await first.connect(modern, "a", batching=True)
+        await first.connect(legacy, "a")
+        await second.connect(remote_modern, "a", batching=True)
+        await second.connect(remote_legacy, "a")
+        await wait_for(lambda: len(redis_server.channels["chat_room_a"]) == 2)
+
+        events = [{"type": "chat", "user": "u", "msg": str(i)} for i in range(5)]
+        for event in events:
+            await first.broadcast_json(event, "a")
+
+        for ws in (modern, remote_modern):
+            await wait_for(lambda: len(ws.sent) == 1)
+            assert json.loads(ws.sent[0]) == {"type": "batch", "events": events}
+        for ws in (legacy, remote_legacy):
+            await wait_for(lambda: len(ws.sent) == 5)
+            assert [json.loads(m) for m in ws.sent] == events
+        assert redis_server.commands["PUBLISH"] == 1
+        assert first.stats["batches"] == 1
+    finally:
+        await first.shutdown()
+        await second.shutdown()
+
+
+async def test_auto_batching_follows_room_rate(monkeypatch):
+    monkeypatch.setattr("utils.ConnectionManager.BATCH_RATE_THRESHOLD", 10)
+    manager = ConnectionManager(batch_mode="auto")
+    ws = FakeWebSocket()
+    await manager.connect(ws, "a", batching=True)
+    for i in range(9):
+        await manager.broadcast(f'"{i}"', "a")
+    await wait_for(lambda: len(ws.sent) == 9)
+
+    # Crossing the threshold switches the room to batches
+    for i in range(9, 20):
+        await manager.broadcast(f'"{i}"', "a")
+    await wait_for(lambda: len(ws.sent) == 10)
+    assert json.loads(ws.sent[-1])["events"] == [str(i) for i in range(9, 20)]
+    await manager.shutdown()
+
+
+async def test_clients_without_batches_are_not_held_for_the_window(monkeypatch):
+    monkeypatch.setattr("utils.ConnectionManager.BATCH_WINDOW_MS", 300)
+    manager = ConnectionManager(batch_mode="always")
+    modern, legacy = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(modern, "a", batching=True)
+    await manager.connect(legacy, "a")
+    for i in range(3):
+        await manager.broadcast(f'"{i}"', "a")
+
+    await wait_for(lambda: len(legacy.sent) == 3, timeout=0.2)
+    assert modern.sent == []
+    await wait_for(lambda: len(modern.sent) == 1)
+    assert json.loads(modern.sent[0])["events"] == ["0", "1", "2"]
+    assert len(legacy.sent) == 3
+    await manager.shutdown()
+
+
+async def test_falls_back_to_local_broadcast_without_redis(monkeypatch):
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:1")
+    manager = await make_manager("channel")
+    ws = FakeWebSocket()
+    await manager.connect(ws, "a")
+    await manager.broadcast("local only", "a")
+    await wait_for(lambda: ws.sent == ["local only"])
+    await manager.shutdown()
+
+
+async def test_slow_consumer_does_not_delay_room(monkeypatch):
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:1")
+    manager = await make_manager("channel")
+    stalled = asyncio.Event()
+
+    class StalledWebSocket(FakeWebSocket):
+        async def send_text(self, message: str):
+            await stalled.wait()
+
+    slow, fast = StalledWebSocket(), FakeWebSocket()
+    try:
+        await manager.connect(slow, "a")
+        await manager.connect(fast, "a")
+        for i in range(3):
+            await manager.broadcast(f"m{i}", "a")
+        await wait_for(lambda: fast.sent == ["m0", "m1", "m2"])
+    finally:
+        stalled.set()
+        await manager.shutdown()
+
+
+async def test_registry_reverse_index():
+    manager = ConnectionManager()
+    ws1, ws2 = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(ws1, "a")
+    await manager.connect(ws1, "b")
+    await manager.connect(ws2, "a")
+    await manager.connect(ws2, "a")
+    assert await manager.count() == 3
+    assert await manager.count("a") == 2
+    assert await manager.get_active_connections("a") == [ws1, ws2]
+
+    await manager.broadcast("first", "a")
+    await manager.disconnect(ws1)
+    assert not await manager.is_connected(ws1)
+    assert await manager.is_connected(ws2, "a")
+    assert await manager.count() == 1
+    assert await manager.get_active_connections() == [ws2]
+
+    # The broadcast snapshot was rebuilt without the departed socket
+    await manager.broadcast("second", "a")
+    await wait_for(lambda: ws2.sent == ["first", "second"])
+    assert ws1.closed
+    await manager.shutdown()
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from routes.chat import message_writer
+from tests.conftest import make_manager
+from utils.ConnectionManager import ConnectionManager
+from utils.dedupe import SendDeduplicator, valid_client_msg_id
+
+
+async def test_resend_returns_the_first_message_id():
+    dedupe = SendDeduplicator(ConnectionManager())
+    assert await dedupe.claim("alice", "c1", "m1") is None
+    assert await dedupe.claim("alice", "c1", "m2") == "m1"
+    # Ids are per user
+    assert await dedupe.claim("bob", "c1", "m3") is None
+
+    await dedupe.release("alice", "c1")
+    assert await dedupe.claim("alice", "c1", "m4") is None
+
+
+async def test_window_is_bounded_by_count_and_age():
+    dedupe = SendDeduplicator(ConnectionManager(), window=2, ttl=0.1)
+    for i in range(3):
+        await dedupe.claim("alice", f"c{i}", f"m{i}")
+    assert await dedupe.claim("alice", "c0", "again") is None
+    assert await dedupe.claim("alice", "c2", "again") == "m2"
+
+    await asyncio.sleep(0.15)
+    assert await dedupe.claim("alice", "c2", "later") is None
+    assert len(dedupe._users["alice"]) == 1
+
+
+async def test_resend_to_another_instance_is_caught_in_redis(redis_server):
+    a, b = await make_manager("channel"), await make_manager("channel")
+    dedupe_a, dedupe_b = SendDeduplicator(a), SendDeduplicator(b)
+    try:
+        assert await dedupe_a.claim("alice", "c1", "m1") is None
+        assert await dedupe_b.claim("alice", "c1", "m2") == "m1"
+        assert dedupe_b.stats["redis_duplicates"] == 1
+        # Now remembered locally: no second Redis lookup
+        assert await dedupe_b.claim("alice", "c1", "m3") == "m1"
+        assert dedupe_b.stats["redis_duplicates"] == 1
+    finally:
+        await a.shutdown()
+        await b.shutdown()
+
+
+def test_client_msg_id_validation():
+    assert valid_client_msg_id("7f3c9b2e-1d4a-4a8e-9c1f-3e2b5d6a7c8d")
+    assert not valid_client_msg_id("")
+    assert not valid_client_msg_id(42)
+    assert not valid_client_msg_id("x" * 65)
+
+
+@pytest.fixture
+def slow_writes(monkeypatch, db):
+    insert_many = message_writer._insert_many
+
+    async def slow_insert_many(docs):
+        await asyncio.sleep(0.3)
+        return await insert_many(docs)
+
+    monkeypatch.setattr(message_writer, "_insert_many", slow_insert_many)
+    db.users.delete_many({"username": "resend_user"})
+    yield
+    db.users.delete_many({"username": "resend_user"})
+    db.rooms.delete_many({"name": "Resend Room"})
+
+
+def test_resend_of_a_message_in_flight_is_acked_after_it_is_stored(client, db, slow_writes):
+    client.post("/api/signup", json={"username": "resend_user", "password": "password123"})
+    token = client.post("/api/signin", data={"username": "resend_user", "password": "password123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    room_id = client.post("/api/rooms/create", json={"name": "Resend Room"}, headers=headers).json()["room_id"]
+
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        frame = {"type": "chat", "msg": "sent twice", "client_msg_id": "resend-1"}
+        websocket.send_json(frame)
+        websocket.send_json(frame)
+        acks = []
+        while len(acks) < 2:
+            received = websocket.receive_json()
+            if received["type"] == "ack":
+                # Neither copy is acked before the first one is in Mongo
+                assert db.messages.count_documents({"room_id": room_id}) == 1
+                acks.append(received["id"])
+    assert acks[0] == acks[1]
+    assert db.messages.count_documents({"room_id": room_id}) == 1
@@ -1,24 +1,19 @@
 import pytest
-from fastapi.testclient import TestClient
-from main import app
-from config.database import users_collection, rooms_collection, files_collection
 import io
 
-client = TestClient(app)
-
 @pytest.fixture(autouse=True)
-def cleanup():
+def cleanup(db):
     # Cleanup before/after tests
-    users_collection.delete_many({"username": "testuser_files"})
-    rooms_collection.delete_many({"name": "Test File Room"})
-    files_collection.delete_many({"uploader": "testuser_files"})
+    db.users.delete_many({"username": "testuser_files"})
+    db.rooms.delete_many({"name": "Test File Room"})
+    db.files.delete_many({"uploader": "testuser_files"})
     yield
-    users_collection.delete_many({"username": "testuser_files"})
-    rooms_collection.delete_many({"name": "Test File Room"})
-    files_collection.delete_many({"uploader": "testuser_files"})
+    db.users.delete_many({"username": "testuser_files"})
+    db.rooms.delete_many({"name": "Test File Room"})
+    db.files.delete_many({"uploader": "testuser_files"})
 
 
-def test_file_upload_flow():
+def test_file_upload_flow(client):
     # 1. Signup
     response = client.post("/api/signup", json={
         "username": "testuser_files",
@@ -66,9 +61,9 @@ def test_file_upload_flow():
     assert response.content == file_content
 
 
-def test_file_upload_invalid_type():
+def test_file_upload_invalid_type(client, db):
     # 1. Signup & Login
-    users_collection.delete_many({"username": "testuser_files2"})
+    db.users.delete_many({"username": "testuser_files2"})
     
     client.post("/api/signup", json={
         "username": "testuser_files2",
@@ -94,5 +89,5 @@ def test_file_upload_invalid_type():
     assert "not allowed" in response.json()["detail"]
 
     # Cleanup
-    users_collection.delete_many({"username": "testuser_files2"})
-    rooms_collection.delete_many({"name": "Test File Room 2"})
+    db.users.delete_many({"username": "testuser_files2"})
+    db.rooms.delete_many({"name": "Test File Room 2"})
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import pytest
+from datetime import datetime, UTC
+
+from bson import ObjectId
+
+from tests.conftest import FakeWebSocket, make_manager, wait_for
+from utils.ConnectionManager import ConnectionManager
+from utils.history_cache import HistoryCache, decode_cursor, encode_cursor, history_entry
+
+
+class FakeLoader:
+    """Stands in for Mongo: a list of (message_id, entry) per room, with a query counter"""
+    def __init__(self, delay: float = 0):
+        self.rooms = {}
+        self.queries = 0
+        self.delay = delay
+
+    def add(self, room_id: str, message_id: str, text: str, second: int, seq: int = None):
+        doc = {"user": "alice", "msg": text, "timestamp": datetime(2024, 1, 1, 0, 0, second), "seq": seq}
+        self.rooms.setdefault(room_id, []).append((message_id, history_entry(doc)))
+
+    async def __call__(self, room_id: str, limit: int):
+        self.queries += 1
+        await asyncio.sleep(self.delay)
+        return self.rooms.get(room_id, [])[-limit:]
+
+
+def messages(entries):
+    return [json.loads(text)["msg"] for text in entries]
+
+
+async def test_concurrent_misses_share_one_query():
+    loader = FakeLoader(delay=0.05)
+    loader.add("r", "1", "hello", 1)
+    cache = HistoryCache(ConnectionManager(), loader)
+
+    results = await asyncio.gather(*(cache.get("r") for _ in range(50)))
+    assert loader.queries == 1
+    assert all(messages(r) == ["hello"] for r in results)
+    assert cache.stats["coalesced"] == 49
+
+    # Without Redis this instance sees every message, so the room stays cached
+    await cache.get("r")
+    assert loader.queries == 1
+
+
+async def test_appends_survive_a_load_that_misses_them():
+    loader = FakeLoader(delay=0.05)
+    loader.add("r", "1", "stored", 1)
+    cache = HistoryCache(ConnectionManager(), loader, size=3)
+
+    # Still queued in the write-behind writer when the query runs
+    cache.append("r", "2", history_entry({"user": "bob", "msg": "queued", "timestamp": datetime(2024, 1, 1, 0, 0, 2, tzinfo=UTC)}))
+    assert messages(await cache.get("r")) == ["stored", "queued"]
+
+    for i in range(3, 6):
+        cache.append("r", str(i), history_entry({"user": "bob", "msg": f"m{i}", "timestamp": datetime(2024, 1, 1, 0, 0, i)}))
+    assert messages(await cache.get("r")) == ["m3", "m4", "m5"]
+    assert cache.bytes == sum(len(text) for text in await cache.get("r"))
+
+
+async def test_rooms_are_evicted_least_recently_used_by_bytes():
+    loader = FakeLoader()
+    for room in "abc":
+        loader.add(room, room, "x" * 100, 1)
+    size = len(json.dumps(loader.rooms["a"][0][1]))
+    cache = HistoryCache(ConnectionManager(), loader, max_bytes=size * 2)
+
+    await cache.get("a")
+    await cache.get("b")
+    await cache.get("a")
+    await cache.get("c")
+    assert set(cache._rooms) == {"a", "c"}
+    assert cache.stats["evictions"] == 1
+    assert cache.bytes <= size * 2
+
+
+async def test_instances_share_new_messages_and_invalidations(redis_server):
+    a, b = await make_manager("channel"), await make_manager("channel")
+    loader = FakeLoader()
+    loader.add("r", "1", "stored", 1)
+    cache_a, cache_b = HistoryCache(a, loader), HistoryCache(b, loader)
+    try:
+        await a.connect(FakeWebSocket(), "r")
+        await b.connect(FakeWebSocket(), "r")
+        await wait_for(lambda: a.stats["subscribes"] and b.stats["subscribes"])
+        await asyncio.sleep(0.05)
+        assert messages(await cache_b.get("r")) == ["stored"]
+
+        # B picks the message up from the chat broadcast itself: one publish, nothing extra
+        publishes = redis_server.commands["PUBLISH"]
+        entry = history_entry({"user": "bob", "msg": "from a", "timestamp": datetime(2024, 1, 1, 0, 0, 2), "seq": 2})
+        cache_a.append("r", "2", entry)
+        await a.broadcast_json({"type": "chat", "id": "2", **entry}, "r")
+        await a.broadcast_json({"type": "chat", "user": "system", "msg": "carol joined"}, "r")
+        await wait_for(lambda: redis_server.commands["PUBLISH"] == publishes + 2)
+        await wait_for(lambda: len(cache_b._rooms["r"].entries) == 2)
+        assert messages(await cache_b.get("r")) == ["stored", "from a"]
+        assert loader.queries == 1
+
+        cache_a.invalidate("r")
+        await wait_for(lambda: "r" not in cache_b._rooms)
+    finally:
+        await a.shutdown()
+        await b.shutdown()
+
+
+async def test_room_without_local_sockets_goes_stale(redis_server):
+    manager = await make_manager("channel")
+    loader = FakeLoader()
+    loader.add("r", "1", "stored", 1)
+    cache = HistoryCache(manager, loader, stale_seconds=0.1)
+    try:
+        # Nobody here is in the room, so other instances' messages may not reach us
+        await cache.get("r")
+        await cache.get("r")
+        assert loader.queries == 1
+        await asyncio.sleep(0.15)
+        await cache.get("r")
+        assert loader.queries == 2
+
+        # Once serving the room, live updates keep the buffer current
+        await manager.connect(FakeWebSocket(), "r")
+        await cache.get("r")
+        await asyncio.sleep(0.15)
+        await cache.get("r")
+        assert loader.queries == 3
+    finally:
+        await manager.shutdown()
+
+
+async def test_resync_sends_only_what_was_missed():
+    loader = FakeLoader()
+    loader.add("r", "0", "before sequences", 0)
+    for i in range(1, 6):
+        loader.add("r", str(i), f"m{i}", i, seq=i)
+    cache = HistoryCache(ConnectionManager(), loader, size=4)
+
+    assert await cache.since("r", 5, max_gap=10) == []
+    assert messages(await cache.since("r", 3, max_gap=10)) == ["m4", "m5"]
+    # Too many missed, or older than the buffer reaches: the client must refetch
+    assert await cache.since("r", 3, max_gap=1) is None
+    assert await cache.since("r", 0, max_gap=10) is None
+
+    # The whole room fits in the buffer, so anything after last_seq is there
+    small = HistoryCache(ConnectionManager(), loader, size=10)
+    assert messages(await small.since("r", 0, max_gap=10)) == ["m1", "m2", "m3", "m4", "m5"]
+
+
+def test_cursor_round_trips_and_rejects_garbage():
+    message_id = ObjectId()
+    entry = history_entry({"user": "u", "msg": "m", "timestamp": datetime(2024, 5, 6, 7, 8, 9, 123456, tzinfo=UTC)})
+    cursor = encode_cursor(entry["timestamp"], str(message_id))
+    assert decode_cursor(cursor) == (datetime(2024, 5, 6, 7, 8, 9, 123000), message_id)
+
+    for garbage in ("", "abc", "!!!!", cursor + "AA"):
+        with pytest.raises(ValueError):
+            decode_cursor(garbage)
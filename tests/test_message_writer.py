@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from repositories import messages as messages_repo
+from utils.message_writer import BatchedMessageWriter
+
+
+class RecordingStore:
+    def __init__(self, delay: float = 0, fail_indexes=(), duplicate_indexes=()):
+        self.batches = []
+        self.delay = delay
+        self.fail_indexes = set(fail_indexes)
+        self.duplicate_indexes = set(duplicate_indexes)
+
+    async def insert_many(self, docs):
+        await asyncio.sleep(self.delay)
+        self.batches.append(list(docs))
+        errors = [{"index": i, "code": 2, "errmsg": "bad document"} for i in self.fail_indexes if i < len(docs)]
+        errors += [{"index": i, "code": 11000, "errmsg": "duplicate"} for i in self.duplicate_indexes if i < len(docs)]
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+async def test_flushes_every_n_messages_or_m_milliseconds():
+    store = RecordingStore()
+    writer = BatchedMessageWriter(store.insert_many, batch_size=100, flush_ms=30)
+
+    futures = [await writer.submit({"n": i}) for i in range(250)]
+    await asyncio.gather(*futures)
+    assert [len(b) for b in store.batches] == [100, 100, 50]
+    assert [doc["n"] for batch in store.batches for doc in batch] == list(range(250))
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await (await writer.submit({"n": "late"}))
+    assert loop.time() - start >= 0.025
+    assert writer.stats["batches"] == 4
+    assert writer.stats["largest_batch"] == 100
+    await writer.stop()
+
+
+async def test_slow_store_applies_bounded_backpressure():
+    store = RecordingStore(delay=0.02)
+    writer = BatchedMessageWriter(store.insert_many, batch_size=10, flush_ms=5, queue_limit=20)
+
+    futures = [await writer.submit({"n": i}) for i in range(100)]
+    assert writer.stats["queue_high_water"] <= 20
+    assert writer.stats["backpressure_waits"] > 0
+    await asyncio.gather(*futures)
+    assert writer.stats["written"] == 100
+    await writer.stop()
+
+
+async def test_partial_failures_only_fail_their_own_messages():
+    store = RecordingStore(fail_indexes=[1], duplicate_indexes=[2])
+    writer = BatchedMessageWriter(store.insert_many, batch_size=3, flush_ms=5)
+
+    futures = [await writer.submit({"n": i}) for i in range(3)]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    assert results[0] is None
+    assert isinstance(results[1], RuntimeError)
+    # A duplicate key means an earlier attempt already stored the message
+    assert results[2] is None
+    assert writer.stats["failed"] == 1
+    await writer.stop()
+
+
+async def test_sender_whose_loop_is_gone_does_not_stop_the_writer():
+    store = RecordingStore()
+    writer = BatchedMessageWriter(store.insert_many, batch_size=10, flush_ms=5)
+
+    # Queued by a request whose event loop has since closed
+    gone = asyncio.new_event_loop()
+    orphan = gone.create_future()
+    gone.close()
+    await writer.submit({"n": 0})
+    writer._queue.append(({"n": 1}, orphan))
+
+    await asyncio.wait_for(await writer.submit({"n": 2}), 1)
+    await asyncio.wait_for(await writer.submit({"n": 3}), 1)
+    assert writer.stats["written"] == 4
+    assert not orphan.done()
+    await writer.stop()
+
+
+def test_stop_drains_queue_into_mongo(run, db):
+    db.messages.delete_many({"room_id": "writer-room"})
+    writer = BatchedMessageWriter(messages_repo.insert_many, batch_size=500, flush_ms=10_000)
+
+    async def submit_and_stop():
+        for i in range(1200):
+            await writer.submit({"room_id": "writer-room", "user": "u", "msg": str(i)})
+        await writer.stop()
+
+    try:
+        run(submit_and_stop)
+        assert db.messages.count_documents({"room_id": "writer-room"}) == 1200
+        assert writer.stats["batches"] == 3
+    finally:
+        db.messages.delete_many({"room_id": "writer-room"})
+
+
+def test_rejects_unknown_durability_mode():
+    with pytest.raises(ValueError):
+        BatchedMessageWriter(RecordingStore().insert_many, durability="eventually")
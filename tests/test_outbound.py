@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+from utils.outbound import ConnectionWriter, Frame
+
+
+class BlockedWebSocket:
+    """Accepts sends only after `release` is set"""
+
+    def __init__(self):
+        self.sent = []
+        self.release = asyncio.Event()
+
+    async def send_text(self, message: str):
+        await self.release.wait()
+        self.sent.append(message)
+
+
+def chat(i):
+    return Frame(json.dumps({"type": "chat", "msg": str(i)}))
+
+
+def typing(user):
+    return Frame(json.dumps({"type": "typing", "user": user, "status": True}))
+
+
+async def drain(ws, writer):
+    ws.release.set()
+    for _ in range(100):
+        if not len(writer):
+            break
+        await asyncio.sleep(0.01)
+
+
+async def test_frame_detects_typing_events():
+    assert typing("alice").droppable
+    assert not chat(1).droppable
+
+
+async def test_drop_oldest_keeps_newest_frames():
+    ws = BlockedWebSocket()
+    writer = ConnectionWriter(ws, lambda _: None, max_queue=3, policy="drop_oldest")
+    writer.enqueue(chat(0))
+    await asyncio.sleep(0)
+    for i in range(1, 6):
+        writer.enqueue(chat(i))
+    await drain(ws, writer)
+    # The first frame was already in flight when the queue filled up
+    assert [json.loads(m)["msg"] for m in ws.sent] == ["0", "3", "4", "5"]
+    assert writer.dropped == 2
+    writer.close()
+
+
+async def test_drop_typing_evicts_typing_before_chat():
+    ws = BlockedWebSocket()
+    writer = ConnectionWriter(ws, lambda _: None, max_queue=3, policy="drop_typing")
+    writer.enqueue(chat(0))
+    await asyncio.sleep(0)
+    writer.enqueue(typing("bob"))
+    writer.enqueue(chat(1))
+    writer.enqueue(chat(2))
+    writer.enqueue(chat(3))
+    writer.enqueue(typing("carol"))
+    await drain(ws, writer)
+    assert [json.loads(m).get("msg") for m in ws.sent] == ["0", "1", "2", "3"]
+    writer.close()
+
+
+async def test_newest_typing_frame_replaces_queued_ones():
+    ws = BlockedWebSocket()
+    writer = ConnectionWriter(ws, lambda _: None, max_queue=3, policy="drop_typing")
+    writer.enqueue(chat(0))
+    await asyncio.sleep(0)
+    writer.enqueue(typing("bob"))
+    writer.enqueue(chat(1))
+    writer.enqueue(chat(2))
+    assert writer.enqueue(typing("carol"))
+    await drain(ws, writer)
+    assert [json.loads(m).get("msg") or json.loads(m)["user"] for m in ws.sent] == ["0", "1", "2", "carol"]
+    assert writer.dropped == 1
+    writer.close()
+
+
+async def test_disconnect_policy_evicts_after_backlog():
+    ws = BlockedWebSocket()
+    evicted = []
+    writer = ConnectionWriter(ws, evicted.append, max_queue=100, policy="disconnect", max_backlog_ms=20)
+    writer.enqueue(chat(0))
+    await asyncio.sleep(0)
+    writer.enqueue(chat(1))
+    await asyncio.sleep(0.05)
+    assert not writer.enqueue(chat(2))
+    assert evicted == [ws]
+    writer.close()
+
+
+async def test_send_failure_evicts_connection():
+    class BrokenWebSocket:
+        async def send_text(self, message: str):
+            raise RuntimeError("socket closed")
+
+    evicted = []
+    ws = BrokenWebSocket()
+    writer = ConnectionWriter(ws, evicted.append)
+    writer.enqueue(chat(0))
+    await asyncio.sleep(0.01)
+    assert evicted == [ws]
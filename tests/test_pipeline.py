@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from utils.chatbot import ai_bot
+from utils.pipeline import Pipeline, Stage
+
+
+async def test_items_with_one_key_stay_in_order_across_stages():
+    seen = []
+
+    async def slow_for_a(item):
+        await asyncio.sleep(0.02 if item[0] == "a" else 0)
+        return item
+
+    async def record(item):
+        seen.append(item)
+
+    pipeline = Pipeline(Stage("first", slow_for_a, workers=2), Stage("second", record, workers=2))
+    for i in range(5):
+        await pipeline.submit("a", ("a", i))
+        await pipeline.submit("b", ("b", i))
+    await pipeline.stop()
+
+    assert [i for key, i in seen if key == "a"] == list(range(5))
+    assert [i for key, i in seen if key == "b"] == list(range(5))
+    # "b" never waited behind the slow "a" items
+    assert seen.index(("b", 4)) < seen.index(("a", 0))
+    snapshot = pipeline.snapshot()
+    assert snapshot["first"]["processed"] == 10 and snapshot["first"]["depth"] == 0
+    assert snapshot["first"]["latency_p99_ms"] >= 20
+
+
+async def test_full_stage_applies_backpressure_or_drops():
+    release = asyncio.Event()
+
+    async def blocked(item):
+        await release.wait()
+
+    waiting = Stage("waiting", blocked, workers=1, queue_size=2)
+    await waiting.put("k", 1)
+    await waiting.put("other", 2)
+    third = asyncio.create_task(waiting.put("k", 3))
+    await asyncio.sleep(0.02)
+    assert not third.done()
+
+    dropping = Stage("dropping", blocked, workers=1, queue_size=1, drop_when_full=True)
+    assert [await dropping.put(None, i) for i in range(3)] == [True, False, False]
+    assert dropping.stats["dropped"] == 2
+
+    release.set()
+    await third
+    await waiting.cancel()
+    await dropping.cancel()
+
+
+async def test_failing_item_is_reported_and_does_not_stop_the_stage():
+    handled, failed = [], []
+
+    async def handler(item):
+        if item == "bad":
+            raise ValueError("boom")
+        handled.append(item)
+
+    async def on_error(item, error):
+        failed.append((item, str(error)))
+
+    stage = Stage("fragile", handler, workers=1, on_error=on_error)
+    pipeline = Pipeline(stage)
+    await pipeline.submit("k", "bad")
+    await pipeline.submit("k", "good")
+    await stage.drain()
+    assert handled == ["good"] and failed == [("bad", "boom")]
+    assert stage.stats["errors"] == 1
+
+    await pipeline.stop()
+    assert await pipeline.submit("k", "late") is False
+    assert stage.stats["rejected"] == 1 and handled == ["good"]
+
+
+@pytest.fixture
+def bot_takes_a_while(monkeypatch, db):
+    async def get_response(message, username):
+        await asyncio.sleep(0.5)
+        return "bot reply"
+
+    monkeypatch.setattr(ai_bot, "enabled", True)
+    monkeypatch.setattr(ai_bot, "get_response", get_response)
+    monkeypatch.setenv("ADMIN_USERNAME", "pipeline_user")
+    db.users.delete_many({"username": "pipeline_user"})
+    yield
+    db.users.delete_many({"username": "pipeline_user"})
+    db.rooms.delete_many({"name": "Pipeline Room"})
+
+
+def test_slow_bot_does_not_hold_up_the_senders_next_message(client, bot_takes_a_while):
+    client.post("/api/signup", json={"username": "pipeline_user", "password": "password123"})
+    token = client.post("/api/signin", data={"username": "pipeline_user", "password": "password123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    room_id = client.post("/api/rooms/create", json={"name": "Pipeline Room"}, headers=headers).json()["room_id"]
+
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "chat", "msg": "/bot are you there?"})
+        websocket.send_json({"type": "chat", "msg": "right after"})
+        chats = []
+        while "bot reply" not in chats:
+            frame = websocket.receive_json()
+            if frame["type"] == "chat":
+                chats.append(frame["msg"])
+    assert chats.index("right after") < chats.index("bot reply")
+
+    metrics = client.get("/api/admin/metrics", headers=headers).json()
+    assert set(metrics["pipeline"]) == {"enrich", "persist", "fan_out", "side_effects"}
+    assert metrics["bot"]["completed"] >= 1
+    assert metrics["message_writer"]["submitted"] >= 3
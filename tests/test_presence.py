@@ -0,0 +1,98 @@
+import asyncio
+
+from tests.conftest import make_manager
+from utils.ConnectionManager import ConnectionManager
+from utils.presence import PresenceService
+
+
+class FakeUsersRepo:
+    def __init__(self):
+        self.bulk_writes = []
+
+    async def update_last_active(self, last_active):
+        self.bulk_writes.append(dict(last_active))
+
+
+async def test_presence_is_refcounted_across_rooms_and_instances(redis_server):
+    a, b = await make_manager("channel"), await make_manager("channel")
+    users = FakeUsersRepo()
+    presence_a = PresenceService(a, users, heartbeat=0.05, ttl=1)
+    presence_b = PresenceService(b, users, heartbeat=0.05, ttl=1)
+    await presence_a.start()
+    await presence_b.start()
+    try:
+        # alice: two tabs on A and one on B
+        await presence_a.connect("alice")
+        await presence_a.connect("alice")
+        await presence_b.connect("alice")
+        await presence_b.connect("bob")
+        assert await presence_a.online_users() == {"alice", "bob"}
+
+        await presence_a.disconnect("alice")
+        await presence_b.disconnect("alice")
+        assert await presence_b.online_users() == {"alice", "bob"}
+
+        await presence_a.disconnect("alice")
+        assert await presence_b.online_users() == {"bob"}
+        assert users.bulk_writes == []
+    finally:
+        await presence_a.stop()
+        await presence_b.stop()
+        await a.shutdown()
+        await b.shutdown()
+
+
+async def test_dead_instance_drops_out_after_ttl(redis_server):
+    a, b = await make_manager("channel"), await make_manager("channel")
+    presence_a = PresenceService(a, FakeUsersRepo(), heartbeat=0.05, ttl=0.3)
+    presence_b = PresenceService(b, FakeUsersRepo(), heartbeat=0.05, ttl=0.3)
+    await presence_a.start()
+    await presence_b.start()
+    try:
+        await presence_a.connect("alice")
+        await presence_b.connect("bob")
+        assert await presence_b.online_users() == {"alice", "bob"}
+
+        # A crashes: no disconnects, no deregistration, heartbeats simply stop
+        presence_a._task.cancel()
+        await a.shutdown()
+        await asyncio.sleep(0.5)
+        assert await presence_b.online_users() == {"bob"}
+        assert redis_server._cmd_exists(f"presence:instance:{a.instance_id}") == 0
+    finally:
+        await presence_b.stop()
+        await b.shutdown()
+
+
+async def test_clean_shutdown_deregisters_immediately(redis_server):
+    a, b = await make_manager("channel"), await make_manager("channel")
+    presence_a = PresenceService(a, FakeUsersRepo(), heartbeat=10, ttl=30)
+    presence_b = PresenceService(b, FakeUsersRepo(), heartbeat=10, ttl=30)
+    await presence_a.start()
+    await presence_b.start()
+    try:
+        await presence_a.connect("alice")
+        await presence_a.stop()
+        assert await presence_b.online_users() == set()
+    finally:
+        await presence_b.stop()
+        await a.shutdown()
+        await b.shutdown()
+
+
+async def test_reconnect_storm_flushes_last_active_in_one_bulk_write():
+    manager = ConnectionManager(batch_mode="off")
+    users = FakeUsersRepo()
+    presence = PresenceService(manager, users)
+
+    for _ in range(20):
+        for i in range(50):
+            await presence.connect(f"user{i}")
+        for i in range(50):
+            await presence.disconnect(f"user{i}")
+    assert await presence.online_users() == set()
+
+    assert await presence.flush() == 50
+    assert len(users.bulk_writes) == 1
+    assert len(users.bulk_writes[0]) == 50
+    assert await presence.flush() == 0
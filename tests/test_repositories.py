@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, UTC
+
+from bson import ObjectId
+
+from repositories import messages as messages_repo, rooms as rooms_repo, users as users_repo
+
+
+def test_recent_messages_are_oldest_first_and_limited(run, db):
+    db.messages.delete_many({"room_id": "repo-room"})
+    start = datetime.now(UTC)
+    db.messages.insert_many([
+        {"room_id": "repo-room", "user": "u", "msg": str(i), "timestamp": start + timedelta(seconds=i)}
+        for i in range(5)
+    ])
+    try:
+        recent = run(messages_repo.recent, "repo-room", 3)
+        assert [m["msg"] for m in recent] == ["2", "3", "4"]
+    finally:
+        db.messages.delete_many({"room_id": "repo-room"})
+
+
+def test_pages_walk_back_through_timestamp_ties_without_gaps(run, db):
+    db.messages.delete_many({"room_id": "repo-room"})
+    start = datetime(2024, 1, 1)
+    # Three messages per millisecond: only _id tells them apart
+    db.messages.insert_many([
+        {"_id": ObjectId(), "room_id": "repo-room", "user": "u", "msg": str(i), "timestamp": start + timedelta(milliseconds=i // 3)}
+        for i in range(10)
+    ])
+    try:
+        seen, before = [], None
+        while True:
+            page = run(messages_repo.page_before, "repo-room", before, 4)
+            seen = [m["msg"] for m in page] + seen
+            if len(page) < 4:
+                break
+            before = (page[0]["timestamp"], page[0]["_id"])
+        assert seen == [str(i) for i in range(10)]
+        assert "room_id" not in page[0]
+    finally:
+        db.messages.delete_many({"room_id": "repo-room"})
+
+
+def test_count_by_user_is_one_aggregation(run, db):
+    db.messages.delete_many({"user": {"$in": ["repo-a", "repo-b"]}})
+    db.messages.insert_many([{"user": "repo-a"}, {"user": "repo-a"}, {"user": "repo-b"}])
+    try:
+        assert run(messages_repo.count_by_user, ["repo-a", "repo-b", "repo-c"]) == {"repo-a": 2, "repo-b": 1}
+    finally:
+        db.messages.delete_many({"user": {"$in": ["repo-a", "repo-b"]}})
+
+
+def test_add_member_is_idempotent(run, db):
+    db.rooms.delete_many({"room_id": "repo-room"})
+    run(rooms_repo.create, {"room_id": "repo-room", "invite_code": "repo-inv", "members": ["owner"]})
+    try:
+        run(rooms_repo.add_member, "repo-room", "guest")
+        run(rooms_repo.add_member, "repo-room", "guest")
+        assert run(rooms_repo.find_by_room_id, "repo-room")["members"] == ["owner", "guest"]
+        assert [r["room_id"] for r in run(rooms_repo.list_for_member, "guest")] == ["repo-room"]
+    finally:
+        db.rooms.delete_many({"room_id": "repo-room"})
+
+
+def test_last_active_bulk_update_never_moves_backwards(run, db):
+    db.users.delete_many({"username": {"$in": ["repo-u1", "repo-u2"]}})
+    db.users.insert_many([{"username": "repo-u1"}, {"username": "repo-u2"}])
+    now = datetime.now(UTC).replace(microsecond=0)
+    try:
+        run(users_repo.update_last_active, {"repo-u1": now, "repo-u2": now})
+        run(users_repo.update_last_active, {"repo-u1": now - timedelta(minutes=5)})
+        stored = {u["username"]: u["last_active"] for u in db.users.find({"username": {"$in": ["repo-u1", "repo-u2"]}})}
+        assert stored == {"repo-u1": now.replace(tzinfo=None), "repo-u2": now.replace(tzinfo=None)}
+    finally:
+        db.users.delete_many({"username": {"$in": ["repo-u1", "repo-u2"]}})
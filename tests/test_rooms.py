@@ -1,20 +1,18 @@
-import pytest
-from fastapi.testclient import TestClient
-from main import app
-from config.database import users_collection, rooms_collection
+import time
 
-client = TestClient(app)
+import pytest
+from routes.chat import history_cache, manager as chat_manager
 
 @pytest.fixture(autouse=True)
-def cleanup():
+def cleanup(db):
     # Cleanup before/after tests
-    users_collection.delete_many({"username": "testuser_rooms"})
-    rooms_collection.delete_many({"name": "Test Room"})
+    db.users.delete_many({"username": "testuser_rooms"})
+    db.rooms.delete_many({"name": "Test Room"})
     yield
-    users_collection.delete_many({"username": "testuser_rooms"})
-    rooms_collection.delete_many({"name": "Test Room"})
+    db.users.delete_many({"username": "testuser_rooms"})
+    db.rooms.delete_many({"name": "Test Room"})
 
-def test_room_flow():
+def test_room_flow(client, db):
     # 1. Signup
     response = client.post("/api/signup", json={
         "username": "testuser_rooms",
@@ -72,4 +70,55 @@ def test_room_flow():
         has_msg = any(m.get("type") == "chat" and m.get("msg") == "Hello Room" for m in received)
         
         assert has_join
-        assert has_msg
\ No newline at end of file
+        assert has_msg
+    # 6. History is served on rejoin and over REST
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}") as websocket:
+        data = websocket.receive_json()
+        assert data["type"] == "history"
+        assert any(m["msg"] == "Hello Room" for m in data["messages"])
+        last_seq = max(m["seq"] for m in data["messages"])
+
+    # 7. Reconnecting with last_seq only sends what was missed (nothing here)
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}&last_seq={last_seq}") as websocket:
+        data = websocket.receive_json()
+        assert data == {"type": "resync", "messages": [], "features": []}
+
+    # ...also once the cached history is dropped and reloaded from MongoDB
+    deadline = time.monotonic() + 2
+    while not db.messages.count_documents({"room_id": room_id}) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    client.portal.call(history_cache.invalidate, room_id)
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}&last_seq={last_seq - 1}") as websocket:
+        data = websocket.receive_json()
+        assert data["type"] == "resync"
+        assert [(m["msg"], m["seq"]) for m in data["messages"]] == [("Hello Room", last_seq)]
+
+    response = client.get(f"/api/history/{room_id}", headers=headers)
+    assert response.status_code == 200
+    assert any(m["msg"] == "Hello Room" for m in response.json()["messages"])
+
+    # 8. A resent message (same client_msg_id) is acknowledged but not stored or broadcast again
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "chat", "msg": "Only once", "client_msg_id": "resend-1"})
+        websocket.send_json({"type": "chat", "msg": "Only once", "client_msg_id": "resend-1"})
+        frames = []
+        while sum(f["type"] == "ack" for f in frames) < 2:
+            frames.append(websocket.receive_json())
+        acks = [f for f in frames if f["type"] == "ack"]
+        assert acks[0]["id"] == acks[1]["id"]
+        assert sum(f.get("msg") == "Only once" for f in frames) == 1
+
+    # 9. Frames that are valid JSON but not objects are ignored; the socket keeps working
+    with client.websocket_connect(f"/api/ws/{room_id}?token={token}") as websocket:
+        websocket.receive_json()
+        for text in ("[1]", "null", '"chat"'):
+            websocket.send_text(text)
+        websocket.send_json({"type": "chat", "msg": "Still here"})
+        while websocket.receive_json().get("msg") != "Still here":
+            pass
+    # ...and leaving cleans up the connection
+    deadline = time.monotonic() + 2
+    while client.portal.call(chat_manager.count, room_id) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.portal.call(chat_manager.count, room_id) == 0
@@ -0,0 +1,48 @@
+import asyncio
+
+from tests.conftest import make_manager
+from utils.ConnectionManager import ConnectionManager
+from utils.sequence import RoomSequencer
+
+
+def stored(highest: int):
+    async def stored_max(room_id: str) -> int:
+        await asyncio.sleep(0.01)
+        return highest
+    return stored_max
+
+
+async def test_local_counters_continue_from_mongo():
+    sequencer = RoomSequencer(ConnectionManager(), stored(41))
+    assert sorted(await asyncio.gather(*(sequencer.next("r") for _ in range(5)))) == [42, 43, 44, 45, 46]
+    assert await sequencer.next("other") == 42
+
+
+async def test_instances_share_one_counter_and_survive_a_lost_key(redis_server):
+    a, b = await make_manager("channel"), await make_manager("channel")
+    seq_a, seq_b = RoomSequencer(a, stored(0)), RoomSequencer(b, stored(0))
+    try:
+        numbers = await asyncio.gather(*(s.next("r") for s in (seq_a, seq_b) * 10))
+        assert sorted(numbers) == list(range(1, 21))
+
+        # Redis restarted empty: numbering picks up after what Mongo already holds
+        await a.redis.delete("room:seq:r")
+        seq_a._stored_max = stored(20)
+        assert await seq_a.next("r") == 21
+        assert await seq_b.next("r") == 22
+    finally:
+        await a.shutdown()
+        await b.shutdown()
+
+
+async def test_racing_first_messages_are_all_numbered_above_mongo(redis_server):
+    a, b = await make_manager("channel"), await make_manager("channel")
+    # Mongo is slow to answer, so every first message races the seeding
+    seq_a, seq_b = RoomSequencer(a, stored(40)), RoomSequencer(b, stored(40))
+    try:
+        numbers = await asyncio.gather(*(s.next("r") for s in (seq_a, seq_b) * 10))
+        assert sorted(numbers) == list(range(41, 61))
+        assert seq_a.stats["seeded"] + seq_b.stats["seeded"] == 1
+    finally:
+        await a.shutdown()
+        await b.shutdown()
@@ -0,0 +1,72 @@
+import json
+
+from tests.conftest import FakeWebSocket, make_manager, wait_for
+from utils.ConnectionManager import ConnectionManager
+from utils.typing_indicator import TypingTracker
+
+
+def frames(ws):
+    return [json.loads(m) for m in ws.sent]
+
+
+async def test_keystrokes_coalesce_into_one_frame():
+    manager = ConnectionManager(batch_mode="off")
+    tracker = TypingTracker(manager, ttl=5, interval_ms=20)
+    ws = FakeWebSocket()
+    await manager.connect(ws, "a")
+
+    for _ in range(20):
+        tracker.set_typing("a", "alice", True)
+    tracker.set_typing("a", "bob", True)
+    await wait_for(lambda: len(ws.sent) == 1)
+    assert frames(ws) == [{"type": "typing", "users": ["alice", "bob"]}]
+    assert tracker.stats["transitions"] == 2
+    assert tracker.stats["coalesced"] == 19
+
+    tracker.set_typing("a", "alice", False)
+    tracker.set_typing("a", "alice", False)
+    await wait_for(lambda: len(ws.sent) == 2)
+    assert frames(ws)[-1] == {"type": "typing", "users": ["bob"]}
+
+    await tracker.stop()
+    await manager.shutdown()
+
+
+async def test_typing_expires_without_stop():
+    manager = ConnectionManager(batch_mode="off")
+    tracker = TypingTracker(manager, ttl=0.05, interval_ms=20)
+    ws = FakeWebSocket()
+    await manager.connect(ws, "a")
+
+    tracker.set_typing("a", "alice", True)
+    await wait_for(lambda: len(ws.sent) == 2)
+    assert frames(ws) == [
+        {"type": "typing", "users": ["alice"]},
+        {"type": "typing", "users": []},
+    ]
+    assert tracker.typing_users("a") == []
+    await manager.shutdown()
+
+
+async def test_transitions_reach_other_instances(redis_server):
+    first, second = await make_manager("channel"), await make_manager("channel")
+    first_tracker = TypingTracker(first, interval_ms=20)
+    second_tracker = TypingTracker(second, interval_ms=20)
+    local, remote = FakeWebSocket(), FakeWebSocket()
+    try:
+        await first.connect(local, "a")
+        await second.connect(remote, "a")
+        await wait_for(lambda: len(redis_server.channels["chat_room_a"]) == 2)
+
+        for _ in range(10):
+            first_tracker.set_typing("a", "alice", True)
+        second_tracker.set_typing("a", "bob", True)
+        for ws in (local, remote):
+            await wait_for(lambda: ws.sent and frames(ws)[-1]["users"] == ["alice", "bob"])
+        # One publish per instance per interval, not per keystroke
+        await wait_for(lambda: redis_server.commands["PUBLISH"] == 2)
+    finally:
+        await first_tracker.stop()
+        await second_tracker.stop()
+        await first.shutdown()
+        await second.shutdown()
@@ -1,24 +1,136 @@
-from typing import List, Dict, Optional
+from collections import deque
+from itertools import count
+from typing import Callable, Deque, List, Dict, Optional, Set, Tuple
 from fastapi import WebSocket
 import asyncio
 import json
 import redis.asyncio as aioredis
 import os
+import uuid
+
+from utils.outbound import ConnectionWriter, Frame
+
+
+CHANNEL_PREFIX = "chat_room_"
+
+# How room channels are mapped onto Redis pub/sub:
+#   channel - SUBSCRIBE per room with local sockets, UNSUBSCRIBE when the last one leaves
+#   pattern - one PSUBSCRIBE chat_room_* per instance, rooms filtered locally
+#   sharded - Redis 7 SSUBSCRIBE/SPUBLISH per room (cluster-friendly)
+PUBSUB_MODES = ("channel", "pattern", "sharded")
+PUBLISH_MESSAGE_TYPES = ("message", "pmessage", "smessage")
+
+# Published messages are "<instance_id>\x1f<payload>" so an instance can skip its own
+# broadcasts, which it has already delivered locally. Untagged payloads are accepted as-is.
+ENVELOPE_SEPARATOR = "\x1f"
+PUBLISH_QUEUE_SIZE = int(os.getenv("REDIS_PUBLISH_QUEUE_SIZE", "10000"))
+PUBLISH_BATCH_SIZE = 100
+
+# Per-room micro-batching: events are collected for a short window and shipped as one
+# {"type": "batch"} frame to clients that negotiated it, and as one Redis publish
+# "<instance_id>\x1e<event>\x1e<event>...". Local clients without the feature get each
+# event straight away, unbatched; remote ones get single events once the batch arrives.
+#   off    - never batch
+#   auto   - batch a room while its event rate is above WS_BATCH_RATE_THRESHOLD events/sec
+#   always - batch every room
+BATCH_MODES = ("off", "auto", "always")
+BATCH_SEPARATOR = "\x1e"
+BATCH_WINDOW_MS = int(os.getenv("WS_BATCH_WINDOW_MS", "10"))
+BATCH_MAX_EVENTS = int(os.getenv("WS_BATCH_MAX_EVENTS", "50"))
+BATCH_RATE_THRESHOLD = int(os.getenv("WS_BATCH_RATE_THRESHOLD", "50"))
+
+# Control messages ("<instance_id>\x1d<json>") share the room channel but go to registered
+# handlers instead of sockets, so subsystems can sync per-room state between instances.
+CONTROL_SEPARATOR = "\x1d"
+# Instance ids are short; only look this far into a message for the envelope separator
+ENVELOPE_SCAN_LIMIT = 128
+
+
+class _RoomRate:
+    """One-second event counter for a room, with hysteresis on the batching switch"""
+    __slots__ = ("window_start", "count", "batching")
+
+    def __init__(self, now: float):
+        self.window_start = now
+        self.count = 0
+        self.batching = False
+
+    def hit(self, now: float) -> bool:
+        if now - self.window_start >= 1.0:
+            if self.count < BATCH_RATE_THRESHOLD // 2:
+                self.batching = False
+            self.window_start = now
+            self.count = 0
+        self.count += 1
+        if self.count >= BATCH_RATE_THRESHOLD:
+            self.batching = True
+        return self.batching
 
 
 class ConnectionManager:
     """
     Room-aware, async-safe WebSocket connection manager with Redis pub/sub.
-    Stores connections as: { room_id: [WebSocket, ...], ... }
+    Stores connections as: { room_id: {WebSocket: None, ...}, ... } (insertion-ordered sets)
+    plus a reverse index { WebSocket: {room_id, ...} }, so connect/disconnect are O(1).
+    Registry mutations never await, which keeps them atomic on the event loop without a lock.
     Uses Redis to sync messages across multiple server instances.
+    Every socket gets a ConnectionWriter so fan-out never waits on a slow client.
+    Broadcasts are delivered to local sockets first, then published for other instances.
     """
-    def __init__(self):
-        self._rooms: Dict[str, List[WebSocket]] = {}
-        self._lock = asyncio.Lock()
+    def __init__(self, pubsub_mode: Optional[str] = None, batch_mode: Optional[str] = None):
+        self.instance_id = os.getenv("INSTANCE_ID") or uuid.uuid4().hex
+        self._rooms: Dict[str, Dict[WebSocket, None]] = {}
+        self._socket_rooms: Dict[WebSocket, Set[str]] = {}
+        self._membership_count = 0
+        # Bumped each time a room gains its first local socket, so callers can tell an
+        # uninterrupted stretch of serving a room from one that had a gap
+        self._serving_epochs: Dict[str, int] = {}
+        self._epoch_counter = count(1)
+        # Copy-on-write broadcast snapshots, dropped on membership change and rebuilt on next send
+        self._snapshots: Dict[str, Tuple[ConnectionWriter, ...]] = {}
+        self._writers: Dict[WebSocket, ConnectionWriter] = {}
         self._redis_client: Optional[aioredis.Redis] = None
         self._pubsub: Optional[aioredis.client.PubSub] = None
+        self._pubsub_mode = (pubsub_mode or os.getenv("REDIS_PUBSUB_MODE", "channel")).lower()
+        if self._pubsub_mode not in PUBSUB_MODES:
+            raise ValueError(f"Unknown REDIS_PUBSUB_MODE '{self._pubsub_mode}', expected one of {PUBSUB_MODES}")
         self._subscribed_rooms: set = set()
+        self._subscription_lock = asyncio.Lock()
+        self._has_subscriptions = asyncio.Event()
         self._listener_task: Optional[asyncio.Task] = None
+        # Outgoing envelopes, published in order over one pipelined connection
+        self._publish_queue: Deque[Tuple[str, str]] = deque()
+        self._publish_ready = asyncio.Event()
+        self._publisher_task: Optional[asyncio.Task] = None
+        self._batch_mode = (batch_mode or os.getenv("WS_BATCH_MODE", "auto")).lower()
+        if self._batch_mode not in BATCH_MODES:
+            raise ValueError(f"Unknown WS_BATCH_MODE '{self._batch_mode}', expected one of {BATCH_MODES}")
+        self._room_rates: Dict[str, _RoomRate] = {}
+        self._pending_batches: Dict[str, List[str]] = {}
+        self._batch_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._control_handlers: List[Callable[[str, dict], None]] = []
+        self._event_handlers: List[Callable[[str, str], None]] = []
+        self.stats = {
+            "subscribes": 0,
+            "unsubscribes": 0,
+            "deliveries": 0,
+            "wasted_deliveries": 0,
+            "own_messages_skipped": 0,
+            "publish_failures": 0,
+            "publishes_dropped": 0,
+            "evicted_connections": 0,
+            "batches": 0,
+            "batched_events": 0,
+        }
+
+    @property
+    def redis(self) -> Optional[aioredis.Redis]:
+        """Shared Redis client for other subsystems, or None in single-instance mode"""
+        return self._redis_client
+
+    @staticmethod
+    def _channel(room_id: str) -> str:
+        return f"{CHANNEL_PREFIX}{room_id}"
 
     async def initialize_redis(self):
         """Initialize Redis connection for pub/sub"""
@@ -30,15 +142,34 @@ class ConnectionManager:
                 decode_responses=True
             )
             self._pubsub = self._redis_client.pubsub()
-            print(f"✓ Redis connected: {redis_url}")
-            # Start listener task
+            if self._pubsub_mode == "pattern":
+                await self._pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                self.stats["subscribes"] += 1
+                self._has_subscriptions.set()
+            print(f"✓ Redis connected: {redis_url} (pub/sub mode: {self._pubsub_mode})")
+            # Start listener and publisher tasks
             self._listener_task = asyncio.create_task(self._redis_listener())
+            self._publisher_task = asyncio.create_task(self._redis_publisher())
         except Exception as e:
             print(f"⚠️  Redis connection failed: {e}")
             print("   Running in single-instance mode (no horizontal scaling)")
             self._redis_client = None
             self._pubsub = None
 
+    async def _messages(self):
+        """
+        Blocking async iterator over pub/sub deliveries.
+        Parks on an event while nothing is subscribed instead of polling.
+        """
+        while True:
+            await self._has_subscriptions.wait()
+            response = await self._pubsub.parse_response(block=True)
+            # Subscribe confirmations are filtered here rather than by redis-py,
+            # which would also swallow sharded 'smessage' deliveries.
+            message = await self._pubsub.handle_message(response)
+            if message and message["type"] in PUBLISH_MESSAGE_TYPES:
+                yield message
+
     async def _redis_listener(self):
         """Background task that listens for Redis pub/sub messages"""
         if not self._pubsub:
@@ -47,80 +178,275 @@ class ConnectionManager:
         try:
             while True:
                 try:
-                    # Only try to get messages if we have subscriptions
-                    if len(self._subscribed_rooms) > 0:
-                        message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-                        if message and message['type'] == 'message':
-                            channel = message['channel']
-                            data = message['data']
-
-                            # Extract room_id from channel name (format: chat_room_{room_id})
-                            if channel.startswith("chat_room_"):
-                                room_id = channel[10:]  # Remove "chat_room_" prefix
-                                await self._broadcast_local(data, room_id)
-                    else:
-                        # No subscriptions yet, just wait
-                        await asyncio.sleep(1)
+                    async for message in self._messages():
+                        channel = message["channel"]
+                        # Extract room_id from channel name (format: chat_room_{room_id})
+                        if channel.startswith(CHANNEL_PREFIX):
+                            await self._deliver(channel[len(CHANNEL_PREFIX):], message["data"])
+                except asyncio.CancelledError:
+                    raise
                 except Exception as e:
-                    # Only log if it's not the "no subscription" error
-                    if "did you forget to call subscribe()" not in str(e):
-                        print(f"Redis listener error: {e}")
+                    print(f"Redis listener error: {e}")
                     await asyncio.sleep(1)
+                    await self._resubscribe_sharded()
         except asyncio.CancelledError:
             print("Redis listener stopped")
 
-    async def _broadcast_local(self, message: str, room_id: str):
-        """Broadcast message only to local WebSocket connections (called by Redis listener)"""
-        async with self._lock:
-            conns = list(self._rooms.get(room_id, []))
+    async def _redis_publisher(self):
+        """
+        Background task that publishes queued envelopes. A single pipelined connection
+        keeps Redis order identical to local delivery order, so every instance sees a
+        room's messages in the same sequence.
+        """
+        try:
+            while True:
+                await self._publish_ready.wait()
+                self._publish_ready.clear()
+                while self._publish_queue:
+                    batch = [
+                        self._publish_queue.popleft()
+                        for _ in range(min(len(self._publish_queue), PUBLISH_BATCH_SIZE))
+                    ]
+                    try:
+                        async with self._redis_client.pipeline(transaction=False) as pipe:
+                            for channel, envelope in batch:
+                                if self._pubsub_mode == "sharded":
+                                    pipe.execute_command("SPUBLISH", channel, envelope)
+                                else:
+                                    pipe.publish(channel, envelope)
+                            await pipe.execute()
+                    except Exception as e:
+                        # Local sockets already have these; only other instances miss out
+                        self.stats["publish_failures"] += len(batch)
+                        print(f"⚠️  Redis publish failed: {e}, {len(batch)} message(s) delivered locally only")
+        except asyncio.CancelledError:
+            pass
 
-        if conns:
-            await asyncio.gather(
-                *(self._safe_send(c, message) for c in conns),
-                return_exceptions=True
-            )
+    async def _deliver(self, room_id: str, message: str):
+        """Hand a Redis delivery to local sockets, counting ones for rooms we don't serve"""
+        self.stats["deliveries"] += 1
+        separator = None
+        for candidate in (ENVELOPE_SEPARATOR, BATCH_SEPARATOR, CONTROL_SEPARATOR):
+            index = message.find(candidate, 0, ENVELOPE_SCAN_LIMIT)
+            if index != -1:
+                separator = candidate
+                if message[:index] == self.instance_id:
+                    # Already delivered locally by broadcast()
+                    self.stats["own_messages_skipped"] += 1
+                    return
+                message = message[index + 1:]
+                break
+        if room_id not in self._rooms:
+            self.stats["wasted_deliveries"] += 1
+            return
+        if separator == CONTROL_SEPARATOR:
+            self._dispatch_control(room_id, message)
+        elif separator == BATCH_SEPARATOR:
+            events = message.split(BATCH_SEPARATOR)
+            self._broadcast_local_batch(events, room_id)
+            self._dispatch_events(room_id, events)
+        else:
+            self._broadcast_local(message, room_id)
+            self._dispatch_events(room_id, (message,))
+
+    def _dispatch_events(self, room_id: str, events):
+        for handler in self._event_handlers:
+            for event in events:
+                try:
+                    handler(room_id, event)
+                except Exception as e:
+                    print(f"Event handler error: {e}")
+
+    def _dispatch_control(self, room_id: str, message: str):
+        try:
+            obj = json.loads(message)
+        except json.JSONDecodeError:
+            return
+        for handler in self._control_handlers:
+            try:
+                handler(room_id, obj)
+            except Exception as e:
+                print(f"Control handler error: {e}")
+
+    def _snapshot(self, room_id: str) -> Tuple[ConnectionWriter, ...]:
+        writers = self._snapshots.get(room_id)
+        if writers is None:
+            conns = self._rooms.get(room_id)
+            if not conns:
+                return ()
+            writers = tuple(self._writers[c] for c in conns)
+            self._snapshots[room_id] = writers
+        return writers
+
+    def _broadcast_local(self, message: str, room_id: str, accepts_batches: Optional[bool] = None):
+        """
+        Broadcast message only to local WebSocket connections (called by broadcast and the Redis listener).
+        With accepts_batches, only to the connections that did (True) or did not (False) negotiate batches.
+        """
+        writers = self._snapshot(room_id)
+        if writers:
+            # Encode once; every recipient's queue shares the same frame
+            frame = Frame(message)
+            for writer in writers:
+                if accepts_batches is None or writer.accepts_batches == accepts_batches:
+                    writer.enqueue(frame)
+
+    def _broadcast_local_batch(self, events: List[str], room_id: str, batches_only: bool = False):
+        """
+        Deliver a batch: one shared array frame for clients that negotiated it, singles for the
+        rest (unless batches_only: those already got the events one by one)
+        """
+        writers = self._snapshot(room_id)
+        batch_frame = None
+        single_frames = None
+        for writer in writers:
+            if writer.accepts_batches:
+                if batch_frame is None:
+                    # Events are already JSON, so the array is spliced together rather than re-encoded
+                    batch_frame = Frame('{"type": "batch", "events": [' + ", ".join(events) + "]}", droppable=False)
+                writer.enqueue(batch_frame)
+            elif not batches_only:
+                if single_frames is None:
+                    single_frames = [Frame(event) for event in events]
+                for frame in single_frames:
+                    writer.enqueue(frame)
+
+    def _should_batch(self, room_id: str) -> bool:
+        if self._batch_mode == "off" or room_id not in self._rooms:
+            return False
+        if self._batch_mode == "always":
+            return True
+        rate = self._room_rates.get(room_id)
+        if rate is None:
+            rate = self._room_rates[room_id] = _RoomRate(asyncio.get_running_loop().time())
+        return rate.hit(asyncio.get_running_loop().time())
+
+    def _flush_batch(self, room_id: str):
+        timer = self._batch_timers.pop(room_id, None)
+        if timer is not None:
+            timer.cancel()
+        events = self._pending_batches.pop(room_id, None)
+        if not events:
+            return
+        if len(events) == 1:
+            self._broadcast_local(events[0], room_id, accepts_batches=True)
+            self._queue_publish(room_id, f"{self.instance_id}{ENVELOPE_SEPARATOR}{events[0]}")
+            return
+        self.stats["batches"] += 1
+        self.stats["batched_events"] += len(events)
+        self._broadcast_local_batch(events, room_id, batches_only=True)
+        self._queue_publish(room_id, self.instance_id + BATCH_SEPARATOR + BATCH_SEPARATOR.join(events))
 
-    async def _subscribe_to_room(self, room_id: str):
-        """Subscribe to Redis channel for a room"""
-        if self._pubsub and room_id not in self._subscribed_rooms:
-            channel = f"chat_room_{room_id}"
-            await self._pubsub.subscribe(channel)
-            self._subscribed_rooms.add(room_id)
-            print(f"📡 Subscribed to Redis channel: {channel}")
+    def _evict(self, websocket: WebSocket):
+        """Called by a ConnectionWriter whose client failed or fell too far behind"""
+        self.stats["evicted_connections"] += 1
+        asyncio.create_task(self.disconnect(websocket))
 
-    async def connect(self, websocket: WebSocket, room_id: str) -> None:
+    async def _sync_subscription(self, room_id: str):
+        """
+        Reconcile the room's Redis subscription with its local socket count.
+        The room's connection list is the ref-count: subscribe on the first local
+        socket, unsubscribe when the last one leaves. Pattern mode has nothing to do.
+        """
+        if not self._pubsub or self._pubsub_mode == "pattern":
+            return
+
+        async with self._subscription_lock:
+            wanted = room_id in self._rooms
+            if wanted == (room_id in self._subscribed_rooms):
+                return
+
+            channel = self._channel(room_id)
+            try:
+                if wanted:
+                    if self._pubsub_mode == "sharded":
+                        await self._pubsub.execute_command("SSUBSCRIBE", channel)
+                    else:
+                        await self._pubsub.subscribe(channel)
+                    self._subscribed_rooms.add(room_id)
+                    self.stats["subscribes"] += 1
+                    print(f"📡 Subscribed to Redis channel: {channel}")
+                else:
+                    if self._pubsub_mode == "sharded":
+                        await self._pubsub.execute_command("SUNSUBSCRIBE", channel)
+                    else:
+                        await self._pubsub.unsubscribe(channel)
+                    self._subscribed_rooms.discard(room_id)
+                    self.stats["unsubscribes"] += 1
+                    print(f"📴 Unsubscribed from Redis channel: {channel}")
+            except Exception as e:
+                print(f"⚠️  Redis subscription update failed for {channel}: {e}")
+
+            if self._subscribed_rooms:
+                self._has_subscriptions.set()
+            else:
+                self._has_subscriptions.clear()
+
+    async def _resubscribe_sharded(self):
+        """
+        redis-py restores SUBSCRIBE/PSUBSCRIBE state on reconnect but knows nothing
+        about raw SSUBSCRIBE calls, so re-issue them after a listener error.
+        """
+        if self._pubsub_mode != "sharded" or not self._subscribed_rooms:
+            return
+        async with self._subscription_lock:
+            channels = [self._channel(rid) for rid in self._subscribed_rooms]
+            try:
+                await self._pubsub.execute_command("SSUBSCRIBE", *channels)
+            except Exception as e:
+                print(f"⚠️  Redis resubscribe failed: {e}")
+
+    async def connect(self, websocket: WebSocket, room_id: str, batching: bool = False) -> None:
         await websocket.accept()
-        async with self._lock:
-            # Add to room
-            if room_id not in self._rooms:
-                self._rooms[room_id] = []
-            self._rooms[room_id].append(websocket)
+        conns = self._rooms.get(room_id)
+        if conns is None:
+            conns = self._rooms[room_id] = {}
+            self._serving_epochs[room_id] = next(self._epoch_counter)
+        if websocket not in conns:
+            conns[websocket] = None
+            self._socket_rooms.setdefault(websocket, set()).add(room_id)
+            self._membership_count += 1
+            self._snapshots.pop(room_id, None)
+        if websocket not in self._writers:
+            self._writers[websocket] = ConnectionWriter(websocket, self._evict, accepts_batches=batching)
 
         # Subscribe to Redis channel for this room
-        await self._subscribe_to_room(room_id)
+        await self._sync_subscription(room_id)
+
+    def _remove(self, websocket: WebSocket, room_id: str) -> bool:
+        """Drop one membership. Returns True if that emptied the room."""
+        conns = self._rooms.get(room_id)
+        if conns is None or conns.pop(websocket, False) is False:
+            return False
+        self._membership_count -= 1
+        self._snapshots.pop(room_id, None)
+        rooms = self._socket_rooms.get(websocket)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self._socket_rooms[websocket]
+        if not conns:
+            del self._rooms[room_id]
+            self._serving_epochs.pop(room_id, None)
+            self._room_rates.pop(room_id, None)
+            return True
+        return False
 
     async def disconnect(self, websocket: WebSocket, room_id: Optional[str] = None) -> None:
         """
         Remove websocket from the specified room.
-        If room_id is None, attempt to find the websocket in any room and remove it.
-        """
-        async with self._lock:
-            if room_id is not None:
-                conns = self._rooms.get(room_id)
-                if conns and websocket in conns:
-                    conns.remove(websocket)
-                    if not conns:
-                        self._rooms.pop(room_id, None)
-            else:
-                # find and remove from whichever room it's in
-                found_rooms = []
-                for rid, conns in list(self._rooms.items()):
-                    if websocket in conns:
-                        conns.remove(websocket)
-                        if not conns:
-                            found_rooms.append(rid)
-                for rid in found_rooms:
-                    self._rooms.pop(rid, None)
+        If room_id is None, remove it from every room it is in (via the reverse index).
+        """
+        room_ids = [room_id] if room_id is not None else list(self._socket_rooms.get(websocket, ()))
+        emptied_rooms = [rid for rid in room_ids if self._remove(websocket, rid)]
+
+        if websocket not in self._socket_rooms:
+            writer = self._writers.pop(websocket, None)
+            if writer is not None:
+                writer.close()
+        # Drop Redis subscriptions for rooms this instance no longer serves
+        for rid in emptied_rooms:
+            await self._sync_subscription(rid)
         # try to close socket (safe)
         try:
             await websocket.close()
@@ -128,76 +454,128 @@ class ConnectionManager:
             pass
 
     async def send_personal_message(self, message: str, websocket: WebSocket) -> None:
-        try:
-            await websocket.send_text(message)
-        except Exception:
-            await self.disconnect(websocket)
+        writer = self._writers.get(websocket)
+        if writer is not None:
+            # Keep ordering with room broadcasts already queued for this socket
+            writer.enqueue(Frame(message, droppable=False))
+            return
+        await self._safe_send(websocket, message)
 
     async def broadcast(self, message: str, room_id: str) -> None:
         """
         Broadcast plain text to all connections in a room.
-        Publishes to Redis if available for multi-instance scaling.
+        Local sockets get it immediately; it is then published to Redis, tagged with
+        this instance's id, for the other instances to pick up.
+        Busy rooms are micro-batched (see WS_BATCH_MODE).
         """
-        # If Redis is available, publish to Redis (other instances will pick it up)
-        if self._redis_client:
-            try:
-                channel = f"chat_room_{room_id}"
-                await self._redis_client.publish(channel, message)
-                print(f"📡 Published to Redis: {channel}")
-            except Exception as e:
-                print(f"⚠️  Redis publish failed: {e}, falling back to local broadcast")
-                # Fall back to local broadcast if Redis fails
-                await self._broadcast_local(message, room_id)
-        else:
-            # No Redis, just broadcast locally
-            await self._broadcast_local(message, room_id)
+        if self._should_batch(room_id):
+            # Only clients that negotiated batches (and the Redis publish) wait for the window
+            self._broadcast_local(message, room_id, accepts_batches=False)
+            pending = self._pending_batches.setdefault(room_id, [])
+            pending.append(message)
+            if len(pending) >= BATCH_MAX_EVENTS:
+                self._flush_batch(room_id)
+            elif len(pending) == 1:
+                self._batch_timers[room_id] = asyncio.get_running_loop().call_later(
+                    BATCH_WINDOW_MS / 1000, self._flush_batch, room_id
+                )
+            return
+
+        if room_id in self._pending_batches:
+            # The room just dropped out of batching; don't let this event overtake the batch
+            self._flush_batch(room_id)
+        self._deliver_and_publish(message, room_id)
+
+    def _deliver_and_publish(self, message: str, room_id: str):
+        # Nothing here suspends, so local order and publish order both match call order
+        self._broadcast_local(message, room_id)
+        self._queue_publish(room_id, f"{self.instance_id}{ENVELOPE_SEPARATOR}{message}")
+
+    def _queue_publish(self, room_id: str, envelope: str):
+        if not self._redis_client:
+            return
+        if len(self._publish_queue) >= PUBLISH_QUEUE_SIZE:
+            # Redis is down or far behind: shed the oldest rather than grow without bound
+            self._publish_queue.popleft()
+            self.stats["publishes_dropped"] += 1
+        self._publish_queue.append((self._channel(room_id), envelope))
+        self._publish_ready.set()
 
     async def broadcast_json(self, obj, room_id: str) -> None:
         payload = json.dumps(obj)
         await self.broadcast(payload, room_id)
 
+    def broadcast_local_json(self, obj, room_id: str) -> None:
+        """Send to this instance's sockets only; nothing is published"""
+        if room_id in self._rooms:
+            self._broadcast_local(json.dumps(obj), room_id)
+
+    def add_control_handler(self, handler: Callable[[str, dict], None]) -> None:
+        """Register handler(room_id, obj) for control messages published by other instances"""
+        self._control_handlers.append(handler)
+
+    def add_event_handler(self, handler: Callable[[str, str], None]) -> None:
+        """Register handler(room_id, event_json) for room events broadcast by other instances"""
+        self._event_handlers.append(handler)
+
+    def publish_control(self, obj, room_id: str) -> None:
+        """Publish a control message to the other instances serving this room"""
+        self._queue_publish(room_id, f"{self.instance_id}{CONTROL_SEPARATOR}{json.dumps(obj)}")
+
     async def _safe_send(self, connection: WebSocket, message: str) -> None:
         try:
             await connection.send_text(message)
         except Exception:
             await self.disconnect(connection)
 
+    def serving_epoch(self, room_id: str) -> Optional[int]:
+        """
+        None while this instance has no sockets in the room (and so may miss its traffic);
+        otherwise a number that changes every time it starts serving the room again.
+        """
+        return self._serving_epochs.get(room_id)
+
     async def is_connected(self, websocket: WebSocket, room_id: Optional[str] = None) -> bool:
-        async with self._lock:
-            if room_id is not None:
-                return websocket in self._rooms.get(room_id, [])
-            return any(websocket in conns for conns in self._rooms.values())
+        if room_id is not None:
+            return websocket in self._rooms.get(room_id, ())
+        return websocket in self._socket_rooms
 
     async def count(self, room_id: Optional[str] = None) -> int:
-        async with self._lock:
-            if room_id is not None:
-                return len(self._rooms.get(room_id, []))
-            return sum(len(conns) for conns in self._rooms.values())
+        if room_id is not None:
+            return len(self._rooms.get(room_id, ()))
+        return self._membership_count
 
     async def get_active_connections(self, room_id: Optional[str] = None) -> List[WebSocket]:
-        async with self._lock:
-            if room_id is not None:
-                return list(self._rooms.get(room_id, []))
-            # return flatten list of all connections
-            result: List[WebSocket] = []
-            for conns in self._rooms.values():
-                result.extend(conns)
-            return result
+        if room_id is not None:
+            return list(self._rooms.get(room_id, ()))
+        # return flatten list of all connections
+        result: List[WebSocket] = []
+        for conns in self._rooms.values():
+            result.extend(conns)
+        return result
 
     async def shutdown(self):
         """Cleanup Redis connections on shutdown"""
-        if self._listener_task:
-            self._listener_task.cancel()
-            try:
-                await self._listener_task
-            except asyncio.CancelledError:
-                pass
+        for room_id in list(self._pending_batches):
+            self._flush_batch(room_id)
+
+        for task in (self._listener_task, self._publisher_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
 
         if self._pubsub:
-            await self._pubsub.unsubscribe()
-            await self._pubsub.close()
+            # Closing the pub/sub connection drops every subscription, including sharded ones
+            await self._pubsub.aclose()
 
         if self._redis_client:
-            await self._redis_client.close()
+            await self._redis_client.aclose()
 
         print("✓ Redis connections closed")
@@ -0,0 +1,184 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+import asyncio
+import os
+import time
+
+
+# Gemini calls in flight at once, across all rooms
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "8"))
+# Jobs waiting for a worker; beyond this new requests are refused
+BOT_QUEUE_SIZE = int(os.getenv("BOT_QUEUE_SIZE", "100"))
+# Jobs (waiting or running) one room, or one user, may have at once
+BOT_MAX_PER_ROOM = int(os.getenv("BOT_MAX_PER_ROOM", "3"))
+BOT_MAX_PER_USER = int(os.getenv("BOT_MAX_PER_USER", "1"))
+# A job that waited longer than this for a worker is dropped: the chat has moved on
+BOT_MAX_QUEUE_SECONDS = float(os.getenv("BOT_MAX_QUEUE_SECONDS", "15"))
+
+
+class BotJob:
+    __slots__ = ("room_id", "user", "item", "enqueued", "task")
+
+    def __init__(self, room_id: Hashable, user: Hashable, item):
+        self.room_id = room_id
+        self.user = user
+        self.item = item
+        self.enqueued = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+
+class BotWorkerPool:
+    """
+    Runs bot requests off the chat path, on at most `workers` concurrent workers.
+
+    submit() never waits: a request over the room's or the user's limit, or arriving when
+    the queue is full, is refused at once. A queued job that waited longer than
+    max_queue_seconds is dropped when a worker reaches it. cancel_room() drops a room's
+    queued jobs and cancels its running ones. on_dropped(item, reason) is called for
+    refused and dropped jobs (not cancelled ones) so the asker can be told.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        on_dropped: Optional[Callable[[Any, str], Awaitable[None]]] = None,
+        workers: int = BOT_WORKERS,
+        queue_size: int = BOT_QUEUE_SIZE,
+        per_room: int = BOT_MAX_PER_ROOM,
+        per_user: int = BOT_MAX_PER_USER,
+        max_queue_seconds: float = BOT_MAX_QUEUE_SECONDS,
+    ):
+        self._handler = handler
+        self._on_dropped = on_dropped
+        self._workers = max(workers, 1)
+        self._queue_size = max(queue_size, 1)
+        self._per_room = max(per_room, 1)
+        self._per_user = max(per_user, 1)
+        self._max_queue_seconds = max_queue_seconds
+        self._queue: Deque[BotJob] = deque()
+        self._ready = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+        # Jobs waiting or running, per room (for cancel_room) and per user (for the limit)
+        self._rooms: Dict[Hashable, Set[BotJob]] = {}
+        self._users: Dict[Hashable, int] = {}
+        self._running = 0
+        self._closed = False
+        self.stats = {
+            "submitted": 0, "completed": 0, "errors": 0, "cancelled": 0,
+            "rejected_busy": 0, "rejected_room": 0, "rejected_user": 0, "expired": 0,
+        }
+
+    async def submit(self, room_id: Hashable, user: Hashable, item) -> bool:
+        """Queue a job; False (after on_dropped) if it was refused"""
+        if self._closed or len(self._queue) >= self._queue_size:
+            return await self._refuse(item, "busy")
+        if len(self._rooms.get(room_id, ())) >= self._per_room:
+            return await self._refuse(item, "room")
+        if self._users.get(user, 0) >= self._per_user:
+            return await self._refuse(item, "user")
+
+        job = BotJob(room_id, user, item)
+        self._rooms.setdefault(room_id, set()).add(job)
+        self._users[user] = self._users.get(user, 0) + 1
+        self._queue.append(job)
+        self.stats["submitted"] += 1
+        self._ready.set()
+        self._ensure_running()
+        return True
+
+    async def _refuse(self, item, reason: str) -> bool:
+        self.stats[f"rejected_{reason}"] += 1
+        await self._report(item, reason)
+        return False
+
+    async def _report(self, item, reason: str):
+        if self._on_dropped is None:
+            return
+        try:
+            await self._on_dropped(item, reason)
+        except Exception as e:
+            print(f"⚠️  Bot pool could not report a dropped job: {e}")
+
+    def _ensure_running(self):
+        # Workers are started on first use, so they belong to the loop serving requests
+        while len(self._tasks) < self._workers:
+            task = asyncio.create_task(self._work())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _work(self):
+        while True:
+            while not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+            job = self._queue.popleft()
+            try:
+                if time.monotonic() - job.enqueued > self._max_queue_seconds:
+                    self.stats["expired"] += 1
+                    await self._report(job.item, "expired")
+                    continue
+                await self._execute(job)
+            finally:
+                self._forget(job)
+
+    async def _execute(self, job: BotJob):
+        # The handler runs as its own task, so cancel_room() can stop it without killing the worker
+        job.task = asyncio.create_task(self._handler(job.item))
+        self._running += 1
+        try:
+            await asyncio.wait({job.task})
+        finally:
+            self._running -= 1
+        if job.task.cancelled():
+            self.stats["cancelled"] += 1
+        elif job.task.exception() is not None:
+            self.stats["errors"] += 1
+            print(f"⚠️  Bot job in room {job.room_id} failed: {job.task.exception()}")
+        else:
+            self.stats["completed"] += 1
+
+    def _forget(self, job: BotJob):
+        jobs = self._rooms.get(job.room_id)
+        if jobs is not None and job in jobs:
+            jobs.discard(job)
+            if not jobs:
+                del self._rooms[job.room_id]
+            count = self._users[job.user] - 1
+            if count:
+                self._users[job.user] = count
+            else:
+                del self._users[job.user]
+
+    def cancel_room(self, room_id: Hashable) -> int:
+        """Drop the room's queued jobs and cancel its running ones; returns how many"""
+        jobs = self._rooms.get(room_id)
+        if not jobs:
+            return 0
+        jobs = list(jobs)
+        for job in jobs:
+            if job.task is not None:
+                job.task.cancel()
+            else:
+                self._queue.remove(job)
+                self.stats["cancelled"] += 1
+                self._forget(job)
+        return len(jobs)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._queue),
+            "running": self._running,
+            "rooms": len(self._rooms),
+            "workers": self._workers,
+            **self.stats,
+        }
+
+    async def stop(self):
+        """Refuse new jobs and cancel everything queued or running"""
+        self._closed = True
+        for room_id in list(self._rooms):
+            self.cancel_room(room_id)
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        print("✓ Bot worker pool stopped")
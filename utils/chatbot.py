@@ -1,6 +1,14 @@
+import asyncio
+import hashlib
 import os
+import re
+import time
 import httpx
-from typing import Optional
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.circuit_breaker import CircuitBreaker
+from utils.token_bucket import TokenBucket
 
 # Try to load .env file for local development (optional, Docker uses env vars directly)
 try:
@@ -12,6 +20,151 @@ try:
 except ImportError:
     pass  # dotenv not installed, will use system env vars
 
+# HTTP/2 needs the optional h2 package; without it the pooled client keeps HTTP/1.1 connections alive
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Connections kept to Gemini, shared by every bot request
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_MAX_KEEPALIVE = int(os.getenv("GEMINI_MAX_KEEPALIVE", "10"))
+GEMINI_KEEPALIVE_SECONDS = float(os.getenv("GEMINI_KEEPALIVE_SECONDS", "60"))
+# Circuit breaker: consecutive failures before it opens, and how long it stays open
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+# Request timeout: twice the observed p99 latency, kept within these bounds
+GEMINI_TIMEOUT_MIN_SECONDS = float(os.getenv("GEMINI_TIMEOUT_MIN_SECONDS", "5"))
+GEMINI_TIMEOUT_MAX_SECONDS = float(os.getenv("GEMINI_TIMEOUT_MAX_SECONDS", "30"))
+# API quota: requests per minute with bursts of up to GEMINI_RATE_BURST, and the longest
+# a request waits for quota before the asker is told to try again
+GEMINI_RATE_PER_MINUTE = float(os.getenv("GEMINI_RATE_PER_MINUTE", "60"))
+GEMINI_RATE_BURST = int(os.getenv("GEMINI_RATE_BURST", "10"))
+GEMINI_RATE_MAX_WAIT_SECONDS = float(os.getenv("GEMINI_RATE_MAX_WAIT_SECONDS", "5"))
+# Answers reused for the same question: for how long (0 turns the cache off), how many are
+# kept, and whether a question asked in one room is answered from another room's asking
+BOT_CACHE_TTL_SECONDS = float(os.getenv("BOT_CACHE_TTL_SECONDS", "300"))
+BOT_CACHE_SIZE = int(os.getenv("BOT_CACHE_SIZE", "1000"))
+BOT_CACHE_SCOPE = os.getenv("BOT_CACHE_SCOPE", "global")  # "global" or "room"
+
+
+class ResponseCache:
+    """
+    Bot answers by normalized question, so a room asking the same thing gets one Gemini call.
+
+    Answers live in memory (LRU, at most `size`, each for `ttl` seconds) and, with Redis,
+    also under bot:answer:<hash> so other instances can reuse them. Concurrent lookups of
+    a question not cached yet share one upstream call (single-flight); it is cancelled
+    only if every caller waiting on it is. Only answers fetch() marks cacheable are kept,
+    so apologies for errors are never replayed.
+    """
+
+    def __init__(self, ttl: float = BOT_CACHE_TTL_SECONDS, size: int = BOT_CACHE_SIZE, scope: str = BOT_CACHE_SCOPE):
+        self.enabled = ttl > 0
+        self._ttl = ttl
+        self._size = max(size, 1)
+        self._scope = scope
+        # Anything with a .redis attribute (the ConnectionManager), set when the app starts
+        self.manager = None
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # key -> (answer, expires_at)
+        # key -> (upstream task, callers waiting on it)
+        self._flights: Dict[str, list] = {}
+        self.stats = {
+            "lookups": 0, "hits": 0, "redis_hits": 0, "coalesced": 0,
+            "upstream_calls": 0, "evictions": 0, "redis_errors": 0,
+        }
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        # "What's the date?", "what's  the date" and "WHAT'S THE DATE!" are one question
+        return re.sub(r"\s+", " ", prompt.lower()).strip().rstrip("?!. ")
+
+    def key(self, prompt: str, room_id: Optional[str] = None) -> str:
+        question = self.normalize(prompt)
+        if self._scope == "room" and room_id is not None:
+            question = f"{room_id}\x1f{question}"
+        return hashlib.sha1(question.encode()).hexdigest()
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Tuple[str, bool]]]) -> str:
+        """The cached answer for key, else fetch()'s (answer, cacheable), shared with concurrent callers"""
+        self.stats["lookups"] += 1
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+            del self._entries[key]
+
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.create_task(self._load(key, fetch))
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda t: self._landed(key, t))
+        else:
+            self.stats["coalesced"] += 1
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        except asyncio.CancelledError:
+            flight[1] -= 1
+            if flight[1] == 0:
+                # Nobody wants the answer any more
+                flight[0].cancel()
+            raise
+
+    def _landed(self, key: str, task: asyncio.Task):
+        if self._flights.get(key, [None])[0] is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every caller had gone
+
+    async def _load(self, key: str, fetch: Callable[[], Awaitable[Tuple[str, bool]]]) -> str:
+        redis = self.manager.redis if self.manager is not None else None
+        if redis is not None:
+            try:
+                answer = await redis.get(f"bot:answer:{key}")
+                if answer is not None:
+                    self.stats["redis_hits"] += 1
+                    self._store(key, answer)
+                    return answer
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                print(f"⚠️  Bot cache lookup in Redis failed: {e}")
+
+        self.stats["upstream_calls"] += 1
+        answer, cacheable = await fetch()
+        if cacheable:
+            self._store(key, answer)
+            if redis is not None:
+                try:
+                    await redis.set(f"bot:answer:{key}", answer, px=int(self._ttl * 1000))
+                except Exception as e:
+                    self.stats["redis_errors"] += 1
+                    print(f"⚠️  Bot cache store in Redis failed: {e}")
+        return answer
+
+    def _store(self, key: str, answer: str):
+        self._entries[key] = (answer, time.monotonic() + self._ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["lookups"]
+        saved = self.stats["hits"] + self.stats["redis_hits"] + self.stats["coalesced"]
+        return {
+            "enabled": self.enabled,
+            "scope": self._scope,
+            "entries": len(self._entries),
+            "in_flight": len(self._flights),
+            "hit_ratio": round(saved / lookups, 4) if lookups else None,
+            "upstream_calls_saved": saved,
+            **self.stats,
+        }
+
 
 class AIBot:
     """
@@ -21,8 +174,20 @@ class AIBot:
 
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY")
-        self.api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
+        self.api_url = os.getenv(
+            "GEMINI_API_URL",
+            "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent",
+        )
         self.enabled = bool(self.api_key)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.breaker = CircuitBreaker(
+            failures=GEMINI_BREAKER_FAILURES,
+            reset_seconds=GEMINI_BREAKER_RESET_SECONDS,
+            min_timeout=GEMINI_TIMEOUT_MIN_SECONDS,
+            max_timeout=GEMINI_TIMEOUT_MAX_SECONDS,
+        )
+        self.limiter = TokenBucket(GEMINI_RATE_PER_MINUTE / 60, GEMINI_RATE_BURST)
+        self.cache = ResponseCache()
         if self.enabled:
             print(f"✓ AI Bot initialized with API key: {self.api_key[:10]}...")
         else:
@@ -35,7 +200,42 @@ class AIBot:
         msg_lower = message.lower().strip()
         return msg_lower.startswith("/bot") or "@ai" in msg_lower
 
-    async def get_response(self, message: str, username: str) -> Optional[str]:
+    def _client_or_new(self) -> httpx.AsyncClient:
+        # Normally opened in the app's lifespan; created on first use otherwise (scripts, tests)
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=GEMINI_MAX_CONNECTIONS,
+                    max_keepalive_connections=GEMINI_MAX_KEEPALIVE,
+                    keepalive_expiry=GEMINI_KEEPALIVE_SECONDS,
+                ),
+                timeout=self.breaker.timeout(),
+            )
+        return self._client
+
+    async def start(self, manager=None):
+        """Open the pooled connection to Gemini, reused by every request; answers are shared through manager's Redis"""
+        self.cache.manager = manager
+        if self.enabled:
+            self._client_or_new()
+            print(f"✓ Gemini client ready (HTTP/2: {HTTP2_AVAILABLE})")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "http2": HTTP2_AVAILABLE,
+            "breaker": self.breaker.snapshot(),
+            "rate_limit": self.limiter.snapshot(),
+            "cache": self.cache.snapshot(),
+        }
+
+    async def get_response(self, message: str, username: str, room_id: Optional[str] = None) -> Optional[str]:
         """Get AI response for the message"""
         if not self.enabled:
             print("Bot not enabled - API key missing")
@@ -52,61 +252,91 @@ class AIBot:
 
         print(f"AI Bot processing: '{clean_message}' from {username}")
 
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                payload = {
-                    # CRITICAL: This sets the persona properly
-                    "systemInstruction": {
-                        "parts": [{
-                            "text": "You are a friendly, casual AI assistant in a group chat. "
-                                    "Always respond concisely (max 100 words), helpfully, and fun. "
-                                    "Answer questions directly, even opinions or facts about people."
-                        }]
-                    },
-                    "contents": [
-                        {
-                            "role": "user",  # Explicitly mark as user input
-                            "parts": [{"text": f"{username} asked: {clean_message}"}]
-                        }
-                    ],
-                    "generationConfig": {
-                        "temperature": 0.7,
-                        "maxOutputTokens": 200,
-                    }
+        if self.cache.enabled:
+            return await self.cache.get_or_fetch(
+                self.cache.key(clean_message, room_id), lambda: self._ask(clean_message, username)
+            )
+        answer, _ = await self._ask(clean_message, username)
+        return answer
+
+    async def _ask(self, clean_message: str, username: str) -> Tuple[str, bool]:
+        """Call Gemini; returns the answer, and whether it is a real one worth caching"""
+        # Fail fast while Gemini is down, and stay within the API quota
+        if not self.breaker.allow():
+            print("Gemini circuit breaker open, not calling the API")
+            return "Sorry, I'm unavailable right now. Please try again in a little while.", False
+        if not await self.limiter.acquire(GEMINI_RATE_MAX_WAIT_SECONDS):
+            self.breaker.record_abandoned()
+            print("Gemini rate limit reached")
+            return "Sorry, I'm getting too many questions. Please try again in a moment.", False
+
+        payload = {
+            # CRITICAL: This sets the persona properly
+            "systemInstruction": {
+                "parts": [{
+                    "text": "You are a friendly, casual AI assistant in a group chat. "
+                            "Always respond concisely (max 100 words), helpfully, and fun. "
+                            "Answer questions directly, even opinions or facts about people."
+                }]
+            },
+            "contents": [
+                {
+                    "role": "user",  # Explicitly mark as user input
+                    "parts": [{"text": f"{username} asked: {clean_message}"}]
                 }
+            ],
+            "generationConfig": {
+                "temperature": 0.7,
+                "maxOutputTokens": 200,
+            }
+        }
+
+        started = time.monotonic()
+        try:
+            print(f"Sending request to Gemini API...")
+            response = await self._client_or_new().post(
+                f"{self.api_url}?key={self.api_key}",
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=self.breaker.timeout(),
+            )
+
+            print(f"Gemini API response status: {response.status_code}")
 
-                print(f"Sending request to Gemini API...")
-                response = await client.post(
-                    f"{self.api_url}?key={self.api_key}",
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                )
-
-                print(f"Gemini API response status: {response.status_code}")
-
-                if response.status_code == 200:
-                    result = response.json()
-                    try:
-                        text = result["candidates"][0]["content"]["parts"][0]["text"]
-                        print(f"AI Bot response generated: {len(text)} characters")
-                        return text.strip()
-                    except (KeyError, IndexError) as e:
-                        print(f"Error parsing response: {e}")
-                        print(f"Response structure: {result}")
-                        return "I'm having trouble understanding. Could you rephrase that?"
+            if response.status_code == 200:
+                self.breaker.record_success(time.monotonic() - started)
+                result = response.json()
+                try:
+                    text = result["candidates"][0]["content"]["parts"][0]["text"]
+                    print(f"AI Bot response generated: {len(text)} characters")
+                    return text.strip(), True
+                except (KeyError, IndexError) as e:
+                    print(f"Error parsing response: {e}")
+                    print(f"Response structure: {result}")
+                    return "I'm having trouble understanding. Could you rephrase that?", False
+            else:
+                # Overload and server errors count against Gemini; other errors are ours
+                if response.status_code == 429 or response.status_code >= 500:
+                    self.breaker.record_failure()
                 else:
-                    error_msg = f"Gemini API error: {response.status_code} - {response.text}"
-                    print(error_msg)
-                    return f"Sorry, I encountered an error. Please try again later."
+                    self.breaker.record_abandoned()
+                error_msg = f"Gemini API error: {response.status_code} - {response.text}"
+                print(error_msg)
+                return f"Sorry, I encountered an error. Please try again later.", False
 
+        except asyncio.CancelledError:
+            self.breaker.record_abandoned()
+            raise
         except httpx.TimeoutException:
+            self.breaker.record_failure()
             print("Gemini API timeout")
-            return "Sorry, I'm taking too long to respond. Please try again."
+            return "Sorry, I'm taking too long to respond. Please try again.", False
         except Exception as e:
+            self.breaker.record_failure()
             print(f"Error calling Gemini API: {type(e).__name__}: {e}")
             import traceback
             traceback.print_exc()
-            return f"Sorry, I encountered an error: {type(e).__name__}"
+            return f"Sorry, I encountered an error: {type(e).__name__}", False
 
 
 # Singleton instance
@@ -0,0 +1,106 @@
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import time
+
+
+LATENCY_SAMPLES = 256
+# Latencies seen before the timeout starts adapting to them
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency that keeps failing, and sizes its timeout from how fast it is.
+
+    Closed: calls go through. After `failures` consecutive failures it opens and allow()
+    refuses every call for `reset_seconds`; then it is half-open and lets a single trial
+    call through, which closes it on success or opens it again on failure.
+
+    timeout() is the p99 of recent successful calls times `timeout_factor`, kept between
+    `min_timeout` and `max_timeout` (max_timeout until enough calls have been seen), so a
+    slow dependency fails fast instead of tying up callers for the longest allowed wait.
+    """
+
+    def __init__(
+        self,
+        failures: int = 5,
+        reset_seconds: float = 30.0,
+        min_timeout: float = 5.0,
+        max_timeout: float = 30.0,
+        timeout_factor: float = 2.0,
+    ):
+        self._failures = max(failures, 1)
+        self._reset_seconds = reset_seconds
+        self._min_timeout = min_timeout
+        self._max_timeout = max(max_timeout, min_timeout)
+        self._timeout_factor = timeout_factor
+        self.state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_started: Optional[float] = None
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; every allowed call must end in one of the record_* calls"""
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self._opened_at >= self._reset_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and (
+            self._trial_started is None
+            # A trial that never reported back must not keep the breaker shut for good
+            or now - self._trial_started > self._max_timeout
+        ):
+            self._trial_started = now
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self, latency: float) -> None:
+        self.stats["successes"] += 1
+        self._latencies.append(latency)
+        self._consecutive_failures = 0
+        self._trial_started = None
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        self.stats["failures"] += 1
+        self._consecutive_failures += 1
+        self._trial_started = None
+        if self.state == "half_open" or self._consecutive_failures >= self._failures:
+            if self.state != "open":
+                self.stats["opened"] += 1
+                print(f"⚠️  Circuit breaker open after {self._consecutive_failures} failure(s)")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def record_abandoned(self) -> None:
+        """The call was given up (cancelled) without saying anything about the dependency"""
+        self._trial_started = None
+
+    def _percentile(self, pct: int) -> Optional[float]:
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, len(latencies) * pct // 100)]
+
+    def timeout(self) -> float:
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return self._max_timeout
+        adaptive = self._percentile(99) * self._timeout_factor
+        return min(max(adaptive, self._min_timeout), self._max_timeout)
+
+    def snapshot(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "timeout_seconds": round(self.timeout(), 3),
+            "latency_p50_ms": ms(self._percentile(50)),
+            "latency_p99_ms": ms(self._percentile(99)),
+            **self.stats,
+        }
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import asyncio
+import os
+import time
+
+
+# Recent client_msg_ids remembered per user, and for how long
+DEDUPE_WINDOW = int(os.getenv("DEDUPE_WINDOW", "256"))
+DEDUPE_TTL_SECONDS = float(os.getenv("DEDUPE_TTL_SECONDS", "300"))
+# Users with a window in memory; the least recently active are dropped first
+DEDUPE_MAX_USERS = int(os.getenv("DEDUPE_MAX_USERS", "100000"))
+CLIENT_MSG_ID_MAX_LENGTH = 64
+
+
+def valid_client_msg_id(client_msg_id) -> bool:
+    return isinstance(client_msg_id, str) and 0 < len(client_msg_id) <= CLIENT_MSG_ID_MAX_LENGTH
+
+
+class SendDeduplicator:
+    """
+    Remembers recent client_msg_ids per user, so a chat frame resent after a dropped
+    socket is acknowledged instead of being stored and broadcast a second time.
+
+    Each user's latest DEDUPE_WINDOW ids are kept in memory for DEDUPE_TTL_SECONDS.
+    With Redis every new id is also claimed there with SET NX, which catches a resend
+    that lands on another instance after a reconnect.
+
+    While a claimed message is still being stored, its `saved` future is kept with the
+    claim (track()), so a resend that arrives meanwhile can wait for it before its ack.
+    """
+
+    def __init__(
+        self,
+        manager,
+        window: int = DEDUPE_WINDOW,
+        ttl: float = DEDUPE_TTL_SECONDS,
+        max_users: int = DEDUPE_MAX_USERS,
+    ):
+        self._manager = manager
+        self._window = window
+        self._ttl = ttl
+        self._max_users = max_users
+        # user -> {client_msg_id: (message_id, expires_at)}, oldest first
+        self._users: "OrderedDict[str, OrderedDict[str, Tuple[str, float]]]" = OrderedDict()
+        # (user, client_msg_id) -> saved future of a claimed message not stored yet
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.stats = {"claims": 0, "duplicates": 0, "redis_duplicates": 0, "redis_errors": 0}
+
+    @staticmethod
+    def _key(user: str, client_msg_id: str) -> str:
+        return f"dedupe:{user}:{client_msg_id}"
+
+    async def claim(self, user: str, client_msg_id: str, message_id: str) -> Optional[str]:
+        """
+        Record message_id as the message for this client_msg_id. If the id was already
+        claimed, nothing is recorded and the message id stored the first time is returned.
+        """
+        now = time.monotonic()
+        seen = self._users.get(user)
+        if seen is not None:
+            self._users.move_to_end(user)
+            self._expire(seen, now)
+            hit = seen.get(client_msg_id)
+            if hit is not None:
+                self.stats["duplicates"] += 1
+                return hit[0]
+
+        redis = self._manager.redis
+        if redis is not None:
+            key = self._key(user, client_msg_id)
+            try:
+                if not await redis.set(key, message_id, nx=True, px=int(self._ttl * 1000)):
+                    stored = await redis.get(key)
+                    if stored is not None:
+                        self.stats["duplicates"] += 1
+                        self.stats["redis_duplicates"] += 1
+                        self._remember(user, client_msg_id, stored, now)
+                        return stored
+            except Exception as e:
+                # Fall back to this instance's memory rather than refusing the message
+                self.stats["redis_errors"] += 1
+                print(f"⚠️  Dedupe check in Redis failed: {e}")
+
+        self.stats["claims"] += 1
+        self._remember(user, client_msg_id, message_id, now)
+        return None
+
+    def track(self, user: str, client_msg_id: str, saved: asyncio.Future) -> None:
+        """Keep the claimed message's saved future until its write settles"""
+        key = (user, client_msg_id)
+        if saved.done():
+            return
+        self._pending[key] = saved
+
+        def settled(_):
+            if self._pending.get(key) is saved:
+                del self._pending[key]
+
+        saved.add_done_callback(settled)
+
+    def pending(self, user: str, client_msg_id: str) -> Optional[asyncio.Future]:
+        """The saved future of a claimed message still being written, if any"""
+        return self._pending.get((user, client_msg_id))
+
+    async def release(self, user: str, client_msg_id: str) -> None:
+        """Forget a claim whose message could not be stored, so a retry goes through"""
+        seen = self._users.get(user)
+        if seen is not None:
+            seen.pop(client_msg_id, None)
+        redis = self._manager.redis
+        if redis is not None:
+            try:
+                await redis.delete(self._key(user, client_msg_id))
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                print(f"⚠️  Dedupe release in Redis failed: {e}")
+
+    def _remember(self, user: str, client_msg_id: str, message_id: str, now: float):
+        seen = self._users.get(user)
+        if seen is None:
+            seen = self._users[user] = OrderedDict()
+            while len(self._users) > self._max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user)
+        seen[client_msg_id] = (message_id, now + self._ttl)
+        seen.move_to_end(client_msg_id)
+        while len(seen) > self._window:
+            seen.popitem(last=False)
+
+    @staticmethod
+    def _expire(seen: "OrderedDict[str, Tuple[str, float]]", now: float):
+        # Same TTL for every entry, so insertion order is expiry order
+        while seen:
+            _, (_, expires_at) = next(iter(seen.items()))
+            if expires_at > now:
+                break
+            seen.popitem(last=False)
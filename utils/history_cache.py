@@ -0,0 +1,241 @@
+from bson import ObjectId
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, UTC
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+import asyncio
+import base64
+import binascii
+import json
+import os
+import time
+
+
+HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", "50"))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# How long a room's history may be served without live updates (no local sockets in the room)
+HISTORY_STALE_SECONDS = float(os.getenv("HISTORY_STALE_SECONDS", "2"))
+
+_EPOCH = datetime(1970, 1, 1)
+CHAT_PREFIX = '{"type": "chat"'
+
+
+def encode_cursor(timestamp: str, message_id: str) -> str:
+    """Opaque pagination cursor for the position of one message: (timestamp ms, ObjectId)"""
+    ms = (datetime.fromisoformat(timestamp) - _EPOCH) // timedelta(milliseconds=1)
+    raw = ms.to_bytes(8, "big", signed=True) + ObjectId(message_id).binary
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor; raises ValueError for anything it didn't produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid history cursor")
+    if len(raw) != 20:
+        raise ValueError("Invalid history cursor")
+    ms = int.from_bytes(raw[:8], "big", signed=True)
+    return _EPOCH + timedelta(milliseconds=ms), ObjectId(raw[8:])
+
+
+def format_timestamp(timestamp: datetime) -> str:
+    """Same shape whether the message came from Mongo (naive UTC, millisecond precision) or memory"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(UTC).replace(tzinfo=None)
+    return timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000).isoformat()
+
+
+def history_entry(doc: dict, file_info: Optional[dict] = None) -> dict:
+    """The client-facing form of a stored message (a chat frame carries the same fields)"""
+    timestamp = doc["timestamp"]
+    if isinstance(timestamp, datetime):
+        timestamp = format_timestamp(timestamp)
+    entry = {
+        "user": doc["user"],
+        "msg": doc["msg"],
+        "timestamp": timestamp,
+        "file_id": doc.get("file_id"),
+    }
+    if doc.get("seq") is not None:
+        entry["seq"] = doc["seq"]
+    if file_info:
+        entry["file_info"] = file_info
+    return entry
+
+
+class _RoomHistory:
+    """Latest messages of one room as (message_id, timestamp, json, seq) tuples, oldest first"""
+    __slots__ = ("entries", "bytes", "loaded_at", "epoch")
+
+    def __init__(self, size: int):
+        self.entries: Deque[Tuple[str, str, str, Optional[int]]] = deque(maxlen=size)
+        self.bytes = 0
+        self.loaded_at: Optional[float] = None  # None until the room has been read from Mongo
+        self.epoch: Optional[int] = None  # manager serving epoch when the load started
+
+    def add(self, message_id: str, timestamp: str, text: str, seq: Optional[int]):
+        if len(self.entries) == self.entries.maxlen:
+            self.bytes -= len(self.entries[0][2])
+        self.entries.append((message_id, timestamp, text, seq))
+        self.bytes += len(text)
+
+
+class HistoryCache:
+    """
+    Per-room ring buffer of the latest HISTORY_SIZE messages, already serialized and
+    enriched with file_info, shared by the WebSocket join and the REST history route.
+
+    Misses are loaded with single-flight, so a reconnect storm into one room costs one
+    query. New messages are appended by the write path here, and by other instances from
+    the chat broadcast itself (its frame carries the message id and timestamp), so they
+    cost no extra publish. A room is served from memory while this instance receives its
+    live traffic (it has local sockets, or there is no Redis); otherwise for at most
+    HISTORY_STALE_SECONDS after loading. Whole rooms are evicted LRU once the cache
+    exceeds HISTORY_CACHE_MAX_BYTES.
+    """
+
+    def __init__(
+        self,
+        manager,
+        loader: Callable[[str, int], Awaitable[List[Tuple[str, dict]]]],
+        size: int = HISTORY_SIZE,
+        max_bytes: int = HISTORY_CACHE_MAX_BYTES,
+        stale_seconds: float = HISTORY_STALE_SECONDS,
+    ):
+        self._manager = manager
+        self._loader = loader
+        self._size = size
+        self._max_bytes = max_bytes
+        self._stale_seconds = stale_seconds
+        self._rooms: "OrderedDict[str, _RoomHistory]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "loads": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+        manager.add_control_handler(self._on_control)
+        manager.add_event_handler(self._on_event)
+
+    def _fresh(self, room_id: str, room: _RoomHistory) -> bool:
+        if room.loaded_at is None:
+            return False
+        if self._manager.redis is None:
+            return True
+        # Live updates have reached us without a gap since the load started
+        if room.epoch is not None and room.epoch == self._manager.serving_epoch(room_id):
+            return True
+        return time.monotonic() - room.loaded_at < self._stale_seconds
+
+    async def get(self, room_id: str) -> List[str]:
+        """JSON-encoded history entries, oldest first"""
+        return [text for _, _, text, _ in await self.latest(room_id)]
+
+    async def latest(self, room_id: str) -> List[Tuple[str, str, str, Optional[int]]]:
+        """History entries as (message_id, timestamp, json, seq), oldest first"""
+        room = self._rooms.get(room_id)
+        if room is not None and self._fresh(room_id, room):
+            self._rooms.move_to_end(room_id)
+            self.stats["hits"] += 1
+            return list(room.entries)
+
+        loading = self._loading.get(room_id)
+        if loading is not None:
+            self.stats["coalesced"] += 1
+            return list(await asyncio.shield(loading))
+
+        self.stats["misses"] += 1
+        loading = self._loading[room_id] = asyncio.get_running_loop().create_future()
+        try:
+            entries = await self._load(room_id)
+            loading.set_result(entries)
+            return entries
+        except Exception as e:
+            loading.set_exception(e)
+            # Waiters get the exception; mark it retrieved for the case there are none
+            loading.exception()
+            raise
+        finally:
+            if self._loading.get(room_id) is loading:
+                del self._loading[room_id]
+
+    async def since(self, room_id: str, last_seq: int, max_gap: int) -> Optional[List[str]]:
+        """
+        JSON-encoded entries numbered above last_seq, oldest first. None if there are more
+        than max_gap of them, or the buffer doesn't reach back to last_seq (some may be missing).
+        """
+        entries = await self.latest(room_id)
+        missing = [text for _, _, text, seq in entries if seq is not None and seq > last_seq]
+        reaches_back = len(entries) < self._size or any(seq is not None and seq <= last_seq for *_, seq in entries)
+        if not reaches_back or len(missing) > max_gap:
+            return None
+        return missing
+
+    async def _load(self, room_id: str) -> List[Tuple[str, str, str, Optional[int]]]:
+        self.stats["loads"] += 1
+        started = time.monotonic()
+        epoch = self._manager.serving_epoch(room_id)
+        rows = await self._loader(room_id, self._size)
+
+        # Messages appended while the query ran (or still waiting in the write-behind
+        # queue) may be missing from its result, so merge them in by id.
+        previous = self._rooms.get(room_id)
+        merged = {message_id: (entry["timestamp"], json.dumps(entry), entry.get("seq")) for message_id, entry in rows}
+        if previous is not None:
+            for message_id, timestamp, text, seq in previous.entries:
+                merged.setdefault(message_id, (timestamp, text, seq))
+
+        room = _RoomHistory(self._size)
+        for message_id, (timestamp, text, seq) in sorted(merged.items(), key=lambda item: (item[1][0], item[0])):
+            room.add(message_id, timestamp, text, seq)
+        room.loaded_at = started
+        room.epoch = epoch
+        self._replace(room_id, room)
+        return list(room.entries)
+
+    def _replace(self, room_id: str, room: Optional[_RoomHistory]):
+        previous = self._rooms.pop(room_id, None)
+        if previous is not None:
+            self.bytes -= previous.bytes
+        if room is not None:
+            self._rooms[room_id] = room
+            self.bytes += room.bytes
+            self._evict()
+
+    def _evict(self):
+        while self.bytes > self._max_bytes and len(self._rooms) > 1:
+            _, room = self._rooms.popitem(last=False)
+            self.bytes -= room.bytes
+            self.stats["evictions"] += 1
+
+    def append(self, room_id: str, message_id: str, entry: dict) -> None:
+        """Add a new message to the room's buffer; other instances add it from its broadcast"""
+        self._add(room_id, message_id, entry)
+
+    def _add(self, room_id: str, message_id: str, entry: dict):
+        room = self._rooms.get(room_id)
+        if room is None:
+            # Keep it even before the room is loaded: it may not be in Mongo yet
+            room = self._rooms[room_id] = _RoomHistory(self._size)
+        text = json.dumps(entry)
+        before = room.bytes
+        room.add(message_id, entry["timestamp"], text, entry.get("seq"))
+        self.bytes += room.bytes - before
+        self._rooms.move_to_end(room_id)
+        self._evict()
+
+    def invalidate(self, room_id: str, publish: bool = True) -> None:
+        """Drop the room's buffer here (and on other instances) so the next read goes to Mongo"""
+        self.stats["invalidations"] += 1
+        self._replace(room_id, None)
+        if publish:
+            self._manager.publish_control({"kind": "history", "invalidate": True}, room_id)
+
+    def _on_control(self, room_id: str, obj: dict) -> None:
+        if obj.get("kind") == "history" and obj.get("invalidate"):
+            self.invalidate(room_id, publish=False)
+
+    def _on_event(self, room_id: str, event: str) -> None:
+        # Only stored chat messages carry an id; skip typing and system frames unparsed
+        if not event.startswith(CHAT_PREFIX) or '"id": ' not in event:
+            return
+        frame = json.loads(event)
+        if frame.get("id") and frame.get("timestamp"):
+            self._add(room_id, frame["id"], history_entry(frame, frame.get("file_info")))
@@ -0,0 +1,180 @@
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+from pymongo.errors import BulkWriteError
+import asyncio
+import os
+
+
+# How chat messages are persisted relative to their broadcast:
+#   fire_and_forget      - broadcast immediately; write failures are only logged and counted
+#   ack_after_batch      - broadcast immediately; the sender's ack (or error) waits until its batch is stored
+#   ack_before_broadcast - broadcast only once the message's batch is stored
+DURABILITY_MODES = ("fire_and_forget", "ack_after_batch", "ack_before_broadcast")
+MESSAGE_DURABILITY = os.getenv("MESSAGE_DURABILITY", "ack_after_batch")
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "500"))
+MESSAGE_FLUSH_MS = int(os.getenv("MESSAGE_FLUSH_MS", "20"))
+# Messages allowed to wait for Mongo before senders are made to wait for queue space
+MESSAGE_QUEUE_LIMIT = int(os.getenv("MESSAGE_QUEUE_LIMIT", "10000"))
+MESSAGE_WRITE_RETRIES = int(os.getenv("MESSAGE_WRITE_RETRIES", "3"))
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class BatchedMessageWriter:
+    """
+    Write-behind persistence for chat messages.
+
+    submit() queues a document and returns a future that resolves once its batch is in
+    Mongo. A background task flushes the queue with one unordered insert_many every
+    MESSAGE_BATCH_SIZE messages or MESSAGE_FLUSH_MS, whichever comes first. When the
+    queue holds MESSAGE_QUEUE_LIMIT messages, submit() waits for space.
+    """
+
+    def __init__(
+        self,
+        insert_many: Callable[[List[dict]], Awaitable[None]],
+        durability: str = MESSAGE_DURABILITY,
+        batch_size: int = MESSAGE_BATCH_SIZE,
+        flush_ms: int = MESSAGE_FLUSH_MS,
+        queue_limit: int = MESSAGE_QUEUE_LIMIT,
+        retries: int = MESSAGE_WRITE_RETRIES,
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown MESSAGE_DURABILITY '{durability}', expected one of {DURABILITY_MODES}")
+        self.durability = durability
+        self._insert_many = insert_many
+        self._batch_size = batch_size
+        self._flush_interval = flush_ms / 1000
+        self._queue_limit = max(queue_limit, batch_size)
+        self._retries = retries
+        self._queue: Deque[Tuple[dict, asyncio.Future]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self.stats = {
+            "submitted": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "largest_batch": 0,
+            "retries": 0,
+            "backpressure_waits": 0,
+            "queue_high_water": 0,
+        }
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, doc: dict) -> asyncio.Future:
+        """Queue a document for the next batch; only waits when the queue is full"""
+        self._ensure_running()
+        while len(self._queue) >= self._queue_limit:
+            self.stats["backpressure_waits"] += 1
+            self._space.clear()
+            await self._space.wait()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((doc, future))
+        self.stats["submitted"] += 1
+        self.stats["queue_high_water"] = max(self.stats["queue_high_water"], len(self._queue))
+        self._wakeup.set()
+        if len(self._queue) >= self._batch_size:
+            self._full.set()
+        return future
+
+    async def _run(self):
+        while True:
+            try:
+                await self._wakeup.wait()
+                if len(self._queue) < self._batch_size and not self._closing:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self._flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                await self._flush_once()
+                if self._closing and not self._queue:
+                    return
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                # Keep flushing: if this task ended, every later submit would wait forever
+                print(f"⚠️  Message writer error: {e}")
+
+    async def _flush_once(self):
+        batch = [self._queue.popleft() for _ in range(min(self._batch_size, len(self._queue)))]
+        if len(self._queue) < self._batch_size:
+            self._full.clear()
+        if not self._queue:
+            self._wakeup.clear()
+        self._space.set()
+        if batch:
+            try:
+                await self._write(batch)
+            except Exception as e:
+                for _, future in batch:
+                    self._resolve(future, str(e))
+                raise
+
+    async def _write(self, batch: List[Tuple[dict, asyncio.Future]]):
+        docs = [doc for doc, _ in batch]
+        failed = {}
+        for attempt in range(self._retries + 1):
+            try:
+                await self._insert_many(docs)
+                failed = {}
+                break
+            except BulkWriteError as e:
+                # ordered=False: everything except the reported documents was stored.
+                # Duplicate keys mean an earlier attempt already stored that document.
+                failed = {
+                    err["index"]: err.get("errmsg", "write failed")
+                    for err in e.details.get("writeErrors", [])
+                    if err.get("code") != DUPLICATE_KEY_ERROR
+                }
+                break
+            except Exception as e:
+                failed = {i: str(e) for i in range(len(docs))}
+                if attempt < self._retries:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(0.05 * 2 ** attempt)
+
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        self.stats["written"] += len(batch) - len(failed)
+        self.stats["failed"] += len(failed)
+        if failed:
+            print(f"⚠️  Failed to store {len(failed)} of {len(batch)} messages: {next(iter(failed.values()))}")
+        for i, (_, future) in enumerate(batch):
+            self._resolve(future, failed.get(i))
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, error: Optional[str]):
+        # The submitter may be gone along with its event loop; then nobody is waiting
+        if future.done() or future.get_loop().is_closed():
+            return
+        try:
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(RuntimeError(error))
+                # Nobody awaits fire-and-forget futures; mark the exception as retrieved
+                future.exception()
+        except Exception as e:
+            print(f"⚠️  Could not report a stored message to its sender: {e}")
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    async def stop(self):
+        """Write everything still queued, then stop the flush task"""
+        if self._task and not self._task.done():
+            self._closing = True
+            self._wakeup.set()
+            self._full.set()
+            await self._task
+        print(f"✓ Message writer drained ({self.stats['written']} messages in {self.stats['batches']} batches)")
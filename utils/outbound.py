@@ -0,0 +1,127 @@
+from collections import deque
+from typing import Callable, Deque, Optional
+from fastapi import WebSocket
+import asyncio
+import os
+import time
+
+
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# What to do when a connection can't keep up with its room:
+#   drop_oldest - discard the oldest queued frame to make room
+#   drop_typing - discard queued typing frames first (keeping the newest), then the oldest frame
+#   disconnect  - close the socket once its oldest frame is WS_MAX_BACKLOG_MS old (or the queue is full)
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "drop_typing", "disconnect")
+SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_typing")
+MAX_BACKLOG_MS = int(os.getenv("WS_MAX_BACKLOG_MS", "5000"))
+
+TYPING_PREFIX = '{"type": "typing"'
+
+
+class Frame:
+    """
+    An outbound message built once per broadcast and shared by every recipient's queue.
+    """
+    __slots__ = ("text", "droppable", "created_at")
+
+    def __init__(self, text: str, droppable: Optional[bool] = None):
+        self.text = text
+        # Typing indicators are superseded by the next one, so they are the first to go
+        self.droppable = text.startswith(TYPING_PREFIX) if droppable is None else droppable
+        self.created_at = time.monotonic()
+
+
+class ConnectionWriter:
+    """
+    Owns all sends to one WebSocket through a bounded queue drained by its own task,
+    so a stalled client only ever delays itself.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        on_evict: Callable[[WebSocket], None],
+        max_queue: int = SEND_QUEUE_SIZE,
+        policy: str = SLOW_CONSUMER_POLICY,
+        max_backlog_ms: int = MAX_BACKLOG_MS,
+        accepts_batches: bool = False,
+    ):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown WS_SLOW_CONSUMER_POLICY '{policy}', expected one of {SLOW_CONSUMER_POLICIES}")
+        self.websocket = websocket
+        # Negotiated by the client: whether it understands {"type": "batch", "events": [...]}
+        self.accepts_batches = accepts_batches
+        self._on_evict = on_evict
+        self._max_queue = max_queue
+        self._policy = policy
+        self._max_backlog = max_backlog_ms / 1000
+        self._queue: Deque[Frame] = deque()
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+        self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, frame: Frame) -> bool:
+        """Queue a frame without blocking. Returns False if the frame was not accepted."""
+        if self._closed:
+            return False
+
+        if self._policy == "disconnect":
+            backlog = self._queue and time.monotonic() - self._queue[0].created_at > self._max_backlog
+            if backlog or len(self._queue) >= self._max_queue:
+                self._evict()
+                return False
+        elif len(self._queue) >= self._max_queue:
+            if frame.droppable and self._policy == "drop_typing":
+                # A typing frame carries the room's whole typing state, so the newest replaces
+                # any still queued; with none queued, it gives way to the chat frames
+                stale = sum(1 for queued in self._queue if queued.droppable)
+                if not stale:
+                    self.dropped += 1
+                    return False
+                self._queue = deque(queued for queued in self._queue if not queued.droppable)
+                self.dropped += stale
+            else:
+                self._drop_one()
+
+        self._queue.append(frame)
+        self._wakeup.set()
+        return True
+
+    def _drop_one(self):
+        if self._policy == "drop_typing":
+            for i, queued in enumerate(self._queue):
+                if queued.droppable:
+                    del self._queue[i]
+                    self.dropped += 1
+                    return
+        self._queue.popleft()
+        self.dropped += 1
+
+    def _evict(self):
+        if not self._closed:
+            self._closed = True
+            self._on_evict(self.websocket)
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                while self._queue:
+                    frame = self._queue.popleft()
+                    await self.websocket.send_text(frame.text)
+                self._wakeup.clear()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self._evict()
+
+    def close(self):
+        """Stop the writer task and discard anything still queued"""
+        self._closed = True
+        self._queue.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
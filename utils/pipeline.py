@@ -0,0 +1,192 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set, Tuple
+import asyncio
+import os
+import time
+
+
+# Handlers running at once per stage, and items each stage may hold before put() waits
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))
+# Longest shutdown waits for queued messages to get through
+PIPELINE_DRAIN_SECONDS = float(os.getenv("PIPELINE_DRAIN_SECONDS", "5"))
+
+LATENCY_SAMPLES = 1024
+
+
+class Stage:
+    """
+    One step of a pipeline: queued items, at most `workers` of them being handled at once.
+
+    Items wait in a lane per key. An ordered stage handles a lane one item at a time, in
+    order, so a slow key only holds up its own items; the `workers` limit is shared by all
+    lanes. An unordered stage gives every item a lane of its own. When `queue_size` items
+    are in the stage, put() waits (backpressure), or with drop_when_full the item is
+    dropped and counted.
+
+    The handler returns the item for the next stage, or None to stop there. If it raises,
+    on_error(item, exc) is called so the item's sender can be told. Latency is measured
+    from put() to the end of the handler, so it includes queue wait.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = PIPELINE_WORKERS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        ordered: bool = True,
+        drop_when_full: bool = False,
+        on_error: Optional[Callable[[Any, Exception], Awaitable[None]]] = None,
+    ):
+        self.name = name
+        self.next: Optional["Stage"] = None
+        self._handler = handler
+        self._on_error = on_error
+        self._workers = max(workers, 1)
+        self._queue_size = max(queue_size, 1)
+        self._ordered = ordered
+        self._drop_when_full = drop_when_full
+        self._slots = asyncio.Semaphore(self._workers)
+        # lane key -> (key, item, enqueued_at), oldest first; a lane exists while its runner does
+        self._lanes: Dict[Hashable, Deque[Tuple[Hashable, Any, float]]] = {}
+        self._runners: Set[asyncio.Task] = set()
+        self._items = 0
+        self._space = asyncio.Event()
+        self._space.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closed = False
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {"processed": 0, "errors": 0, "dropped": 0, "rejected": 0, "queue_high_water": 0}
+
+    async def put(self, key: Hashable, item) -> bool:
+        """Queue an item; False if it was dropped because the stage is full, or is closed"""
+        while self._items >= self._queue_size and not self._closed:
+            if self._drop_when_full:
+                self.stats["dropped"] += 1
+                return False
+            self._space.clear()
+            await self._space.wait()
+        if self._closed:
+            self.stats["rejected"] += 1
+            return False
+
+        lane_key = key if self._ordered else object()
+        entry = (key, item, time.perf_counter())
+        lane = self._lanes.get(lane_key)
+        if lane is None:
+            lane = self._lanes[lane_key] = deque([entry])
+            runner = asyncio.create_task(self._run(lane_key, lane))
+            self._runners.add(runner)
+            runner.add_done_callback(self._runners.discard)
+        else:
+            lane.append(entry)
+        self._items += 1
+        self._idle.clear()
+        self.stats["queue_high_water"] = max(self.stats["queue_high_water"], self._items)
+        return True
+
+    async def _run(self, lane_key: Hashable, lane: Deque[Tuple[Hashable, Any, float]]):
+        try:
+            while lane:
+                key, item, enqueued = lane[0]
+                async with self._slots:
+                    try:
+                        result = await self._handler(item)
+                        self._latencies.append(time.perf_counter() - enqueued)
+                        if result is not None and self.next is not None:
+                            await self.next.put(key, result)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self.stats["errors"] += 1
+                        print(f"⚠️  Pipeline stage '{self.name}' failed: {e}")
+                        await self._report(item, e)
+                lane.popleft()
+                self._items -= 1
+                self.stats["processed"] += 1
+                self._space.set()
+        finally:
+            if self._lanes.get(lane_key) is lane:
+                del self._lanes[lane_key]
+            if not self._lanes:
+                self._idle.set()
+
+    async def _report(self, item, error: Exception):
+        if self._on_error is None:
+            return
+        try:
+            await self._on_error(item, error)
+        except Exception as e:
+            print(f"⚠️  Pipeline stage '{self.name}' could not report a failure: {e}")
+
+    def depth(self) -> int:
+        return self._items
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+
+        def percentile(pct: int) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, len(latencies) * pct // 100)] * 1000, 3)
+
+        return {
+            "depth": self.depth(),
+            "keys": len(self._lanes),
+            "workers": self._workers,
+            "latency_p50_ms": percentile(50),
+            "latency_p99_ms": percentile(99),
+            **self.stats,
+        }
+
+    def close(self):
+        """Refuse new items from now on; queued ones still get handled"""
+        self._closed = True
+        self._space.set()
+
+    async def drain(self):
+        await self._idle.wait()
+
+    async def cancel(self):
+        self.close()
+        for runner in list(self._runners):
+            runner.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+
+
+class Pipeline:
+    """Stages chained in order; each stage's output is put into the next under the same key"""
+
+    def __init__(self, *stages: Stage, drain_seconds: float = PIPELINE_DRAIN_SECONDS):
+        self.stages: Tuple[Stage, ...] = stages
+        self._drain_seconds = drain_seconds
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+
+    async def submit(self, key: Hashable, item) -> bool:
+        """
+        Hand an item to the first stage; only waits when that stage is full.
+        False once the pipeline is stopping.
+        """
+        return await self.stages[0].put(key, item)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.snapshot() for stage in self.stages}
+
+    async def stop(self):
+        """Stop taking new items, let queued ones through (up to drain_seconds), then stop the workers"""
+        self.stages[0].close()
+
+        async def drain():
+            for stage in self.stages:
+                await stage.drain()
+
+        try:
+            await asyncio.wait_for(drain(), self._drain_seconds)
+        except asyncio.TimeoutError:
+            print(f"⚠️  Pipeline stopped with messages still queued: {[s.depth() for s in self.stages]}")
+        for stage in self.stages:
+            await stage.cancel()
+        print("✓ Message pipeline stopped")
@@ -0,0 +1,180 @@
+from datetime import datetime, UTC
+from typing import Dict, Optional, Set
+import asyncio
+import os
+import time
+
+
+PRESENCE_HEARTBEAT_SECONDS = float(os.getenv("PRESENCE_HEARTBEAT_SECONDS", "10"))
+# An instance that misses heartbeats for this long is treated as dead and its users as offline
+PRESENCE_TTL_SECONDS = float(os.getenv("PRESENCE_TTL_SECONDS", "30"))
+PRESENCE_FLUSH_SECONDS = float(os.getenv("PRESENCE_FLUSH_SECONDS", "30"))
+
+INSTANCES_KEY = "presence:instances"
+INSTANCE_KEY_PREFIX = "presence:instance:"
+
+
+class PresenceService:
+    """
+    Tracks which users are online across rooms and server instances.
+
+    Each instance ref-counts its own sockets per user and keeps the set of its online
+    users in Redis (presence:instance:<id>), refreshed by a heartbeat with a TTL, and
+    registers itself in the presence:instances sorted set scored by heartbeat time.
+    A user is online while any live instance lists them, so extra tabs and rooms don't
+    flap the status, and an instance that dies without cleanup drops out after the TTL.
+    last_active is written to Mongo in one bulk write per flush interval.
+    """
+
+    def __init__(
+        self,
+        manager,
+        users_repo,
+        heartbeat: float = PRESENCE_HEARTBEAT_SECONDS,
+        ttl: float = PRESENCE_TTL_SECONDS,
+        flush_interval: float = PRESENCE_FLUSH_SECONDS,
+    ):
+        self._manager = manager
+        self._users = users_repo
+        self._heartbeat = heartbeat
+        self._ttl = ttl
+        self._flush_interval = flush_interval
+        self._connections: Dict[str, int] = {}  # username -> sockets on this instance
+        # last_active timestamps waiting for the next bulk write
+        self._pending_last_active: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"heartbeats": 0, "redis_failures": 0, "flushes": 0, "flushed_users": 0}
+
+    @property
+    def _instance_key(self) -> str:
+        return f"{INSTANCE_KEY_PREFIX}{self._manager.instance_id}"
+
+    async def start(self):
+        """Register this instance and start heartbeating"""
+        await self._beat()
+        self._task = asyncio.create_task(self._run())
+
+    async def connect(self, username: str) -> None:
+        count = self._connections.get(username, 0)
+        self._connections[username] = count + 1
+        if count:
+            return
+        self._pending_last_active[username] = datetime.now(UTC)
+        await self._redis_call(self._add_user, username)
+
+    async def disconnect(self, username: str) -> None:
+        count = self._connections.get(username, 0)
+        if count > 1:
+            self._connections[username] = count - 1
+            return
+        self._connections.pop(username, None)
+        self._pending_last_active[username] = datetime.now(UTC)
+        await self._redis_call(lambda redis: redis.srem(self._instance_key, username))
+
+    async def _add_user(self, redis, username: str):
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(self._instance_key, username)
+            pipe.pexpire(self._instance_key, int(self._ttl * 1000))
+            await pipe.execute()
+
+    async def _redis_call(self, fn, *args):
+        redis = self._manager.redis
+        if redis is None:
+            return None
+        try:
+            return await fn(redis, *args)
+        except Exception as e:
+            # Local counts stay authoritative; the next heartbeat rewrites this instance's set
+            self.stats["redis_failures"] += 1
+            print(f"⚠️  Presence update failed: {e}")
+            return None
+
+    async def _beat(self):
+        redis = self._manager.redis
+        if redis is None:
+            return
+        now = time.time()
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.zadd(INSTANCES_KEY, {self._manager.instance_id: now})
+                pipe.zremrangebyscore(INSTANCES_KEY, "-inf", now - self._ttl)
+                if self._connections:
+                    # Re-adding everyone also repairs the set after a Redis restart or failed update
+                    pipe.sadd(self._instance_key, *self._connections)
+                    pipe.pexpire(self._instance_key, int(self._ttl * 1000))
+                await pipe.execute()
+            self.stats["heartbeats"] += 1
+        except Exception as e:
+            self.stats["redis_failures"] += 1
+            print(f"⚠️  Presence heartbeat failed: {e}")
+
+    async def _run(self):
+        last_flush = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(self._heartbeat)
+                await self._beat()
+                if time.monotonic() - last_flush >= self._flush_interval:
+                    last_flush = time.monotonic()
+                    await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self) -> int:
+        """Write pending last_active timestamps to Mongo in a single bulk write"""
+        pending, self._pending_last_active = self._pending_last_active, {}
+        if not pending:
+            return 0
+        try:
+            await self._users.update_last_active(pending)
+        except Exception as e:
+            print(f"⚠️  Presence flush failed: {e}")
+            for user, ts in pending.items():
+                self._pending_last_active.setdefault(user, ts)
+            return 0
+        self.stats["flushes"] += 1
+        self.stats["flushed_users"] += len(pending)
+        return len(pending)
+
+    async def online_users(self) -> Set[str]:
+        """Usernames with at least one socket on any live instance"""
+        online = set(self._connections)
+        redis = self._manager.redis
+        if redis is None:
+            return online
+        try:
+            instances = await redis.zrangebyscore(INSTANCES_KEY, time.time() - self._ttl, "+inf")
+            if instances:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for instance_id in instances:
+                        pipe.smembers(f"{INSTANCE_KEY_PREFIX}{instance_id}")
+                    for members in await pipe.execute():
+                        online.update(members)
+        except Exception as e:
+            self.stats["redis_failures"] += 1
+            print(f"⚠️  Presence lookup failed, showing local users only: {e}")
+        return online
+
+    def last_active(self, username: str) -> Optional[datetime]:
+        """A last_active timestamp not yet flushed to Mongo, if any"""
+        return self._pending_last_active.get(username)
+
+    async def stop(self):
+        """Flush last_active and deregister this instance so its users go offline immediately"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for username in self._connections:
+            self._pending_last_active[username] = datetime.now(UTC)
+        self._connections.clear()
+        await self.flush()
+        await self._redis_call(self._deregister)
+
+    async def _deregister(self, redis):
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.delete(self._instance_key)
+            pipe.zrem(INSTANCES_KEY, self._manager.instance_id)
+            await pipe.execute()
@@ -0,0 +1,57 @@
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class RoomSequencer:
+    """
+    Monotonic per-room message sequence numbers, assigned at ingest so reconnecting
+    clients can say which message they saw last.
+
+    With Redis the number is base + n from the hash `room:seq:<room_id>`: n is bumped with
+    HINCRBY on every message (unique across instances) and read back with base in the same
+    round trip. A hash without a base (new room, or Redis lost its data) is seeded once with
+    HSETNX to the highest sequence already in Mongo. Every message racing that seeding
+    sees the same base, so none can be numbered below it or twice. Without Redis the
+    counters live here.
+    """
+
+    def __init__(self, manager, stored_max: Callable[[str], Awaitable[int]]):
+        self._manager = manager
+        self._stored_max = stored_max
+        self._local: Dict[str, int] = {}
+        self.stats = {"assigned": 0, "seeded": 0, "failures": 0}
+
+    @staticmethod
+    def _key(room_id: str) -> str:
+        return f"room:seq:{room_id}"
+
+    async def next(self, room_id: str) -> Optional[int]:
+        """The room's next sequence number, or None if Redis can't be reached"""
+        redis = self._manager.redis
+        if redis is None:
+            return await self._next_local(room_id)
+        key = self._key(room_id)
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hincrby(key, "n", 1)
+                pipe.hget(key, "base")
+                n, base = await pipe.execute()
+            if base is None:
+                if await redis.hsetnx(key, "base", await self._stored_max(room_id) or 0):
+                    self.stats["seeded"] += 1
+                base = await redis.hget(key, "base")
+            seq = int(base) + n
+        except Exception as e:
+            self.stats["failures"] += 1
+            print(f"⚠️  Could not assign a sequence number in room {room_id}: {e}")
+            return None
+        self.stats["assigned"] += 1
+        return seq
+
+    async def _next_local(self, room_id: str) -> int:
+        if room_id not in self._local:
+            stored = await self._stored_max(room_id)
+            # Another message may have seeded the room while we were reading
+            self._local.setdefault(room_id, stored)
+        self._local[room_id] += 1
+        self.stats["assigned"] += 1
+        return self._local[room_id]
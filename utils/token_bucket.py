@@ -0,0 +1,45 @@
+from typing import Any, Dict
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Rate limiter: `rate` tokens a second, holding at most `burst`.
+
+    acquire() takes a token, waiting for one to refill if need be. A caller that would have
+    to wait longer than max_wait gets False at once instead, so a burst over the quota is
+    turned away rather than queued up behind it.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self.stats = {"acquired": 0, "waited": 0, "refused": 0}
+
+    def _refill(self, now: float):
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self, max_wait: float = 0.0) -> bool:
+        self._refill(time.monotonic())
+        if self._tokens >= 1:
+            self._tokens -= 1
+            self.stats["acquired"] += 1
+            return True
+        # Callers already waiting have taken the tokens still to come (the count goes negative)
+        wait = (1 - self._tokens) / self._rate if self._rate > 0 else float("inf")
+        if wait > max_wait:
+            self.stats["refused"] += 1
+            return False
+        self._tokens -= 1
+        self.stats["acquired"] += 1
+        self.stats["waited"] += 1
+        await asyncio.sleep(wait)
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._refill(time.monotonic())
+        return {"tokens": round(self._tokens, 3), "rate_per_second": self._rate, "burst": self._burst, **self.stats}
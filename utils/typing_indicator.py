@@ -0,0 +1,129 @@
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import os
+
+
+TYPING_TTL_SECONDS = float(os.getenv("TYPING_TTL_SECONDS", "5"))
+TYPING_BROADCAST_MS = int(os.getenv("TYPING_BROADCAST_MS", "250"))
+
+
+class TypingTracker:
+    """
+    Per-room, per-user typing state with automatic expiry.
+
+    Keystrokes only refresh a TTL. Start/stop transitions are collected per room and
+    shared with other instances as one control message per interval, and every
+    instance periodically sends its own sockets one merged frame per changed room:
+        {"type": "typing", "users": ["alice", "AI_Bot"]}
+    """
+
+    def __init__(self, manager, ttl: float = TYPING_TTL_SECONDS, interval_ms: int = TYPING_BROADCAST_MS):
+        self._manager = manager
+        self._ttl = ttl
+        self._interval = interval_ms / 1000
+        self._rooms: Dict[str, Dict[str, float]] = {}  # room_id -> {user: expires_at}
+        self._last_published: Dict[Tuple[str, str], float] = {}
+        self._dirty: Set[str] = set()
+        # Updates waiting to be published: room_id -> {user: (status, ttl)}
+        self._outbox: Dict[str, Dict[str, Tuple[bool, float]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"transitions": 0, "refreshes": 0, "coalesced": 0, "frames": 0}
+        manager.add_control_handler(self._on_control)
+
+    def set_typing(self, room_id: str, user: str, status: bool, ttl: Optional[float] = None) -> None:
+        """Record a typing update from a local client (or the bot)"""
+        ttl = ttl or self._ttl
+        changed = self._apply(room_id, user, status, ttl)
+        now = asyncio.get_running_loop().time()
+        key = (room_id, user)
+
+        if changed:
+            self.stats["transitions"] += 1
+        elif status and now - self._last_published.get(key, 0) > ttl / 2:
+            # Long typing bursts re-announce before remote instances expire the user
+            self.stats["refreshes"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            return
+
+        if status:
+            self._last_published[key] = now
+        else:
+            self._last_published.pop(key, None)
+        self._outbox.setdefault(room_id, {})[user] = (status, ttl)
+        self._ensure_running()
+
+    def _on_control(self, room_id: str, obj: dict) -> None:
+        if obj.get("kind") == "typing":
+            for user, status, ttl in obj.get("updates", ()):
+                self._apply(room_id, user, bool(status), ttl or self._ttl)
+
+    def _apply(self, room_id: str, user: str, status: bool, ttl: float) -> bool:
+        """Update state; returns True if the user started or stopped typing"""
+        users = self._rooms.get(room_id)
+        if status:
+            if users is None:
+                users = self._rooms[room_id] = {}
+            started = user not in users
+            users[user] = asyncio.get_running_loop().time() + ttl
+            if started:
+                self._mark_dirty(room_id)
+            return started
+
+        if users is None or user not in users:
+            return False
+        del users[user]
+        if not users:
+            del self._rooms[room_id]
+        self._mark_dirty(room_id)
+        return True
+
+    def _mark_dirty(self, room_id: str):
+        self._dirty.add(room_id)
+        self._ensure_running()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """Expire stale typers, publish updates and send merged frames; exits once nobody is typing"""
+        try:
+            while self._rooms or self._dirty or self._outbox:
+                await asyncio.sleep(self._interval)
+                self._expire(asyncio.get_running_loop().time())
+                outbox, self._outbox = self._outbox, {}
+                for room_id, updates in outbox.items():
+                    self._manager.publish_control(
+                        {"kind": "typing", "updates": [[user, status, ttl] for user, (status, ttl) in updates.items()]},
+                        room_id,
+                    )
+                dirty, self._dirty = self._dirty, set()
+                for room_id in dirty:
+                    users = sorted(self._rooms.get(room_id, ()))
+                    self._manager.broadcast_local_json({"type": "typing", "users": users}, room_id)
+                    self.stats["frames"] += 1
+        except asyncio.CancelledError:
+            pass
+
+    def _expire(self, now: float):
+        for room_id, users in list(self._rooms.items()):
+            expired = [user for user, expires_at in users.items() if expires_at <= now]
+            for user in expired:
+                del users[user]
+                self._last_published.pop((room_id, user), None)
+            if expired:
+                self._dirty.add(room_id)
+            if not users:
+                del self._rooms[room_id]
+
+    def typing_users(self, room_id: str):
+        return sorted(self._rooms.get(room_id, ()))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass